@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from main.retention import RETAINED_TABLES, archive_old_records, ensure_log_partitions
+import logging
+
+logger = logging.getLogger('custom')
+
+class Command(BaseCommand):
+    help = ('Archives Log, SalesLog and Notification rows older than their retention age into compressed monthly '
+            'files and deletes them in batches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=list(RETAINED_TABLES), default=[],
+                            help='Only archive the named table (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=settings.RECORD_RETENTION_BATCH_SIZE,
+                            help='Rows deleted per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        retention_days = {
+            name: days for name, days in settings.RECORD_RETENTION_DAYS.items()
+            if not options['only'] or name in options['only']
+        }
+
+        if settings.LOG_PARTITIONING and not options['dry_run']:
+            try:
+                added = ensure_log_partitions()
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+            if added:
+                self.stdout.write(self.style.SUCCESS(f"Added Log partitions: {', '.join(added)}"))
+
+        total = 0
+        try:
+            for name, month, archived, deleted in archive_old_records(retention_days, options['batch_size'], options['dry_run']):
+                total += deleted
+                if options['dry_run']:
+                    self.stdout.write(f'{name} {month:%Y-%m}: {archived} rows would be archived')
+                else:
+                    logger.info(f"Archived {archived} {name} rows of {month:%Y-%m} and deleted {deleted}.")
+                    self.stdout.write(self.style.SUCCESS(f'{name} {month:%Y-%m}: archived {archived} rows, deleted {deleted}'))
+        except Exception as e:
+            logger.error(f"Error archiving old records: {e}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} rows deleted.'))
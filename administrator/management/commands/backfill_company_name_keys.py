@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from main.models import Lead
+from main.utils import company_name_key
+from ai_agent.models import GlobalOrganization
+import logging
+
+logger = logging.getLogger('custom')
+
+MODELS = {'lead': Lead, 'global_organization': GlobalOrganization}
+
+class Command(BaseCommand):
+    help = 'Fills name_key of Leads and GlobalOrganizations that have none, oldest rows first so they keep the key of a shared name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=MODELS, help='Only backfill one of the tables')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows read and updated per batch')
+        parser.add_argument('--rekey', action='store_true', help='Clear the keys already set first, after company_name_key changed')
+
+    def handle(self, *args, **options):
+        models = [MODELS[options['only']]] if options['only'] else MODELS.values()
+
+        for model in models:
+            try:
+                if options['rekey']:
+                    cleared = self.clear_keys(model, options['batch_size'])
+                    self.stdout.write(f'{model.__name__}: cleared {cleared} name keys.')
+                filled, shared = self.backfill(model, options['batch_size'])
+            except Exception as e:
+                logger.error(f"Error backfilling {model.__name__} name keys: {e}")
+                raise
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: set {filled} name keys, {shared} rows share a key with an older row and keep none.'
+            ))
+
+    def clear_keys(self, model, batch_size):
+        cleared = 0
+        while True:
+            ids = list(model.objects.filter(name_key__isnull=False).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return cleared
+            cleared += model.objects.filter(id__in=ids).update(name_key=None)
+
+    def backfill(self, model, batch_size):
+        filled = shared = 0
+        last_id = 0
+
+        while True:
+            batch = list(model.objects.filter(name_key__isnull=True, id__gt=last_id).order_by('id').only('id', 'name')[:batch_size])
+            if not batch:
+                return filled, shared
+            last_id = batch[-1].id
+
+            keys = {row.id: company_name_key(row.name) for row in batch}
+            taken = set(model.objects.filter(name_key__in={key for key in keys.values() if key}).values_list('name_key', flat=True))
+
+            updates = []
+            for row in batch:
+                key = keys[row.id]
+                if not key:
+                    continue
+                if key in taken:
+                    shared += 1
+                    continue
+                row.name_key = key
+                taken.add(key)
+                updates.append(row)
+
+            model.objects.bulk_update(updates, ['name_key'])
+            filled += len(updates)
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from main.models import (LeadTerminationCode, LeadTerminationHistory, LeadPhoneNumbers, LeadsColors, Log,
+                         Notification, SalesLog, SalesShow, TerminationCode)
+from main.utils import phone_number_lookup
+
+
+def hot_queries():
+    """
+    The query shapes behind the dashboards, listings and scheduled jobs that run all day. The filter
+    values are placeholders, EXPLAIN only cares about the shape. Add new hot queries here.
+    """
+    now = timezone.now()
+    month_ago = now - timedelta(days=30)
+
+    return {
+        'dashboard_termination_counts': LeadTerminationCode.objects.filter(
+            user_id=0, flag__name__in=['PR', 'CB'], entry_date__range=(month_ago, now)
+        ),
+        'hourly_callbacks': LeadTerminationCode.objects.filter(
+            CB_date__range=(now, now + timedelta(hours=1)),
+            flag__in=TerminationCode.objects.filter(name__in=['CB', 'PR'])
+        ),
+        'agent_done_shows': SalesShow.objects.filter(Agent_id=0, is_done=True, is_recycled=False, is_archived=False),
+        'unassigned_shows': SalesShow.objects.filter(
+            label='EHUB', Agent__isnull=True, is_archived=False, is_x=False, is_reassigned=False
+        ).order_by('-id')[:60],
+        'unread_notifications': Notification.objects.filter(receiver_id=0, read=False),
+        'notifications_list': Notification.objects.filter(receiver_id=0).order_by('-created_at', '-id')[:20],
+        'sheet_phone_numbers': LeadPhoneNumbers.objects.filter(sheet_id=0, lead_id__in=[0]),
+        'phone_number_search': LeadPhoneNumbers.objects.filter(phone_number_lookup('5551234')),
+        'red_blue_leads': LeadsColors.objects.filter(sheet_id=0, lead_id=0, color__in=['red', 'blue']),
+        'lead_termination_history': LeadTerminationHistory.objects.filter(
+            lead_id=0, termination_code__name__in=['show', 'CD']
+        ),
+        'logs_list': Log.objects.order_by('-date', '-id')[:30],
+        'sales_logs_list': SalesLog.objects.filter(user__in=[0]).order_by('-id')[:30],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN for every registered hot query and fails if any of them fully scans a large table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='Full scans of tables with fewer rows than this are allowed')
+        parser.add_argument('--only', action='append', default=[], help='Only check the named query (repeatable)')
+
+    def handle(self, *args, **options):
+        queries = hot_queries()
+
+        unknown = set(options['only']) - set(queries)
+        if unknown:
+            raise CommandError(f"Unknown hot queries: {', '.join(sorted(unknown))}. Known: {', '.join(queries)}")
+
+        failures = []
+        for name, queryset in queries.items():
+            if options['only'] and name not in options['only']:
+                continue
+
+            connection = connections[queryset.db]
+            full_scans = []
+            for table, estimated_rows, plan_line in self.explain(connection, queryset):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'    {plan_line}')
+                if table is None:
+                    continue
+                table_rows = self.table_rows(connection, table, estimated_rows)
+                if table_rows >= options['min_rows']:
+                    full_scans.append(f'{table} (~{table_rows} rows)')
+
+            if full_scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"{name}: full scan of {', '.join(full_scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} do full table scans: {', '.join(failures)}")
+
+        self.stdout.write(self.style.SUCCESS('No hot query does a full scan of a large table.'))
+
+    def explain(self, connection, queryset):
+        """Yields (fully scanned table or None, estimated rows, printable plan line) per plan step."""
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                columns = [col[0].lower() for col in cursor.description]
+                for row in cursor.fetchall():
+                    step = dict(zip(columns, row))
+                    full_scan = (step.get('type') or '').upper() == 'ALL'
+                    yield (step['table'] if full_scan else None, step.get('rows') or 0,
+                           f"{step['table']}: type={step.get('type')} key={step.get('key')} rows={step.get('rows')}")
+
+            elif connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    words = detail.split()
+                    # "SCAN table" without an index is a full scan, "SEARCH" and "SCAN ... USING INDEX" are not
+                    full_scan = len(words) >= 2 and words[0] == 'SCAN' and 'USING' not in words
+                    yield (words[1] if full_scan else None, 0, detail)
+
+            else:
+                raise CommandError(f'EXPLAIN parsing is not supported for {connection.vendor}')
+
+    def table_rows(self, connection, table, estimated_rows):
+        """Row count of a scanned table, from the table statistics where possible."""
+        if table not in connection.introspection.table_names():
+            # Derived tables and aliases, fall back to the optimizer's estimate
+            return estimated_rows
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [table]
+                )
+                row = cursor.fetchone()
+                return (row[0] or 0) if row else estimated_rows
+
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from ai_agent.gemini import client_pool_stats, STATS_KEY
+from ai_agent.progress import get_redis
+import logging
+
+logger = logging.getLogger('custom')
+
+class Command(BaseCommand):
+    help = 'Shows how many Gemini requests reused a pooled HTTP connection, over all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting again after showing the stats')
+
+    def handle(self, *args, **options):
+        try:
+            stats = client_pool_stats()
+            if options['reset']:
+                get_redis().delete(STATS_KEY)
+        except Exception as e:
+            logger.error(f"Error reading Gemini client stats: {e}")
+            raise
+
+        reuse_rate = f"{stats['reuse_rate']:.1%}" if stats['reuse_rate'] is not None else 'n/a'
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['requests']} Gemini requests, {stats['connections']} new connections, {reuse_rate} reused a connection."
+        ))
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Notification
+
+
+USERNAME_PREFIX = 'loadtest_ws_'
+MESSAGE_PREFIX = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = ('Opens many notification websockets against a running ASGI server, sends notifications between them '
+            'and reports delivery latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://127.0.0.1:8000/ws/notifications/', help='Notifications websocket URL')
+        parser.add_argument('--sockets', type=int, default=2000, help='Number of sockets (one synthetic user each)')
+        parser.add_argument('--messages', type=int, default=3, help='Notifications sent by every socket')
+        parser.add_argument('--connect-concurrency', type=int, default=200, help='Sockets opened at the same time')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for deliveries')
+        parser.add_argument('--keep-users', action='store_true', help='Keep the synthetic users and sessions afterwards')
+
+    def handle(self, *args, **options):
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            raise CommandError('The websockets package is required to run the load test.')
+
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        self.session_keys = []
+
+        users = self.prepare_users(options['sockets'])
+        cookies = {user.id: self.session_cookie(user) for user in users}
+
+        try:
+            report = asyncio.run(self.run(options, cookies))
+        finally:
+            # Notifications are flushed by the server shortly after delivery
+            Notification.objects.filter(sender__username__startswith=USERNAME_PREFIX,
+                                        message__startswith=MESSAGE_PREFIX).delete()
+            if not options['keep_users']:
+                for session_key in self.session_keys:
+                    self.session_store(session_key).delete()
+                User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        connected, failed, latencies, expected = report
+        self.stdout.write(f'Sockets: {connected} connected, {failed} failed')
+        self.stdout.write(f'Deliveries: {len(latencies)} of {expected}')
+
+        if latencies:
+            latencies.sort()
+            self.stdout.write(self.style.SUCCESS(
+                f'Latency: p50 {self.percentile(latencies, 50):.1f} ms, p95 {self.percentile(latencies, 95):.1f} ms, '
+                f'p99 {self.percentile(latencies, 99):.1f} ms, max {latencies[-1]:.1f} ms, '
+                f'mean {statistics.mean(latencies):.1f} ms'
+            ))
+
+        if len(latencies) < expected:
+            raise CommandError(f'{expected - len(latencies)} notifications were not delivered within {options["timeout"]} s.')
+
+    async def run(self, options, cookies):
+        import websockets
+
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(user_id):
+            async with semaphore:
+                return user_id, await websockets.connect(
+                    options['url'], additional_headers={'Cookie': cookies[user_id]}, max_queue=None
+                )
+
+        results = await asyncio.gather(*(connect(user_id) for user_id in cookies), return_exceptions=True)
+        sockets = [result for result in results if not isinstance(result, Exception)]
+        failed = len(results) - len(sockets)
+        if not sockets:
+            return 0, failed, [], 0
+
+        latencies = []
+        expected = len(sockets) * options['messages']
+        all_delivered = asyncio.Event()
+
+        async def listen(ws):
+            try:
+                async for raw in ws:
+                    message = json.loads(raw)['message']
+                    if message.startswith(MESSAGE_PREFIX):
+                        latencies.append((time.perf_counter() - float(message.split()[1])) * 1000)
+                        if len(latencies) >= expected:
+                            all_delivered.set()
+            except websockets.ConnectionClosed:
+                pass
+
+        listeners = [asyncio.ensure_future(listen(ws)) for _, ws in sockets]
+
+        # Every socket notifies the next user in the ring, so each one receives exactly `messages` notifications
+        for _ in range(options['messages']):
+            await asyncio.gather(*(
+                ws.send(json.dumps({
+                    'receiver_id': sockets[(i + 1) % len(sockets)][0],
+                    'message': f'{MESSAGE_PREFIX} {time.perf_counter()}',
+                    'id': 0,
+                    'read': False,
+                    'state': 'INFO',
+                }))
+                for i, (_, ws) in enumerate(sockets)
+            ))
+
+        try:
+            await asyncio.wait_for(all_delivered.wait(), options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+
+        await asyncio.gather(*(ws.close() for _, ws in sockets), return_exceptions=True)
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+        return len(sockets), failed, latencies, expected
+
+    def prepare_users(self, count):
+        existing = set(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}') for i in range(count) if f'{USERNAME_PREFIX}{i}' not in existing
+        ], batch_size=1000)
+
+        # MySQL does not return primary keys from bulk inserts, so read the users back
+        users = list(User.objects.filter(username__in=[f'{USERNAME_PREFIX}{i}' for i in range(count)]))
+        self.stdout.write(self.style.NOTICE(f'Prepared {len(users)} synthetic users.'))
+        return users
+
+    def session_cookie(self, user):
+        session = self.session_store()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.session_keys.append(session.session_key)
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    @staticmethod
+    def percentile(sorted_values, percent):
+        index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from ai_agent.enrichment_cache import purge_expired
+import logging
+
+logger = logging.getLogger('custom')
+
+class Command(BaseCommand):
+    help = 'Deletes expired entries of the AI enrichment cache'
+
+    def handle(self, *args, **options):
+        try:
+            deleted = purge_expired()
+        except Exception as e:
+            logger.error(f"Error purging the enrichment cache: {e}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired enrichment cache entries.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from main.utils import reconcile_unread_counts
+import logging
+
+logger = logging.getLogger('custom')
+
+class Command(BaseCommand):
+    help = 'Resets the cached unread notification counters from the database to fix any drift'
+
+    def handle(self, *args, **options):
+        try:
+            drifted = reconcile_unread_counts()
+        except Exception as e:
+            logger.error(f"Error reconciling unread notification counts: {e}")
+            raise
+
+        if drifted:
+            logger.info(f"Reconciled {drifted} unread notification counters.")
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread notification counters, {drifted} were out of date.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from main.activity import track_inactivity
+import logging
+
+logger = logging.getLogger('custom')
+
+class Command(BaseCommand):
+    help = 'Turns gaps in the activity heartbeats into inactivity intervals'
+
+    def handle(self, *args, **options):
+        try:
+            opened, closed = track_inactivity()
+        except Exception as e:
+            logger.error(f"Error tracking inactivity: {e}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(f'Opened {opened} and closed {closed} inactivity intervals.'))
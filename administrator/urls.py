@@ -20,6 +20,8 @@ from .views import (
     done_x_sheets,
     archive_sheet_bulk,
     download_generated_mail,
+    record_archives,
+    download_record_archive,
 )
 
 app_name="administrator"
@@ -28,6 +30,8 @@ urlpatterns = [
     path('users/add-user/', add_user, name='add-user'),
     path('users/manage-users/', manage_users, name='manage-users'),
     path('view-logs/', view_logs, name='view-logs'),
+    path('record-archives/', record_archives, name='record-archives'),
+    path('record-archives/<int:archive_id>/download/', download_record_archive, name='download-record-archive'),
     path('users/delete-user/<int:user_id>/', delete_user, name='delete-user'),
     path('users/edit-user/<int:user_id>/', edit_user, name='edit-user'),
     path('manage-sheets/', manage_sheets, name='manage-sheets'),
@@ -4,10 +4,11 @@ from django.contrib.auth.models import Group, User
 from django.contrib import messages
 from ai_agent.utils import *
 from main.models import (LeadEmails, LeadPhoneNumbers, LeadContactNames, Sheet, ReadyShow, Log, LeadTerminationHistory, FilterWords, Referral,
-                        LeadTerminationCode, SalesShow, IncomingsCount, LeadsColors)
+                        LeadTerminationCode, SalesShow, IncomingsCount, LeadsColors, RecordArchive)
 from main.custom_decorators import is_in_group
 from .forms import UserCreationFormWithRole, UserUpdateForm
 from django.core.paginator import Paginator
+from main.pagination import KeysetPaginator
 from django.contrib.auth.decorators import user_passes_test
 from django.utils import timezone
 from django.db import models 
@@ -167,9 +168,9 @@ def view_logs(request):
     if query:
         logs = logs.filter(Q(message__icontains=query))
 
-    paginator = Paginator(logs, 30)
-    page_num = request.GET.get('page')
-    page_obj = paginator.get_page(page_num)
+    # Log never shrinks, so walk it by (date, id) instead of OFFSET and only estimate the total
+    paginator = KeysetPaginator(logs, 30, ordering=('-date', '-id'), count='approximate')
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'logs': page_obj,
@@ -179,6 +180,32 @@ def view_logs(request):
     return render(request, "administrator/view_logs.html", context)
 
 
+@user_passes_test(lambda user: is_in_group(user, "administrator"))
+def record_archives(request):
+    """Monthly exports of the logs and notifications removed by the archive_old_records command."""
+    archives = RecordArchive.objects.order_by('-month', 'table', '-id')
+    table = request.GET.get('table', '')
+
+    if table:
+        archives = archives.filter(table=table)
+
+    paginator = Paginator(archives, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    return render(request, "administrator/record_archives.html", {
+        'archives': page_obj,
+        'table': table,
+    })
+
+
+@user_passes_test(lambda user: is_in_group(user, "administrator"))
+def download_record_archive(request, archive_id):
+    from django.http import FileResponse
+
+    archive = get_object_or_404(RecordArchive, id=archive_id)
+    return FileResponse(archive.file.open('rb'), as_attachment=True, filename=os.path.basename(archive.file.name))
+
+
 @user_passes_test(lambda user: is_in_group(user, "administrator"))
 def manage_sheets(request):
     sheets = Sheet.objects.filter(is_approved=True, is_done=False, is_archived=False, is_x=False).order_by("-id")
@@ -633,9 +660,8 @@ def archived_sheets(request):
         archived_sheets = archived_sheets.filter(name__icontains=query)  # Filter by sheet name
 
     # Pagination
-    paginator = Paginator(archived_sheets, 60)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(archived_sheets, 60, count='approximate')
+    page_obj = paginator.get_page(request.GET)
 
     return render(request, 'administrator/archived_sheets.html', {
         'page_obj': page_obj,
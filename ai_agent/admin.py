@@ -6,3 +6,4 @@ admin.site.register(GlobalPhoneNumbers)
 admin.site.register(GlobalEmails)
 admin.site.register(GlobalContactNames)
 admin.site.register(Category)
+admin.site.register(EnrichmentCache)
@@ -0,0 +1,24 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from .progress import progress_group
+
+
+class EnrichmentProgressConsumer(AsyncWebsocketConsumer):
+    """Streams the progress events of the connected user's enrichment tasks (see ai_agent.progress)."""
+
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = progress_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def enrichment_progress(self, event):
+        await self.send(text_data=json.dumps({key: value for key, value in event.items() if key != 'type'}))
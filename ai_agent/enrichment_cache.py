@@ -0,0 +1,235 @@
+"""
+Cache of parsed AI results (EnrichmentCache), consulted before every AI round of an enrichment.
+
+Entries are keyed by the normalized company name, the search context (show and category) and the round,
+since the retry rounds only run for companies the earlier rounds found no phone for. Results that found
+something are kept for AI_AGENT_ENRICHMENT_CACHE_DAYS, results that found nothing for the shorter
+AI_AGENT_ENRICHMENT_NEGATIVE_CACHE_DAYS. Failed batches and the placeholders of companies the AI left out of
+its answer (marked NOT_RETURNED) are never cached.
+
+Lookups in flight are claimed in Redis under the same key (single flight): a task only sends the companies it
+could claim, then waits for the ones another task is sending and takes their results from the cache once that
+task has stored them. Claims expire after AI_AGENT_IN_FLIGHT_CLAIM_SECONDS and are extended by a background
+thread for as long as their batches run. The wait is bounded by a share (AI_AGENT_IN_FLIGHT_WAIT_FRACTION) of the
+Celery soft time limit, so a waiting chunk still has the time to send its own batches. Companies whose claim is
+dropped without a result (a failed batch) or that are still in flight when the wait is over are sent after all.
+"""
+import copy
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EnrichmentCache, EnrichmentTask, normalize_company_name
+from .progress import get_redis
+
+logger = logging.getLogger('custom')
+
+POSITIVE_TTL = timedelta(days=getattr(settings, 'AI_AGENT_ENRICHMENT_CACHE_DAYS', 30))
+NEGATIVE_TTL = timedelta(days=getattr(settings, 'AI_AGENT_ENRICHMENT_NEGATIVE_CACHE_DAYS', 3))
+CLAIM_SECONDS = getattr(settings, 'AI_AGENT_IN_FLIGHT_CLAIM_SECONDS', 60)
+WAIT_SECONDS = getattr(settings, 'CELERY_TASK_SOFT_TIME_LIMIT', 300) * getattr(settings, 'AI_AGENT_IN_FLIGHT_WAIT_FRACTION', 0.2)
+IN_FLIGHT_POLL_SECONDS = 2
+
+# Set on the empty result of a company missing from the AI's answer
+NOT_RETURNED = 'not_returned'
+
+# Deletes the claims that are still held by the releasing task, an expired claim may already belong to another one
+RELEASE_CLAIMS = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+"""
+
+# Extends the claims that are still held by the task
+EXTEND_CLAIMS = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('EXPIRE', key, ARGV[2])
+    end
+end
+"""
+
+_release_claims = None
+_extend_claims = None
+
+
+def cache_key(company_name, show_name, category_name, retry_round):
+    parts = [normalize_company_name(company_name), normalize_company_name(show_name), normalize_company_name(category_name), str(retry_round)]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def is_found(result, retry_round):
+    """The first round found something with any contact info, the retry rounds only with a phone number."""
+    if retry_round > 1:
+        return bool(str(result.get('phone') or '').strip())
+
+    key_personnel = result.get('key_personnel') or {}
+    return any(str(value or '').strip() for value in (result.get('phone'), result.get('email'), key_personnel.get('phone'), key_personnel.get('email')))
+
+
+def get_cached_results(company_names, show_name, category_name, retry_round):
+    """Unexpired cached results as {company name: result}, each renamed to the name it was requested as."""
+    keys = {cache_key(name, show_name, category_name, retry_round): name for name in company_names}
+    entries = EnrichmentCache.objects.filter(key__in=keys, expires_at__gt=timezone.now()).values_list('key', 'result')
+
+    cached = {}
+    for key, result in entries:
+        result = copy.deepcopy(result)
+        result['company_name'] = keys[key]
+        cached[keys[key]] = result
+    return cached
+
+
+def store_results(results, show_name, category_name, retry_round):
+    """Caches the parsed results of one AI round, replacing older entries of the same companies, except the NOT_RETURNED ones."""
+    now = timezone.now()
+    entries = {}
+    for result in results:
+        company_name = result.get('company_name')
+        if not company_name or result.get(NOT_RETURNED):
+            continue
+        found = is_found(result, retry_round)
+        key = cache_key(company_name, show_name, category_name, retry_round)
+        entries[key] = EnrichmentCache(
+            key=key,
+            company_name=company_name[:255],
+            show_name=(show_name or '')[:255],
+            category_name=(category_name or '')[:255],
+            retry_round=retry_round,
+            result=result,
+            found=found,
+            expires_at=now + (POSITIVE_TTL if found else NEGATIVE_TTL),
+        )
+
+    if entries:
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target, the other backends need one
+        features = connections[router.db_for_write(EnrichmentCache)].features
+        EnrichmentCache.objects.bulk_create(
+            entries.values(),
+            update_conflicts=True,
+            unique_fields=['key'] if features.supports_update_conflicts_with_target else None,
+            update_fields=['company_name', 'result', 'found', 'created_at', 'expires_at'],
+        )
+
+
+def in_flight_key(company_name, show_name, category_name, retry_round):
+    return f'enrichment_in_flight:{cache_key(company_name, show_name, category_name, retry_round)}'
+
+
+def claim_lookups(company_names, owner, show_name, category_name, retry_round):
+    """
+    Claims the lookup of every company no other task is looking up right now
+    Returns: (claimed companies, companies in flight elsewhere). Without Redis every company counts as claimed.
+    """
+    try:
+        with get_redis().pipeline() as pipe:
+            for name in company_names:
+                pipe.set(in_flight_key(name, show_name, category_name, retry_round), owner, nx=True, ex=CLAIM_SECONDS)
+            acquired = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"In-flight claims unavailable, sending all companies: {e}")
+        return list(company_names), []
+
+    claimed = [name for name, ok in zip(company_names, acquired) if ok]
+    in_flight = [name for name, ok in zip(company_names, acquired) if not ok]
+    return claimed, in_flight
+
+
+def release_lookups(company_names, owner, show_name, category_name, retry_round):
+    """Releases the owner's claims, after its results were stored or its batches failed."""
+    global _release_claims
+    if not company_names:
+        return
+
+    try:
+        if _release_claims is None:
+            _release_claims = get_redis().register_script(RELEASE_CLAIMS)
+        _release_claims(keys=[in_flight_key(name, show_name, category_name, retry_round) for name in company_names], args=[owner])
+    except redis.RedisError as e:
+        # The claims expire on their own
+        logger.warning(f"Could not release in-flight claims: {e}")
+
+
+def keep_claims(company_names, owner, show_name, category_name, retry_round, stop):
+    """Extends the owner's claims every third of their lifetime until `stop` is set."""
+    global _extend_claims
+    keys = [in_flight_key(name, show_name, category_name, retry_round) for name in company_names]
+
+    while not stop.wait(CLAIM_SECONDS / 3):
+        try:
+            if _extend_claims is None:
+                _extend_claims = get_redis().register_script(EXTEND_CLAIMS)
+            _extend_claims(keys=keys, args=[owner, CLAIM_SECONDS])
+        except redis.RedisError as e:
+            logger.warning(f"Could not extend in-flight claims: {e}")
+
+
+@contextmanager
+def claimed_lookups(company_names, owner, show_name, category_name, retry_round):
+    """
+    Claims the companies (see claim_lookups) and yields (claimed, in flight elsewhere). The claims are kept alive
+    while the block runs, however long its batches take, and released when it exits.
+    """
+    claimed, in_flight = claim_lookups(company_names, owner, show_name, category_name, retry_round)
+    stop = threading.Event()
+    if claimed:
+        threading.Thread(target=keep_claims, args=(claimed, owner, show_name, category_name, retry_round, stop), daemon=True).start()
+
+    try:
+        yield claimed, in_flight
+    finally:
+        stop.set()
+        release_lookups(claimed, owner, show_name, category_name, retry_round)
+
+
+def wait_for_lookups(company_names, show_name, category_name, retry_round):
+    """
+    Waits for the lookups other tasks have in flight and returns their cached results as {company name: result}.
+    Companies missing from it were released without a result or are still in flight after WAIT_SECONDS.
+    """
+    results = {}
+    pending = list(company_names)
+    deadline = time.monotonic() + WAIT_SECONDS
+
+    while pending:
+        try:
+            with get_redis().pipeline() as pipe:
+                for name in pending:
+                    pipe.exists(in_flight_key(name, show_name, category_name, retry_round))
+                held = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"In-flight claims unavailable, no longer waiting: {e}")
+            held = [False] * len(pending)
+
+        # Read after checking the claims: a claim that was gone already had its results stored
+        results.update(get_cached_results(pending, show_name, category_name, retry_round))
+        pending = [name for name, is_held in zip(pending, held) if is_held and name not in results]
+
+        if pending and time.monotonic() < deadline:
+            time.sleep(IN_FLIGHT_POLL_SECONDS)
+        else:
+            break
+
+    return results
+
+
+def record_cache_use(task, hits, misses):
+    if hits or misses:
+        EnrichmentTask.objects.filter(task_id=task.task_id).update(cache_hits=F('cache_hits') + hits, cache_misses=F('cache_misses') + misses)
+
+
+def purge_expired():
+    """Deletes expired entries, returns how many."""
+    deleted, _ = EnrichmentCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
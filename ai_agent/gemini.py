@@ -0,0 +1,209 @@
+"""
+Scheduling of Gemini requests.
+
+The batches of one enrichment chunk are sent concurrently from a small thread pool instead of one after the
+other. Every request first takes a token from a Redis token bucket shared by all workers, which holds the
+account-wide rate to AI_AGENT_GEMINI_REQUESTS_PER_MINUTE. Requests rejected with 429 or a 5xx, and requests
+that fail on the network, are retried with exponential backoff.
+
+Clients are pooled per process and API key, so their HTTP connections are kept alive and reused across
+batches and tasks. A forked worker child (Celery recycles them after max_tasks_per_child) starts with an empty
+pool instead of sharing its parent's sockets. How many requests reuse a connection is counted in Redis for all
+workers, see client_pool_stats().
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.genai as genai
+import httpx
+import redis
+from django.conf import settings
+from google.genai import errors, types
+
+from .progress import get_redis
+
+logger = logging.getLogger('custom')
+
+REQUESTS_PER_MINUTE = getattr(settings, 'AI_AGENT_GEMINI_REQUESTS_PER_MINUTE', 60)
+CONCURRENCY = getattr(settings, 'AI_AGENT_GEMINI_CONCURRENCY', 4)
+MAX_ATTEMPTS = getattr(settings, 'AI_AGENT_GEMINI_MAX_ATTEMPTS', 4)
+BACKOFF_SECONDS = getattr(settings, 'AI_AGENT_GEMINI_BACKOFF_SECONDS', 2.0)
+MAX_BACKOFF_SECONDS = 60
+POOL_SIZE = getattr(settings, 'AI_AGENT_GEMINI_POOL_SIZE', 10)
+KEEPALIVE_SECONDS = getattr(settings, 'AI_AGENT_GEMINI_KEEPALIVE_SECONDS', 60)
+
+BUCKET_KEY = 'gemini_rate_bucket'
+STATS_KEY = 'gemini_client_stats'
+
+# Refills the bucket for the time since its last use, then takes a token.
+# Returns 0 when a token was taken, otherwise the seconds until one is available.
+TAKE_TOKEN = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+_take_token = None
+
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+class ConnectionTrace:
+    """httpcore trace hook of one request, notes whether it had to open a new connection."""
+
+    def __init__(self):
+        self.connected = False
+
+    def __call__(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            self.connected = True
+
+
+def trace_request(request):
+    request.extensions['trace'] = ConnectionTrace()
+
+
+def count_request(response):
+    trace = response.request.extensions.get('trace')
+    try:
+        with get_redis().pipeline() as pipe:
+            pipe.hincrby(STATS_KEY, 'requests', 1)
+            pipe.hincrby(STATS_KEY, 'connections', int(getattr(trace, 'connected', False)))
+            pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def get_client(api_key):
+    """The process's shared client for the API key, created on first use."""
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            # Forked from a process that had clients: their sockets belong to the parent, start over
+            _clients.clear()
+            _clients_pid = os.getpid()
+
+        client = _clients.get(api_key)
+        if client is None:
+            client = genai.Client(api_key=api_key, http_options=types.HttpOptions(client_args={
+                'limits': httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE, keepalive_expiry=KEEPALIVE_SECONDS),
+                'event_hooks': {'request': [trace_request], 'response': [count_request]},
+            }))
+            _clients[api_key] = client
+        return client
+
+
+def close_client_pool(**kwargs):
+    """Closes this process's clients and their connections (worker shutdown)."""
+    with _clients_lock:
+        clients = list(_clients.values()) if _clients_pid == os.getpid() else []
+        _clients.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Gemini client: {e}")
+
+
+def reset_client_pool(**kwargs):
+    """Drops the clients inherited from the parent without closing them (new worker child)."""
+    global _clients_pid
+    with _clients_lock:
+        _clients.clear()
+        _clients_pid = os.getpid()
+
+
+def client_pool_stats():
+    """Requests, new connections and the share of requests that reused a pooled connection, over all workers."""
+    stats = get_redis().hgetall(STATS_KEY)
+    requests = int(stats.get('requests', 0))
+    connections = int(stats.get('connections', 0))
+    return {
+        'requests': requests,
+        'connections': connections,
+        'reuse_rate': (requests - connections) / requests if requests else None,
+    }
+
+
+def acquire_token():
+    """Blocks until the shared bucket grants a request. Without Redis each process paces itself at the full rate instead."""
+    global _take_token
+    rate = REQUESTS_PER_MINUTE / 60
+
+    while True:
+        try:
+            if _take_token is None:
+                _take_token = get_redis().register_script(TAKE_TOKEN)
+            wait = float(_take_token(keys=[BUCKET_KEY], args=[REQUESTS_PER_MINUTE, rate]))
+        except redis.RedisError as e:
+            logger.warning(f"Gemini rate bucket unavailable, pacing locally: {e}")
+            time.sleep(1 / rate)
+            return
+
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+def is_retryable(error):
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff(attempt):
+    """Exponential backoff with full jitter, so workers rejected together do not come back together."""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+
+
+def generate_content(client, **kwargs):
+    """client.models.generate_content under the shared rate limit, retried with backoff on 429, 5xx and network errors."""
+    for attempt in range(MAX_ATTEMPTS):
+        acquire_token()
+        try:
+            return client.models.generate_content(**kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff(attempt)
+            logger.warning(f"Gemini request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_concurrently(function, calls):
+    """
+    Runs function(*args) for every args tuple of `calls` on the thread pool and returns the results in order.
+    The calls only do HTTP, anything touching the database stays in the calling thread.
+    """
+    if len(calls) <= 1:
+        return [function(*args) for args in calls]
+
+    executor = ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(calls)))
+    try:
+        futures = [executor.submit(function, *args) for args in calls]
+        return [future.result() for future in futures]
+    finally:
+        # On a soft time limit the pending calls are dropped instead of being waited for
+        executor.shutdown(wait=False, cancel_futures=True)
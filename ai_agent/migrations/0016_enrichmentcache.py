@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_agent', '0015_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrichmentCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('company_name', models.CharField(max_length=255)),
+                ('show_name', models.CharField(blank=True, default='', max_length=255)),
+                ('category_name', models.CharField(blank=True, default='', max_length=255)),
+                ('retry_round', models.PositiveSmallIntegerField(default=1)),
+                ('result', models.JSONField()),
+                ('found', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='enrichmenttask',
+            name='cache_hits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrichmenttask',
+            name='cache_misses',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_agent', '0016_enrichmentcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='globalorganization',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_agent', '0017_globalorganization_name_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrichmentChunkResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('results', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunk_results', to='ai_agent.enrichmenttask')),
+            ],
+            options={
+                'unique_together': {('task', 'chunk_index')},
+            },
+        ),
+    ]
@@ -3,6 +3,11 @@ from django.conf import settings
 import os
 
 
+def normalize_company_name(name):
+    """Case and whitespace insensitive form of a company name, used for lookup keys"""
+    return ' '.join(str(name or '').lower().split())
+
+
 ################################################################################################################################
 ###################################### Global Database For multiple clients to enrich ##########################################
 ################################################################################################################################
@@ -14,6 +19,11 @@ class GlobalOrganization(models.Model):
 
     name = models.CharField(max_length=255, unique=True, db_index=True)
     primary_domain = models.CharField(max_length=255, blank=True, null=True)
+    name_key = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)  # main.utils.company_name_key, for matching name variants
+
+    def save(self, *args, **kwargs):
+        from main.utils import save_with_name_key
+        save_with_name_key(self, super().save, *args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -73,6 +83,28 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class EnrichmentCache(models.Model):
+    """
+    Parsed AI result of one company for one search context (show and category) and round, so repeated
+    requests do not pay for the same search again. Results without contact info are kept as well, for a shorter time.
+    """
+    key = models.CharField(max_length=64, unique=True)  # sha256 of the normalized name, context and round
+    company_name = models.CharField(max_length=255)
+    show_name = models.CharField(max_length=255, blank=True, default='')
+    category_name = models.CharField(max_length=255, blank=True, default='')
+    retry_round = models.PositiveSmallIntegerField(default=1)
+    result = models.JSONField()
+    found = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'ai_agent'
+
+    def __str__(self):
+        return f"{self.company_name} (round {self.retry_round})"
+
+
 class EnrichmentTask(models.Model):
     user_id = models.IntegerField(null=True)  # Store the user's ID directly
     task_id = models.CharField(max_length=255, unique=True)
@@ -87,6 +119,8 @@ class EnrichmentTask(models.Model):
     company_count = models.IntegerField(default=0)
     total_chunks = models.IntegerField(default=0)
     chunks_completed = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)    # Companies answered from the EnrichmentCache (all rounds)
+    cache_misses = models.IntegerField(default=0)  # Companies that had to be sent to the AI (all rounds)
 
     # Dynamically set owner to Django project name
     owner = models.CharField(max_length=255)
@@ -97,3 +131,21 @@ class EnrichmentTask(models.Model):
 
     def __str__(self):
         return self.task_id
+
+
+class EnrichmentChunkResult(models.Model):
+    """
+    Results of one chunk of an enrichment task, in the chunk's company order. Kept here instead of the Celery
+    result backend so the finalizer can read the chunks one at a time; the retry rounds update them in place.
+    """
+    task = models.ForeignKey(EnrichmentTask, on_delete=models.CASCADE, related_name='chunk_results')
+    chunk_index = models.PositiveIntegerField()
+    results = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'ai_agent'
+        unique_together = ('task', 'chunk_index')
+
+    def __str__(self):
+        return f"{self.task_id} chunk {self.chunk_index}"
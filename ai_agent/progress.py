@@ -0,0 +1,223 @@
+"""
+Progress of enrichment tasks.
+
+Chunks of one task run in parallel on several workers, so every task keeps its counters in its own Redis hash
+(enrichment_progress:<task_id>), updated with atomic HINCRBY, and every change is pushed to the task owner's
+browser over the channel layer. The EnrichmentTask row is written at most once every
+AI_AGENT_PROGRESS_WRITE_SECONDS per task plus once when the task finishes. When Redis is unreachable the
+counters fall back to atomic updates of the row.
+"""
+import logging
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import EnrichmentTask
+
+logger = logging.getLogger('custom')
+
+PROGRESS_TTL = 60 * 60 * 24  # seconds, longer than any enrichment task runs
+FINISHED_TTL = 60 * 60  # seconds a finished task's hash is kept for late readers
+WRITE_INTERVAL = getattr(settings, 'AI_AGENT_PROGRESS_WRITE_SECONDS', 5)
+
+# Fields of the progress hash that are only ever changed with HINCRBY
+COUNTERS = ('chunks_completed', 'companies_processed', 'batches_completed', 'retry_batches', 'requests')
+TOTALS = ('total_chunks', 'total_companies')
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.External_REDIS_URL, socket_timeout=2, decode_responses=True)
+    return _redis
+
+
+def progress_key(task_id):
+    return f'enrichment_progress:{task_id}'
+
+
+def progress_group(user_id):
+    """Channel layer group of a user's EnrichmentProgressConsumer sockets."""
+    return f'enrichment_{user_id}'
+
+
+def start_progress(task):
+    key = progress_key(task.task_id)
+    try:
+        with get_redis().pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={
+                **{counter: 0 for counter in COUNTERS},
+                'total_chunks': task.total_chunks,
+                'total_companies': task.company_count,
+                'phase': 'queued',
+            })
+            pipe.expire(key, PROGRESS_TTL)
+            pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Progress store unavailable for enrichment task {task.task_id}: {e}")
+
+
+def increment(task_id, **amounts):
+    """
+    Atomically adds to the task's counters and returns their new values, None when the hash is gone
+    (never started, expired, Redis restarted) or Redis is unreachable.
+    """
+    key = progress_key(task_id)
+    try:
+        with get_redis().pipeline() as pipe:
+            pipe.exists(key)
+            for counter, amount in amounts.items():
+                pipe.hincrby(key, counter, amount)
+            exists, *values = pipe.execute()
+
+        if not exists:
+            # The increments just created a partial hash, which would read as real progress
+            get_redis().delete(key)
+            return None
+    except redis.RedisError as e:
+        logger.warning(f"Progress store unavailable for enrichment task {task_id}: {e}")
+        return None
+
+    return dict(zip(amounts, values))
+
+
+def read_progress(task_id):
+    """The task's progress hash with its counters as integers, empty when there is none."""
+    try:
+        values = get_redis().hgetall(progress_key(task_id))
+    except redis.RedisError as e:
+        logger.warning(f"Progress store unavailable for enrichment task {task_id}: {e}")
+        return {}
+
+    for field in COUNTERS + TOTALS:
+        if field in values:
+            values[field] = int(values[field])
+    return values
+
+
+def send_progress(task, **event):
+    """Pushes a progress event to the task owner, best effort: polling still works when this fails."""
+    if task.user_id is None:
+        return
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            progress_group(task.user_id),
+            {'type': 'enrichment_progress', 'task_id': task.task_id, **event},
+        )
+    except Exception as e:
+        logger.warning(f"Could not push progress of enrichment task {task.task_id}: {e}")
+
+
+def record_request(task, retry=False):
+    """Counts one AI batch request of the task (a retry batch with `retry`), written to the row with the next progress write."""
+    if increment(task.task_id, requests=1, **{'retry_batches' if retry else 'batches_completed': 1}) is None:
+        EnrichmentTask.objects.filter(task_id=task.task_id).update(request_count=F('request_count') + 1)
+
+
+def record_phase(task, phase):
+    try:
+        get_redis().hset(progress_key(task.task_id), 'phase', phase)
+    except redis.RedisError as e:
+        logger.warning(f"Progress store unavailable for enrichment task {task.task_id}: {e}")
+    send_progress(task, status='IN_PROGRESS', phase=phase)
+
+
+def complete_chunk(task, company_count=0):
+    """Counts a finished chunk of `company_count` companies, pushes the new progress and writes it to the row if the throttle allows."""
+    counters = increment(task.task_id, chunks_completed=1, companies_processed=company_count)
+
+    if counters is None:
+        # No progress hash, fall back to counting in the database
+        EnrichmentTask.objects.filter(task_id=task.task_id).update(chunks_completed=F('chunks_completed') + 1)
+        chunks_completed = EnrichmentTask.objects.filter(task_id=task.task_id).values_list('chunks_completed', flat=True).first() or 0
+        companies_processed = None
+        force_write = True
+    else:
+        chunks_completed = counters['chunks_completed']
+        companies_processed = counters['companies_processed']
+        force_write = chunks_completed >= task.total_chunks
+
+    progress = int(chunks_completed / task.total_chunks * 100) if task.total_chunks else 0
+
+    if force_write or acquire_write_slot(task.task_id):
+        write_progress(task.task_id, chunks_completed=chunks_completed, progress=progress)
+
+    send_progress(task, status='IN_PROGRESS', phase='chunk_done', progress=progress,
+                  chunks_completed=chunks_completed, total_chunks=task.total_chunks,
+                  companies_processed=companies_processed, total_companies=task.company_count)
+
+
+def acquire_write_slot(task_id):
+    """SET NX only succeeds for the first caller in every write interval."""
+    try:
+        return bool(get_redis().set(f'{progress_key(task_id)}:write_lock', 1, nx=True, ex=WRITE_INTERVAL))
+    except redis.RedisError:
+        return True
+
+
+def write_progress(task_id, **fields):
+    requests = read_progress(task_id).get('requests')
+    if requests is not None:
+        fields['request_count'] = requests
+    if fields:
+        EnrichmentTask.objects.filter(task_id=task_id).update(**fields)
+
+
+def finish_progress(task):
+    """Writes the final counters, pushes the task's final status and lets its progress hash expire."""
+    write_progress(task.task_id)
+
+    key = progress_key(task.task_id)
+    try:
+        with get_redis().pipeline() as pipe:
+            pipe.hset(key, 'phase', 'complete')
+            pipe.expire(key, FINISHED_TTL)
+            pipe.delete(f'{key}:write_lock')
+            pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Progress store unavailable for enrichment task {task.task_id}: {e}")
+
+    event = {'status': task.status, 'progress': task.progress, 'phase': 'complete'}
+    if task.status == 'SUCCESS':
+        event['download_url'] = reverse('ai_agent:download_file', args=[task.task_id])
+    send_progress(task, **event)
+
+
+def fail_task(task):
+    """Marks a task whose chunk gave up after its retries as failed, the finalizer never runs in that case."""
+    task.status = 'FAILURE'
+    task.completed_at = timezone.now()
+    task.save(update_fields=['status', 'completed_at'])
+    finish_progress(task)
+
+
+def task_progress(task):
+    """One task's progress: its row merged with the live counters of its hash, which are ahead of the throttled row."""
+    finished = task.status in ('SUCCESS', 'FAILURE')
+    live = read_progress(task.task_id)
+
+    return {
+        'task_id': task.task_id,
+        'status': task.status,
+        'progress': task.progress,
+        'current_phase': live.get('phase', 'complete' if finished else 'queued'),
+        'total_companies': live.get('total_companies', task.company_count),
+        'companies_processed': live.get('companies_processed', task.company_count if task.status == 'SUCCESS' else None),
+        'total_chunks': live.get('total_chunks', task.total_chunks),
+        'chunks_completed': max(live.get('chunks_completed', 0), task.chunks_completed),
+        'batches_completed': live.get('batches_completed'),
+        'retry_batches': live.get('retry_batches'),
+        'request_count': max(live.get('requests', 0), task.request_count),
+        'cache_hits': task.cache_hits,
+        'cache_misses': task.cache_misses,
+        'is_complete': finished,
+    }
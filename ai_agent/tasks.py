@@ -1,10 +1,12 @@
 from celery import shared_task, group, chain
-from .utils import orchestrate_enrichment_workflow, save_excel_for_task
+from celery.signals import worker_process_init, worker_process_shutdown
+from .utils import orchestrate_enrichment_workflow, unique_company_names, save_excel_for_task, fetch_retry_results, RETRY_ROUNDS, store_chunk_results, iter_task_results, task_companies_missing_phone, apply_retry_to_chunks
 from .models import EnrichmentTask
+from .progress import start_progress, complete_chunk, finish_progress, fail_task, record_phase
+from .gemini import reset_client_pool, close_client_pool
 from django.conf import settings
 from django.utils import timezone
 import math
-from django.db.models import F
 
 # Define the size of each chunk, allowing override from settings for easier tuning
 DEFAULT_CHUNK_SIZE = 20
@@ -13,6 +15,18 @@ CHUNK_SIZE = max(
     int(getattr(settings, "AI_AGENT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
 )
 
+# Companies per retry task, the retry rounds gather the companies missing a phone from all chunks of a task
+DEFAULT_RETRY_CHUNK_SIZE = 40
+RETRY_CHUNK_SIZE = max(
+    1,
+    int(getattr(settings, "AI_AGENT_RETRY_CHUNK_SIZE", DEFAULT_RETRY_CHUNK_SIZE))
+)
+
+
+# Every worker child, including the ones that replace recycled children, starts its own Gemini client pool
+worker_process_init.connect(reset_client_pool)
+worker_process_shutdown.connect(close_client_pool)
+
 
 @shared_task(
     bind=True,
@@ -22,42 +36,107 @@ CHUNK_SIZE = max(
     retry_backoff=True,
     retry_jitter=True,
 )
-def enrich_chunk_task(self, company_names, task_id, show_name=None, category_name=None):
+def enrich_chunk_task(self, company_names, task_id, chunk_index, show_name=None, category_name=None):
     """
     Processes a single chunk of companies. This task is designed to be fault-tolerant.
     If it fails, Celery will automatically retry it with backoff.
+    The results are stored per chunk (EnrichmentChunkResult), only their count goes through the result backend.
     """
     try:
         task = EnrichmentTask.objects.get(task_id=task_id)
     except EnrichmentTask.DoesNotExist:
         # If the parent task cannot be found, fail fast but don't crash the worker repeatedly
-        return []
+        return 0
 
     # Perform the enrichment for the current chunk
-    enriched_results = orchestrate_enrichment_workflow(
-        company_names,
-        settings.GEMINI_API_KEY,
-        task,
-        show_name,
-        category_name,
+    try:
+        enriched_results = orchestrate_enrichment_workflow(
+            company_names,
+            settings.GEMINI_API_KEY,
+            task,
+            show_name,
+            category_name,
+        )
+    except Exception:
+        # Out of retries, the whole workflow fails and the finalizer will not run
+        if self.request.retries >= self.max_retries:
+            fail_task(task)
+        raise
+
+    store_chunk_results(task, chunk_index, enriched_results)
+
+    # Counted in the task's progress hash and pushed to the owner, the row is only written every few seconds
+    complete_chunk(task, len(company_names))
+
+    return len(enriched_results)
+
+@shared_task(bind=True, acks_late=True)
+def retry_stage_task(self, previous, task_id, retry_round, show_name=None, category_name=None):
+    """
+    A phone retry round of the whole task. Gathers every company still missing a phone across all stored chunks
+    into full retry chunks and runs them as a parallel group, each updating the chunks of its companies.
+    `previous` is the output of the stage before (result counts), the results themselves are read from the table.
+    """
+    try:
+        task = EnrichmentTask.objects.get(task_id=task_id)
+    except EnrichmentTask.DoesNotExist:
+        return None
+
+    companies = task_companies_missing_phone(task)
+    if not companies:
+        return None
+    record_phase(task, RETRY_ROUNDS[retry_round]['phase'])
+
+    retry_chunks = group(
+        retry_chunk_task.s(
+            [company for company, _ in companies[i:i + RETRY_CHUNK_SIZE]],
+            task_id,
+            sorted({chunk_index for _, chunk_index in companies[i:i + RETRY_CHUNK_SIZE]}),
+            retry_round,
+            show_name,
+            category_name,
+        )
+        for i in range(0, len(companies), RETRY_CHUNK_SIZE)
     )
 
-    # Atomically update the progress after the chunk is successfully processed.
-    # The F() expression creates an atomic database operation, which is safe from race conditions.
-    EnrichmentTask.objects.filter(task_id=task_id).update(chunks_completed=F('chunks_completed') + 1)
-    task.refresh_from_db()
+    # The rest of the workflow continues once every retry chunk has updated its chunks
+    return self.replace(retry_chunks)
 
-    if task.total_chunks > 0:
-        progress_percentage = int((task.chunks_completed / task.total_chunks) * 100)
-        task.progress = progress_percentage
-        task.save(update_fields=['progress'])
 
-    return enriched_results
+@shared_task(
+    bind=True,
+    acks_late=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_jitter=True,
+)
+def retry_chunk_task(self, company_names, task_id, chunk_indexes, retry_round, show_name=None, category_name=None):
+    """
+    Sends one retry chunk to the AI and merges what it found into the stored chunks (`chunk_indexes`) of its
+    companies, retried with backoff like the first pass chunks.
+    """
+    try:
+        task = EnrichmentTask.objects.get(task_id=task_id)
+    except EnrichmentTask.DoesNotExist:
+        return 0
+
+    try:
+        retry_results = fetch_retry_results(company_names, settings.GEMINI_API_KEY, task, retry_round, show_name, category_name)
+        apply_retry_to_chunks(task, chunk_indexes, retry_results, retry_round)
+    except Exception:
+        # Out of retries, the whole workflow fails and the finalizer will not run
+        if self.request.retries >= self.max_retries:
+            fail_task(task)
+        raise
+
+    return len(retry_results)
+
 
 @shared_task(bind=True, acks_late=True)
-def finalize_enrichment_task(self, results, task_id):
+def finalize_enrichment_task(self, previous, task_id):
     """
-    The final task. It collects all results, handles potential failures,
+    The final task. It reads the stored results of all chunks in order, handles potential failures,
     and generates the final Excel file.
     """
     try:
@@ -66,28 +145,26 @@ def finalize_enrichment_task(self, results, task_id):
         # Nothing to finalize if the parent record is gone
         return f"Enrichment task {task_id} no longer exists."
 
-    # Filter out any failed chunks (which may appear as None or exceptions)
-    successful_results = [
-        item
-        for sublist in (results or [])
-        if sublist and isinstance(sublist, list)
-        for item in sublist
-    ]
-
     try:
-        if not successful_results:
+        if not task.chunk_results.exists():
             raise ValueError("All enrichment chunks failed.")
 
-        excel_content = save_excel_for_task(task, successful_results, sheet_name=task.excel_sheet_name)
+        # Results of all chunks after the retry rounds, streamed a few chunks at a time
+        excel_content = save_excel_for_task(task, iter_task_results(task), sheet_name=task.excel_sheet_name)
         task.results_file_content = excel_content
         task.status = 'SUCCESS'
         task.progress = 100
+
+        # The Excel file is the result from now on
+        task.chunk_results.all().delete()
     except Exception as e:
         print(f"CRITICAL: Final Excel generation failed for task {task.task_id}: {e}")
         task.status = 'FAILURE'
     finally:
         task.completed_at = timezone.now()
-        task.save()
+        # Only the fields set here, the counters are written by finish_progress
+        task.save(update_fields=['results_file_content', 'status', 'progress', 'completed_at'])
+        finish_progress(task)
 
     return f"Enrichment complete and finalized for {task.excel_sheet_name}"
 
@@ -99,7 +176,13 @@ def enrich_data_task(self, company_names, excel_sheet_name, user_id=None, show_n
     """
     task_id = self.request.id
     owner_name = 'IBH'
-    total_companies = len(company_names or [])
+
+    # The view already submits unique names, collapse repeats from other callers before chunking as well
+    unique_names = unique_company_names(company_names)
+    if len(unique_names) < len(company_names or []):
+        print(f"🧹 {len(company_names) - len(unique_names)} duplicate or empty company names removed from {excel_sheet_name}")
+    company_names = unique_names
+    total_companies = len(company_names)
 
     # Guard against excessively large input to avoid overwhelming worker/broker
     max_companies = int(getattr(settings, "AI_AGENT_MAX_COMPANIES_PER_TASK", 5000))
@@ -140,16 +223,25 @@ def enrich_data_task(self, company_names, excel_sheet_name, user_id=None, show_n
         task.progress = 100
         task.completed_at = timezone.now()
         task.save()
+        finish_progress(task)
         return "No companies to enrich."
 
+    start_progress(task)
+
     # Create a group of parallel tasks for each chunk
     chunk_tasks = group(
-        enrich_chunk_task.s(company_names[i:i + CHUNK_SIZE], task_id, show_name, category_name)
+        enrich_chunk_task.s(company_names[i:i + CHUNK_SIZE], task_id, i // CHUNK_SIZE, show_name, category_name)
         for i in range(0, total_companies, CHUNK_SIZE)
     )
 
-    # Define a workflow: run all chunks in parallel (bounded by worker concurrency), then run the finalizer
-    workflow = (chunk_tasks | finalize_enrichment_task.s(task_id=task_id))
+    # Define a workflow: run all chunks in parallel (bounded by worker concurrency), then both phone retry
+    # rounds over the companies of all chunks that are still missing a phone, then run the finalizer
+    workflow = (
+        chunk_tasks
+        | retry_stage_task.s(task_id, 2, show_name, category_name)
+        | retry_stage_task.s(task_id, 3, show_name, category_name)
+        | finalize_enrichment_task.s(task_id=task_id)
+    )
 
     workflow.apply_async()
 
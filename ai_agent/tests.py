@@ -1,3 +1,256 @@
+from io import BytesIO
+from unittest import mock
+
+from openpyxl import load_workbook
+
+import time
+from datetime import timedelta
+
+import fakeredis
+import redis
 from django.test import TestCase
+from django.utils import timezone
+
+from main.models import Lead
+from . import enrichment_cache
+from .enrichment_cache import (NEGATIVE_TTL, POSITIVE_TTL, NOT_RETURNED, get_cached_results, store_results,
+                               record_cache_use, claim_lookups, release_lookups, claimed_lookups, in_flight_key)
+from .models import EnrichmentCache, GlobalOrganization, GlobalPhoneNumbers, GlobalEmails, GlobalContactNames, EnrichmentTask
+from .utils import (find_by_name, save_to_global_database, store_chunk_results, iter_task_results, apply_retry_to_chunks,
+                    task_companies_missing_phone, save_excel_for_task, EXCEL_COLUMNS, validate_and_fix_results, run_ai_batches,
+                    split_cached, run_single_flight)
+
+
+class FindByNameTests(TestCase):
+    databases = {'default', 'global'}
+
+    def test_matches_names_then_name_keys(self):
+        acme = GlobalOrganization.objects.create(name='Acme Inc.')
+        beta = GlobalOrganization.objects.create(name='Beta')
+        matches = find_by_name(GlobalOrganization, ['acme inc.', 'ACME, Inc', 'BETA', 'Gamma'])
+        self.assertEqual(matches, {'acme inc.': acme, 'ACME, Inc': acme, 'BETA': beta})
+
+    def test_prefers_the_exact_name_over_a_shared_key(self):
+        Lead.objects.create(name='Acme Inc.')
+        acme = Lead.objects.create(name='Acme')
+        self.assertIsNone(acme.name_key)
+        self.assertEqual(find_by_name(Lead, ['Acme'])['Acme'], acme)
+
+
+class SaveToGlobalDatabaseTests(TestCase):
+    databases = {'default', 'global'}
+
+    results = [
+        {'company_name': 'Acme Inc.', 'domain': 'acme.com', 'phone': '216-555-1234', 'email': 'info@acme.com',
+         'key_personnel': {'name': 'Jane Doe', 'title': 'CEO', 'email': 'jane@acme.com'}},
+        {'company_name': 'ACME, Inc', 'phone': '216-555-9999'},
+        {'company_name': 'Beta', 'domain': 'beta.com'},
+    ]
+
+    def counts(self):
+        return [model.objects.count() for model in (GlobalOrganization, GlobalPhoneNumbers, GlobalEmails, GlobalContactNames)]
+
+    def test_name_variants_share_one_organization(self):
+        save_to_global_database(self.results)
+        organization = GlobalOrganization.objects.get()
+        self.assertEqual((organization.name, organization.primary_domain), ('Acme Inc.', 'acme.com'))
+        self.assertEqual(set(organization.phone_numbers.values_list('value', flat=True)), {'216-555-1234', '216-555-9999'})
+
+    def test_saving_again_adds_nothing(self):
+        save_to_global_database(self.results)
+        counts = self.counts()
+        self.assertEqual(counts, [1, 2, 1, 1])
+
+        save_to_global_database(self.results)
+        save_to_global_database([{'company_name': 'acme', 'phone': '216-555-1234', 'domain': 'other.com'}])
+        self.assertEqual(self.counts(), counts)
+        self.assertEqual(GlobalOrganization.objects.get().primary_domain, 'acme.com')
+
+
+class ChunkResultsTests(TestCase):
+    databases = {'default', 'global'}
+
+    def setUp(self):
+        self.task = EnrichmentTask.objects.create(task_id='task', owner='test')
+        store_chunk_results(self.task, 1, [{'company_name': 'Gamma', 'phone': ''}])
+        store_chunk_results(self.task, 0, [{'company_name': 'Acme', 'phone': ''}, {'company_name': 'Beta', 'phone': '310-555-9876'}])
+
+    def companies(self):
+        return [(result['company_name'], result.get('phone')) for result in iter_task_results(self.task)]
+
+    @mock.patch('ai_agent.utils.CHUNKS_PER_READ', 1)
+    def test_results_are_read_in_chunk_order(self):
+        self.assertEqual(self.companies(), [('Acme', ''), ('Beta', '310-555-9876'), ('Gamma', '')])
+        self.assertEqual(task_companies_missing_phone(self.task), [('Acme', 0), ('Gamma', 1)])
+
+    def test_retried_chunk_replaces_its_results(self):
+        store_chunk_results(self.task, 1, [{'company_name': 'Gamma', 'phone': '216-555-1234'}])
+        self.assertEqual(self.companies()[-1], ('Gamma', '216-555-1234'))
+
+    def test_retry_updates_only_the_given_chunks(self):
+        apply_retry_to_chunks(self.task, [0], [{'company_name': 'Acme', 'phone': '216-555-1234', 'email': 'info@acme.com'},
+                                               {'company_name': 'Gamma', 'phone': '216-555-0000'}], 2)
+        results = list(iter_task_results(self.task))
+        self.assertEqual(self.companies(), [('Acme', '216-555-1234'), ('Beta', '310-555-9876'), ('Gamma', '')])
+        self.assertEqual(results[0]['email'], 'info@acme.com')
+        self.assertTrue(results[0]['time_zone'])
+
+
+class SaveExcelForTaskTests(TestCase):
+    databases = {'default', 'global'}
+
+    def rows(self, task, results):
+        worksheet = load_workbook(BytesIO(save_excel_for_task(task, iter(results)))).active
+        return worksheet.title, [[cell for cell in row if cell is not None] for row in worksheet.iter_rows(values_only=True)]
+
+    def test_rows_and_summary(self):
+        task = EnrichmentTask.objects.create(task_id='task', owner='test', excel_sheet_name='Leads: 2024', results={'local_companies_found': 1})
+        title, rows = self.rows(task, [
+            {'company_name': 'Acme', 'phone': '+1 216-555-1234', 'time_zone': 'EST', 'email': 'info@acme.com',
+             'key_personnel': {'name': 'Jane Doe', 'title': 'CEO', 'phone': '2165551234', 'email': 'jane@acme.com'}},
+            'not a result',
+            {'company_name': 'Beta', 'phone': '', 'email': None},
+        ])
+
+        self.assertEqual(title, 'Leads 2024')
+        self.assertEqual(rows[0], [column_name for column_name, _ in EXCEL_COLUMNS])
+        self.assertEqual(rows[1], ['Acme', '216 555 1234', 'EST', 'jane@acme.com', 'Jane Doe/CEO'])
+        self.assertEqual(rows[2], ['Beta'])
+        self.assertEqual([row for row in rows[3:] if row][:5], [
+            ['Data Enrichment Summary:'],
+            ['Total Companies Processed: 2'],
+            ['Companies with Phone: 1 (50.0%)'],
+            ['Companies with Email: 1 (50.0%)'],
+            ['Companies found in local DB: 1'],
+        ])
+        self.assertTrue(rows[-1][0].startswith('Generated on: '))
+
+    def test_no_results(self):
+        _, rows = self.rows(EnrichmentTask.objects.create(task_id='task', owner='test'), [])
+        self.assertIn(['Total Companies Processed: 0'], rows)
+        self.assertIn(['Companies with Phone: 0 (0.0%)'], rows)
+
+
+class EnrichmentCacheTests(TestCase):
+    databases = {'default', 'global'}
+
+    found = {'company_name': 'Acme Inc.', 'phone': '216-555-1234', 'email': None, 'key_personnel': {}}
+    not_found = {'company_name': 'Beta', 'phone': None, 'email': None, 'key_personnel': {}}
+
+    def test_found_and_not_found_results_expire_apart(self):
+        store_results([self.found, self.not_found], 'Expo', 'Farming', 1)
+        entries = {entry.company_name: entry for entry in EnrichmentCache.objects.all()}
+        self.assertTrue(entries['Acme Inc.'].found)
+        self.assertFalse(entries['Beta'].found)
+        self.assertAlmostEqual(entries['Acme Inc.'].expires_at, timezone.now() + POSITIVE_TTL, delta=timedelta(minutes=1))
+        self.assertAlmostEqual(entries['Beta'].expires_at, timezone.now() + NEGATIVE_TTL, delta=timedelta(minutes=1))
+
+    def test_results_are_renamed_to_the_requested_name(self):
+        store_results([self.found], 'Expo', 'Farming', 1)
+        cached = get_cached_results(['  ACME inc. '], ' expo', 'FARMING', 1)
+        self.assertEqual(cached['  ACME inc. ']['company_name'], '  ACME inc. ')
+        self.assertEqual(cached['  ACME inc. ']['phone'], '216-555-1234')
+
+    def test_context_and_round_are_part_of_the_key(self):
+        store_results([self.found], 'Expo', 'Farming', 1)
+        self.assertEqual(get_cached_results(['Acme Inc.'], 'Other Expo', 'Farming', 1), {})
+        self.assertEqual(get_cached_results(['Acme Inc.'], 'Expo', None, 1), {})
+        self.assertEqual(get_cached_results(['Acme Inc.'], 'Expo', 'Farming', 2), {})
+
+    def test_expired_entries_are_not_returned(self):
+        store_results([self.found, self.not_found], None, None, 1)
+        EnrichmentCache.objects.filter(company_name='Beta').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(list(get_cached_results(['Acme Inc.', 'Beta'], None, None, 1)), ['Acme Inc.'])
+
+    def test_storing_again_replaces_the_entry(self):
+        store_results([self.not_found], None, None, 2)
+        store_results([dict(self.not_found, phone='310-555-9876')], None, None, 2)
+        entry = EnrichmentCache.objects.get()
+        self.assertEqual((entry.found, entry.result['phone']), (True, '310-555-9876'))
+
+    def test_companies_the_ai_left_out_are_not_cached(self):
+        results = validate_and_fix_results([self.found], ['acme inc.', 'beta'], {'acme inc.': 'Acme Inc.', 'beta': 'Beta'}, 1, 1)
+        self.assertEqual([(result['company_name'], bool(result.get(NOT_RETURNED))) for result in results], [('Acme Inc.', False), ('Beta', True)])
+
+        task = EnrichmentTask.objects.create(task_id='task', owner='test')
+        with mock.patch('ai_agent.utils.record_request'), mock.patch('ai_agent.utils.run_concurrently', return_value=[results]):
+            run_ai_batches(['Acme Inc.', 'Beta'], 'key', 10, task, 1)
+        self.assertEqual(list(EnrichmentCache.objects.values_list('company_name', flat=True)), ['Acme Inc.'])
+
+    def test_hits_and_misses_are_counted(self):
+        task = EnrichmentTask.objects.create(task_id='task', owner='test')
+        store_results([self.found], None, None, 1)
+        cached, missing = split_cached(['Acme Inc.', 'Beta'], task, 1)
+        self.assertEqual(([result['company_name'] for result in cached], missing), (['Acme Inc.'], ['Beta']))
+
+        record_cache_use(task, hits=2, misses=0)
+        task.refresh_from_db()
+        self.assertEqual((task.cache_hits, task.cache_misses), (3, 1))
+
+
+@mock.patch.multiple(enrichment_cache, _release_claims=None, _extend_claims=None, IN_FLIGHT_POLL_SECONDS=0.01)
+class SingleFlightTests(TestCase):
+    databases = {'default', 'global'}
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(enrichment_cache, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.task = EnrichmentTask.objects.create(task_id='task', owner='test')
+
+    def result(self, company_name, phone='216-555-1234'):
+        return {'company_name': company_name, 'phone': phone, 'email': None, 'key_personnel': {}}
+
+    def run_single_flight(self, company_names, other_task_finishes):
+        """Runs the task's round while another task holds the claim of Acme, `other_task_finishes` is how it ends"""
+        claim_lookups(['Acme'], 'other', None, None, 1)
+        sent = []
+
+        def run_concurrently(function, calls):
+            sent.append([company for call in calls for company in call[0]])
+            if len(sent) == 1:
+                other_task_finishes()
+            return [[self.result(company) for company in call[0]] for call in calls]
+
+        with mock.patch('ai_agent.utils.record_request'), mock.patch('ai_agent.utils.run_concurrently', side_effect=run_concurrently):
+            reused, ai_batches = run_single_flight(company_names, 'key', 10, self.task, 1)
+        return sent, [result['company_name'] for result in reused]
+
+    def test_company_claimed_by_another_task_is_reused_from_the_cache(self):
+        def other_task_finishes():
+            store_results([self.result('Acme', '310-555-9876')], None, None, 1)
+            release_lookups(['Acme'], 'other', None, None, 1)
+
+        sent, reused = self.run_single_flight(['Acme', 'Beta'], other_task_finishes)
+        self.assertEqual((sent, reused), ([['Beta']], ['Acme']))
+
+    def test_claim_released_without_a_result_is_sent_again(self):
+        sent, reused = self.run_single_flight(['Acme', 'Beta'], lambda: release_lookups(['Acme'], 'other', None, None, 1))
+        self.assertEqual((sent, reused), ([['Beta'], ['Acme']], []))
+
+    @mock.patch.object(enrichment_cache, 'WAIT_SECONDS', 0.05)
+    def test_company_still_in_flight_after_the_wait_is_sent(self):
+        sent, reused = self.run_single_flight(['Acme', 'Beta'], lambda: None)
+        self.assertEqual((sent, reused), ([['Beta'], ['Acme']], []))
+        self.assertEqual(self.redis.get(in_flight_key('Acme', None, None, 1)), 'other')
+
+    def test_release_keeps_another_owners_claim(self):
+        self.assertEqual(claim_lookups(['Acme', 'Beta'], 'task', None, None, 1), (['Acme', 'Beta'], []))
+        # The task's claim of Acme expired and another task claimed it
+        self.redis.set(in_flight_key('Acme', None, None, 1), 'other')
+
+        release_lookups(['Acme', 'Beta'], 'task', None, None, 1)
+        self.assertEqual(self.redis.get(in_flight_key('Acme', None, None, 1)), 'other')
+        self.assertIsNone(self.redis.get(in_flight_key('Beta', None, None, 1)))
+
+    @mock.patch.object(enrichment_cache, 'CLAIM_SECONDS', 3)
+    def test_claims_are_kept_while_the_batches_run(self):
+        with claimed_lookups(['Acme'], 'task', None, None, 1) as (claimed, in_flight):
+            time.sleep(1.5)
+            self.assertEqual(self.redis.ttl(in_flight_key('Acme', None, None, 1)), 3)
+        self.assertIsNone(self.redis.get(in_flight_key('Acme', None, None, 1)))
 
-# Create your tests here.
+    def test_everything_is_claimed_without_redis(self):
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError):
+            self.assertEqual(claim_lookups(['Acme', 'Beta'], 'task', None, None, 1), (['Acme', 'Beta'], []))
@@ -4,6 +4,7 @@ from .views import (
     index,
     enrichment_results_page,
     get_enrichment_status,
+    get_enrichment_progress,
     download_enrichment_file,
     task_dashboard_view,
     category_list_view,
@@ -11,15 +12,13 @@ from .views import (
     category_edit_view,
     category_delete_view,
 )
-from .utils import get_enrichment_progress
-
 app_name = 'ai_agent'
 
 urlpatterns = [
     path('', index, name="index"),
     path('search/', index, name="search"),
     path('enrich_data/', data_enrichment_view, name="data_enrichment"),
-    path('enrichment_progress/', get_enrichment_progress, name='enrichment_progress'),
+    path('enrichment_progress/<str:task_id>/', get_enrichment_progress, name='enrichment_progress'),
     path('results/<str:task_id>/', enrichment_results_page, name='enrichment_results_page'),
     path('enrichment_status/<str:task_id>/', get_enrichment_status, name='enrichment_status'),
     path('files/download/<str:task_id>/', download_enrichment_file, name='download_file'),
@@ -1,21 +1,20 @@
 from django.db import transaction
+from django.db.models import Min, Q, Subquery
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.http import JsonResponse
 from django.conf import settings
 from datetime import timedelta, datetime
 from main.models import *
-import json, time, re
+from main.utils import normalize_phone_number, company_name_key
+import json, re
 from typing import Optional, Dict, List
-import google.genai as genai
 from google.genai import types
-import pandas as pd
+import xlsxwriter
 from io import BytesIO
-from .models import GlobalOrganization, GlobalPhoneNumbers, GlobalEmails, GlobalContactNames
-
-# Tunable delays for external AI calls (configured in settings for control vs. speed)
-AI_BATCH_SLEEP_SECONDS = getattr(settings, "AI_AGENT_BATCH_SLEEP_SECONDS", 1.0)
-AI_RETRY_SLEEP_SECONDS = getattr(settings, "AI_AGENT_RETRY_SLEEP_SECONDS", 1.0)
+from .models import GlobalOrganization, GlobalPhoneNumbers, GlobalEmails, GlobalContactNames, EnrichmentChunkResult, normalize_company_name
+from .progress import record_request, record_phase
+from .gemini import get_client, generate_content, run_concurrently
+from .enrichment_cache import NOT_RETURNED, get_cached_results, store_results, record_cache_use, is_found, claimed_lookups, wait_for_lookups
 
 def get_credit_balance():
     """Get current project credit balance"""
@@ -223,52 +222,31 @@ def get_monthly_summary():
 
 ############################################################## Enrichment part ##############################################################
 
-enrichment_progress = {
-    'current_batch': 0,
-    'total_batches': 0,
-    'companies_processed': 0,
-    'total_companies': 0,
-    'current_phase': 'initial',
-    'is_complete': False
-}
-
-def get_enrichment_progress(request):
-    """API endpoint to get current progress"""
-    return JsonResponse(enrichment_progress)
-
-def reset_enrichment_progress():
-    """Reset progress for new request"""
-    global enrichment_progress
-    enrichment_progress = {
-        'current_batch': 0,
-        'total_batches': 0,
-        'companies_processed': 0,
-        'total_companies': 0,
-        'current_phase': 'initial',
-        'is_complete': False
-    }
-
-
-def mark_complete():
-    """Mark processing as complete"""
-    global enrichment_progress
-    enrichment_progress['is_complete'] = True
+def unique_company_names(company_names):
+    """
+    The company names without repeats (ignoring case and spacing) and empty names, in submitted order,
+    each company under the spelling it first appeared with
+    """
+    unique_names = {}
+    for name in company_names or []:
+        unique_names.setdefault(normalize_company_name(name), name)
+    unique_names.pop('', None)
+    return list(unique_names.values())
 
 
 def orchestrate_enrichment_workflow(company_names, api_key, task, show_name=None, category_name=None):
     """
-    Main workflow that orchestrates the entire enrichment process
+    First pass of the enrichment of one chunk: databases, then AI for the companies they do not have
     """
-    reset_enrichment_progress()
-        
-
     # Step 1: Search in Local then Global databases (local search is free)
+    record_phase(task, 'database_search')
     found_leads, not_found_leads = search_databases(company_names)
     print(f"📊 Database results: {len(found_leads)} found, {len(not_found_leads)} not found")
 
     # Step 2: Enrich not found leads with AI
     ai_leads = []
     if not_found_leads:
+        record_phase(task, 'ai_enrichment')
         ai_leads = enrich_with_ai(not_found_leads, api_key, batch_size=5, task=task, show_name=show_name, category_name=category_name)
         
         # Step 3: Save AI results to global database
@@ -278,129 +256,213 @@ def orchestrate_enrichment_workflow(company_names, api_key, task, show_name=None
     # Step 4: Merge all results in original order
     enriched_results = merge_results(company_names, found_leads, ai_leads)
     
-    # Step 5: Retry companies missing phone numbers (first retry round)
-    enriched_results = retry_missing_phones(enriched_results, api_key, batch_size=8, task=task, show_name=show_name, category_name=category_name)
-    
-    # Step 6: Second retry round for companies still missing phone numbers
-    # This retry is triggered only by missing phone numbers, but also updates emails if found
-    enriched_results = retry_missing_phones_second_round(enriched_results, api_key, batch_size=10, task=task, show_name=show_name, category_name=category_name)
-    
-    # Mark as complete
-    mark_complete()
-    
-    # Final processing step: ensure all phone numbers have a timezone
-    for result in enriched_results:
-        if isinstance(result, dict) and result.get('phone') and not result.get('time_zone'):
-            result['time_zone'] = get_timezone_for_number(result.get('phone'))
+    # The phone retry rounds run once per task over all chunks, see tasks.retry_stage_task
 
-    return enriched_results
+    # Final processing step: ensure all phone numbers have a timezone
+    return fill_missing_timezones(enriched_results)
 
 
 def search_databases(company_names):
     """
-    Search for companies in local and global databases
-    Returns: (found_leads, not_found_leads)
+    Search for companies in local then global databases, one lookup per database for the whole list
+    Returns: (found_leads, not_found_leads), found_leads maps each found name (as given) to its lead data
     """
-    found_leads = []
-    not_found_leads = []
-    
-    for company_name in company_names:
-        name = company_name.strip()
-        if not name:
-            continue
+    names = [company_name.strip() for company_name in company_names if company_name.strip()]
 
-        # Try Local DB first
-        lead_data = search_local_database(name)
-        if lead_data:
-            found_leads.append(lead_data)
-            continue
+    # Try Local DB first
+    found_leads = search_local_database(names)
 
-        # Try Global DB second
-        lead_data = search_global_database(name)
-        if lead_data:
-            found_leads.append(lead_data)
-            continue
+    # Try Global DB second, only for what the local DB does not have
+    found_leads.update(search_global_database([name for name in names if name not in found_leads]))
+
+    # Not found in either DB
+    not_found_leads = [name for name in names if name not in found_leads]
+
+    variants = sum(1 for name, lead in found_leads.items() if lead['company_name'].lower() != name.lower())
+    if variants:
+        print(f"🔑 {variants} companies matched a stored variant of their name")
 
-        # Not found in either DB
-        not_found_leads.append(name)
-        
     return found_leads, not_found_leads
 
 
-def search_local_database(company_name):
-    """Search in local Lead database"""
-    local_lead = Lead.objects.filter(name__iexact=company_name).first()
-    if not local_lead:
-        return None
-        
-    phone_number = LeadPhoneNumbers.objects.filter(lead=local_lead).first() if LeadPhoneNumbers.objects.filter(lead=local_lead).exists() else None
+def first_per_parent(model, parent_field, parent_ids, *fields):
+    """The first row (lowest id, what .first() returns) of `model` for each parent in one grouped query, as {parent_id: row values}"""
+    first_ids = model.objects.filter(**{f'{parent_field}__in': parent_ids}).values(parent_field).annotate(first_id=Min('id')).values('first_id')
+    rows = model.objects.filter(id__in=Subquery(first_ids)).values(parent_field, *fields)
+    return {row[parent_field]: row for row in rows}
 
-    return {
-        "company_name": local_lead.name,
-        "phone": phone_number.value if phone_number else None,
-        "time_zone": phone_number.time_zone if phone_number else None,
-        "email": LeadEmails.objects.filter(lead=local_lead).first().value if LeadEmails.objects.filter(lead=local_lead).exists() else None,
-        "key_personnel": {
-            "name": LeadContactNames.objects.filter(lead=local_lead).first().value if LeadContactNames.objects.filter(lead=local_lead).exists() else None,
-            "phone": None,
-            "title": None,
-            "email": None
-        }
-    }
 
+def find_by_name(model, company_names, *fields):
+    """
+    Maps each company name to its row of `model` (Lead or GlobalOrganization) in one query. The name itself is
+    matched first, case-insensitively like the utf8mb4 *_ci collations of the name columns, then its name_key,
+    so "ACME, Inc" finds "Acme Inc.".
+    """
+    keys = {company_name: company_name_key(company_name) for company_name in company_names}
+    rows = model.objects.filter(Q(name__in=set(company_names)) | Q(name_key__in={key for key in keys.values() if key})).only('id', 'name', *fields)
 
-def search_global_database(company_name):
-    """Search in global database"""
-    global_org = GlobalOrganization.objects.filter(name__iexact=company_name).first()
-    if not global_org:
-        return None
-        
-    return {
-        "company_name": global_org.name,
-        "domain": getattr(global_org, "primary_domain", None),
-        "phone": GlobalPhoneNumbers.objects.filter(organization=global_org).first().value if GlobalPhoneNumbers.objects.filter(organization=global_org).exists() else None,
-        "time_zone": GlobalPhoneNumbers.objects.filter(organization=global_org).first().time_zone if GlobalPhoneNumbers.objects.filter(organization=global_org).exists() else None,
-        "email": GlobalEmails.objects.filter(organization=global_org).first().value if GlobalEmails.objects.filter(organization=global_org).exists() else None,
-        "key_personnel": {
-            "name": GlobalContactNames.objects.filter(organization=global_org).first().name if GlobalContactNames.objects.filter(organization=global_org).exists() else None,
-            "phone": GlobalContactNames.objects.filter(organization=global_org).first().phone_number if GlobalContactNames.objects.filter(organization=global_org).exists() else None,
-            "title": GlobalContactNames.objects.filter(organization=global_org).first().title if GlobalContactNames.objects.filter(organization=global_org).exists() else None,
-            "email": GlobalContactNames.objects.filter(organization=global_org).first().email if GlobalContactNames.objects.filter(organization=global_org).exists() else None,
+    rows_by_name = {}
+    rows_by_key = {}
+    for row in rows:
+        rows_by_name[row.name.lower()] = row
+        if row.name_key:
+            rows_by_key[row.name_key] = row
+
+    matches = {}
+    for company_name in company_names:
+        row = rows_by_name.get(company_name.lower()) or rows_by_key.get(keys[company_name])
+        if row:
+            matches[company_name] = row
+    return matches
+
+
+def search_local_database(company_names):
+    """Search companies in local Lead database, returns {company name: lead data} for the ones found"""
+    if not company_names:
+        return {}
+
+    # By name, then by name key, both through their unique indexes
+    leads = find_by_name(Lead, company_names, 'name_key')
+    lead_ids = {lead.id for lead in leads.values()}
+    if not lead_ids:
+        return {}
+
+    phones = first_per_parent(LeadPhoneNumbers, 'lead_id', lead_ids, 'value', 'time_zone')
+    emails = first_per_parent(LeadEmails, 'lead_id', lead_ids, 'value')
+    contacts = first_per_parent(LeadContactNames, 'lead_id', lead_ids, 'value')
+
+    found = {}
+    for company_name, lead in leads.items():
+        phone_number = phones.get(lead.id)
+        email = emails.get(lead.id)
+        contact = contacts.get(lead.id)
+        found[company_name] = {
+            "company_name": lead.name,
+            "phone": phone_number['value'] if phone_number else None,
+            "time_zone": phone_number['time_zone'] if phone_number else None,
+            "email": email['value'] if email else None,
+            "key_personnel": {
+                "name": contact['value'] if contact else None,
+                "phone": None,
+                "title": None,
+                "email": None
+            }
         }
-    }
+    return found
+
+
+def search_global_database(company_names):
+    """Search companies in global database, returns {company name: lead data} for the ones found"""
+    if not company_names:
+        return {}
+
+    # By name, then by name key, both through their unique indexes
+    organizations = find_by_name(GlobalOrganization, company_names, 'name_key', 'primary_domain')
+    organization_ids = {organization.id for organization in organizations.values()}
+    if not organization_ids:
+        return {}
+
+    phones = first_per_parent(GlobalPhoneNumbers, 'organization_id', organization_ids, 'value', 'time_zone')
+    emails = first_per_parent(GlobalEmails, 'organization_id', organization_ids, 'value')
+    contacts = first_per_parent(GlobalContactNames, 'organization_id', organization_ids, 'name', 'phone_number', 'title', 'email')
+
+    found = {}
+    for company_name, global_org in organizations.items():
+        phone_number = phones.get(global_org.id)
+        email = emails.get(global_org.id)
+        contact = contacts.get(global_org.id)
+        found[company_name] = {
+            "company_name": global_org.name,
+            "domain": global_org.primary_domain,
+            "phone": phone_number['value'] if phone_number else None,
+            "time_zone": phone_number['time_zone'] if phone_number else None,
+            "email": email['value'] if email else None,
+            "key_personnel": {
+                "name": contact['name'] if contact else None,
+                "phone": contact['phone_number'] if contact else None,
+                "title": contact['title'] if contact else None,
+                "email": contact['email'] if contact else None,
+            }
+        }
+    return found
 
 
-def enrich_with_ai(company_names, api_key, batch_size, task, show_name=None, category_name=None):
+def run_ai_batches(company_names, api_key, batch_size, task, retry_round, show_name=None, category_name=None):
     """
-    Enrich companies using AI in batches
+    Splits the companies into batches and sends them to the AI concurrently
+    Returns: [(batch, ai results or None when the batch failed)] in batch order
     """
-    results = []
-    
+    calls = []
     for i in range(0, len(company_names), batch_size):
         batch = company_names[i:i + batch_size]
         batch_mapping = {name.lower().strip(): name for name in batch}
-        current_batch = (i // batch_size) + 1
-        
-        print(f"🔍 Processing AI batch {current_batch} with {len(batch)} companies")
-        
-        # Increment request count for the task
-        task.request_count += 1
-        task.save()
-
-        ai_batch = ai_search_batch(
-            batch,
-            api_key,
-            batch_number=current_batch,
-            retry_round=1,
-            company_mapping=batch_mapping,
-            show_name=show_name,
-            category_name=category_name
-        )
-        
+
+        # Increment request count for the task (retry rounds count as retry batches)
+        record_request(task, retry=retry_round > 1)
+        calls.append((batch, api_key, (i // batch_size) + 1, retry_round, batch_mapping, show_name, category_name))
+
+    if not calls:
+        return []
+
+    print(f"🔍 Sending {len(calls)} AI batches (round {retry_round}) for {len(company_names)} companies")
+    ai_batches = run_concurrently(ai_search_batch, calls)
+
+    # Remember what every successful batch found, or did not find, for the next request of the same companies
+    for ai_batch in ai_batches:
+        if ai_batch:
+            store_results(ai_batch, show_name, category_name, retry_round)
+
+    return [(call[0], ai_batch) for call, ai_batch in zip(calls, ai_batches)]
+
+
+def split_cached(company_names, task, retry_round, show_name=None, category_name=None):
+    """
+    Looks the companies up in the enrichment cache before a round
+    Returns: (cached results, companies that still need the AI)
+    """
+    cached = get_cached_results(company_names, show_name, category_name, retry_round)
+    missing = [name for name in company_names if name not in cached]
+    record_cache_use(task, hits=len(company_names) - len(missing), misses=len(missing))
+    if cached:
+        print(f"💾 {len(cached)} companies answered from the enrichment cache (round {retry_round})")
+    return list(cached.values()), missing
+
+
+def run_single_flight(company_names, api_key, batch_size, task, retry_round, show_name=None, category_name=None):
+    """
+    Sends the companies no other task is looking up right now, then waits for the ones in flight elsewhere
+    and reuses their results. Companies the other task got no result for are sent after all.
+    Returns: (reused results, [(batch, ai results or None when the batch failed)])
+    """
+    with claimed_lookups(company_names, task.task_id, show_name, category_name, retry_round) as (claimed, in_flight):
+        ai_batches = run_ai_batches(claimed, api_key, batch_size, task, retry_round, show_name, category_name)
+
+    if not in_flight:
+        return [], ai_batches
+
+    print(f"⏳ Waiting for {len(in_flight)} companies another task is looking up (round {retry_round})")
+    reused = wait_for_lookups(in_flight, show_name, category_name, retry_round)
+    if reused:
+        print(f"♻️ {len(reused)} companies reused from another task's lookup (round {retry_round})")
+
+    missing = [name for name in in_flight if name not in reused]
+    ai_batches += run_ai_batches(missing, api_key, batch_size, task, retry_round, show_name, category_name)
+    return list(reused.values()), ai_batches
+
+
+def enrich_with_ai(company_names, api_key, batch_size, task, show_name=None, category_name=None):
+    """
+    Enrich companies using AI in batches
+    """
+    results, company_names = split_cached(company_names, task, 1, show_name, category_name)
+    reused, ai_batches = run_single_flight(company_names, api_key, batch_size, task, 1, show_name, category_name)
+    results.extend(reused)
+    
+    for batch_number, (batch, ai_batch) in enumerate(ai_batches, 1):
         if ai_batch:
             results.extend(ai_batch)
         else:
-            print(f"❌ AI batch {current_batch} failed, creating empty results")
+            print(f"❌ AI batch {batch_number} failed, creating empty results")
             # Create empty results for failed batch
             for company in batch:
                 results.append({
@@ -411,11 +473,6 @@ def enrich_with_ai(company_names, api_key, batch_size, task, show_name=None, cat
                     "email": None,
                     "key_personnel": {"name": None, "phone": None, "title": None, "email": None}
                 })
-        
-        # Add delay between batches to avoid rate limiting (except for last batch)
-        if i + batch_size < len(company_names):
-            print(f"⏳ Waiting {AI_BATCH_SLEEP_SECONDS} seconds before next batch...")
-            time.sleep(AI_BATCH_SLEEP_SECONDS)
     
     return results
 
@@ -517,7 +574,8 @@ def ai_search_batch(company_list: List[str], api_key: str, batch_number: int, re
     Ensure the array has exactly {len(company_list)} objects in the exact same order as the input companies."""
 
     try:
-        client = genai.Client(api_key=api_key)
+        # Shared by every batch of this worker process, so HTTP connections are reused
+        client = get_client(api_key)
         
     except Exception as e:
         return None
@@ -533,7 +591,9 @@ def ai_search_batch(company_list: List[str], api_key: str, batch_number: int, re
     )
 
     try:
-        response = client.models.generate_content(
+        # Rate limited across all workers and retried on 429/5xx
+        response = generate_content(
+            client,
             model="gemini-2.5-flash",
             contents=prompt,
             config=config
@@ -549,87 +609,98 @@ def ai_search_batch(company_list: List[str], api_key: str, batch_number: int, re
 def save_to_global_database(enriched_results):
     """
     Save AI-enriched results to global database, skipping entries with no contact info.
+    Everything is written in bulk in one transaction: existing organizations are looked up in one query, new
+    organizations and all phones, emails and contacts are inserted ignoring rows the unique constraints already have.
     """
-    organizations_created = 0
-    phones_created = 0
-    emails_created = 0
-    contacts_created = 0
-    
+    # Grouped by name key, so the variants of a company's name end up on one organization with the first spelling
+    results = {}
     for result in enriched_results:
-        company_name = result.get('company_name')
-        if not company_name:
-            continue
-
-        # Extract contact info
-        phone_number = result.get('phone')
-        email = result.get('email')
-        key_personnel = result.get("key_personnel") or {}
-        contact_phone = key_personnel.get("phone")
-        contact_email = key_personnel.get("email")
-
-        # Check for any valid contact information
-        has_contact_info = any([
-            phone_number and str(phone_number).strip(),
-            email and str(email).strip(),
-            contact_phone and str(contact_phone).strip(),
-            contact_email and str(contact_email).strip()
-        ])
+        company_name = clip(GlobalOrganization, 'name', result.get('company_name'))
 
         # If no contact info, skip saving this record
-        if not has_contact_info:
-            continue
-        
-        try:
-            organization, org_created = GlobalOrganization.objects.get_or_create(
-                name=company_name,
-                defaults={'primary_domain': result.get('domain')}
-            )
-            
-            if org_created:
-                organizations_created += 1
-            
-            # Update primary domain if not set
-            if not organization.primary_domain and result.get('domain'):
-                organization.primary_domain = result.get('domain')
-                organization.save()
-            
-            # Store phone numbers
-            if phone_number and str(phone_number).strip():
-                phone_obj, phone_created = GlobalPhoneNumbers.objects.get_or_create(
-                    organization=organization,
-                    value=phone_number,
-                    defaults={'time_zone': result.get('time_zone')}
-                )
-                if phone_created:
-                    phones_created += 1
-            
-            # Store emails
-            if email and str(email).strip():
-                email_obj, email_created = GlobalEmails.objects.get_or_create(
-                    organization=organization,
-                    value=email
-                )
-                if email_created:
-                    emails_created += 1
-            
-            # Store contact names
-            contact_name = key_personnel.get("name")
-            if contact_name and str(contact_name).strip():
-                contact_obj, contact_created = GlobalContactNames.objects.get_or_create(
-                    organization=organization,
-                    name=contact_name,
-                    defaults={
-                        'title': key_personnel.get("title"),
-                        'phone_number': contact_phone,
-                        'email': contact_email
-                    }
-                )
-                if contact_created:
-                    contacts_created += 1
-                    
-        except Exception as e:
-            print(f"❌ Error storing data for {company_name}: {str(e)}")
-            continue
+        if company_name and is_found(result, 1):
+            results.setdefault(company_name_key(company_name) or company_name.lower(), (company_name, []))[1].append(result)
+
+    if not results:
+        return
+
+    with transaction.atomic(using='global'):
+        existing = find_by_name(GlobalOrganization, [company_name for company_name, _ in results.values()], 'name_key', 'primary_domain')
+        organizations = {key: existing[company_name] for key, (company_name, _) in results.items() if company_name in existing}
+
+        new_organizations = [
+            GlobalOrganization(name=company_name, name_key=company_name_key(company_name) or None)
+            for key, (company_name, _) in results.items() if key not in organizations
+        ]
+        if new_organizations:
+            GlobalOrganization.objects.bulk_create(new_organizations, ignore_conflicts=True)
+            # Inserted rows have no id with ignore_conflicts, read them back
+            created = find_by_name(GlobalOrganization, [organization.name for organization in new_organizations], 'name_key', 'primary_domain')
+            organizations.update({key: created[company_name] for key, (company_name, _) in results.items() if company_name in created and key not in organizations})
+
+        # Set primary domain if not set, from the first result that has one
+        domain_updates = []
+        for key, (_, company_results) in results.items():
+            organization = organizations.get(key)
+            domains = [clip(GlobalOrganization, 'primary_domain', result.get('domain')) for result in company_results]
+            domain = next((domain for domain in domains if domain), None)
+            if organization and not organization.primary_domain and domain:
+                organization.primary_domain = domain
+                domain_updates.append(organization)
+        if domain_updates:
+            GlobalOrganization.objects.bulk_update(domain_updates, ['primary_domain'])
+
+        phones, emails, contacts = {}, {}, {}
+        for key, (_, company_results) in results.items():
+            organization = organizations.get(key)
+            if not organization:
+                continue
+            for result in company_results:
+                add_global_children(organization, result, phones, emails, contacts)
+
+        for model, rows in ((GlobalPhoneNumbers, phones), (GlobalEmails, emails), (GlobalContactNames, contacts)):
+            if rows:
+                model.objects.bulk_create(rows.values(), ignore_conflicts=True)
+
+
+def add_global_children(organization, result, phones, emails, contacts):
+    """
+    Adds the phone, email and contact of one result to the rows to insert, keyed like their unique constraints
+    """
+    key_personnel = result.get("key_personnel") or {}
+
+    # Store phone numbers
+    phone_number = clip(GlobalPhoneNumbers, 'value', result.get('phone'))
+    if phone_number:
+        phones.setdefault((organization.id, phone_number.lower()), GlobalPhoneNumbers(
+            organization=organization, value=phone_number, time_zone=clip(GlobalPhoneNumbers, 'time_zone', result.get('time_zone'))
+        ))
+
+    # Store emails
+    email = clip(GlobalEmails, 'value', result.get('email'))
+    if email:
+        emails.setdefault((organization.id, email.lower()), GlobalEmails(organization=organization, value=email))
+
+    # Store contact names
+    contact_name = clip(GlobalContactNames, 'name', key_personnel.get("name"))
+    if contact_name:
+        contacts.setdefault((organization.id, contact_name.lower()), GlobalContactNames(
+            organization=organization,
+            name=contact_name,
+            title=clip(GlobalContactNames, 'title', key_personnel.get("title")),
+            phone_number=clip(GlobalContactNames, 'phone_number', key_personnel.get("phone")),
+            email=clip(GlobalContactNames, 'email', key_personnel.get("email")),
+        ))
+
+
+def clip(model, field_name, value):
+    """
+    The value as a stripped string for the field, None when it is empty or longer than the column
+    """
+    value = str(value).strip() if value is not None else ''
+    if not value or len(value) > model._meta.get_field(field_name).max_length:
+        return None
+    return value
 
 
 def merge_results(company_names, found_leads, ai_leads):
@@ -638,13 +709,12 @@ def merge_results(company_names, found_leads, ai_leads):
     """
     enriched_results = []
     
-    # Create lookup maps
-    found_map = {lead['company_name']: lead for lead in found_leads}
+    # Create lookup maps, database results are already keyed by the requested name
     ai_map = {lead['company_name']: lead for lead in ai_leads}
     
     for company_name in company_names:
-        if company_name in found_map:
-            enriched_results.append(found_map[company_name])
+        if company_name.strip() in found_leads:
+            enriched_results.append(found_leads[company_name.strip()])
         elif company_name in ai_map:
             enriched_results.append(ai_map[company_name])
         else:
@@ -661,46 +731,123 @@ def merge_results(company_names, found_leads, ai_leads):
     return enriched_results
 
 
-def retry_missing_phones(enriched_results, api_key, batch_size, task, show_name=None, category_name=None):
+# Batch size (companies per AI request) and progress phase of each phone retry round
+RETRY_ROUNDS = {
+    2: {'batch_size': 8, 'phase': 'phone_retry'},
+    3: {'batch_size': 10, 'phase': 'phone_retry_second_round'},
+}
+
+
+def companies_missing_phone(enriched_results):
     """
-    Retry companies that are missing phone numbers using AI in batches.
+    Companies that still have no phone number, the trigger of both retry rounds (not emails)
     """
-    companies_to_retry = []
+    companies = []
     for result in enriched_results:
         if not result.get('phone') or str(result.get('phone', '')).strip() == '':
-            companies_to_retry.append(result.get('company_name'))
+            companies.append(result.get('company_name'))
+    return list(dict.fromkeys(company for company in companies if company))
 
-    if not companies_to_retry:
-        return enriched_results
 
-    print(f"🔄 Retrying {len(companies_to_retry)} companies missing phone numbers...")
-    time.sleep(AI_RETRY_SLEEP_SECONDS)
+def fetch_retry_results(companies_to_retry, api_key, task, retry_round, show_name=None, category_name=None):
+    """
+    Retry companies that are missing phone numbers using AI in batches, returns the retry results
+    """
+    print(f"🔄 Retry round {retry_round}: Retrying {len(companies_to_retry)} companies missing phone numbers...")
 
     # Use the same batching/AI logic as enrich_with_ai
-    retry_results = []
-    company_mapping = {name.lower().strip(): name for name in companies_to_retry}
-    for i in range(0, len(companies_to_retry), batch_size):
-        batch = companies_to_retry[i:i + batch_size]
-        batch_mapping = {name.lower().strip(): name for name in batch}
-        
-        # Increment request count for the task
-        task.request_count += 1
-        task.save()
-
-        ai_batch = ai_search_batch(
-            batch,
-            api_key,
-            batch_number=(i // batch_size) + 1,
-            retry_round=2,
-            company_mapping=batch_mapping,
-            show_name=show_name,
-            category_name=category_name
-        )
+    retry_results, companies_to_retry = split_cached(companies_to_retry, task, retry_round, show_name, category_name)
+    reused, ai_batches = run_single_flight(companies_to_retry, api_key, RETRY_ROUNDS[retry_round]['batch_size'], task, retry_round, show_name, category_name)
+    retry_results.extend(reused)
+    for batch, ai_batch in ai_batches:
         if ai_batch:
             retry_results.extend(ai_batch)
             # Save the results from the retry batch to the global database
             save_to_global_database(ai_batch)
 
+    return retry_results
+
+
+def apply_retry_results(enriched_results, retry_results, retry_round):
+    """
+    Updates the results with what a retry round found.
+    The first retry round only fills phones and emails, the second one also domain and key personnel.
+    """
+    if retry_round == 2:
+        enriched_results = apply_phone_retry(enriched_results, retry_results)
+    else:
+        enriched_results = apply_second_round_retry(enriched_results, retry_results)
+    return fill_missing_timezones(enriched_results)
+
+
+# Chunk rows read per query when going through a task's results, MySQL drivers load whole result sets
+CHUNKS_PER_READ = 10
+
+
+def store_chunk_results(task, chunk_index, enriched_results):
+    """Stores the results of one chunk, replacing them when a retried chunk task runs again"""
+    EnrichmentChunkResult.objects.update_or_create(task=task, chunk_index=chunk_index, defaults={'results': enriched_results})
+
+
+def iter_chunk_results(task):
+    """
+    The stored chunks of a task in order, as (chunk index, results), a few chunks in memory at a time
+    """
+    last_index = -1
+    while True:
+        rows = list(
+            EnrichmentChunkResult.objects.filter(task=task, chunk_index__gt=last_index)
+            .order_by('chunk_index').values_list('chunk_index', 'results')[:CHUNKS_PER_READ]
+        )
+        if not rows:
+            return
+        for last_index, enriched_results in rows:
+            yield last_index, enriched_results
+
+
+def iter_task_results(task):
+    """All results of a task in the order the companies were submitted"""
+    for _, enriched_results in iter_chunk_results(task):
+        yield from enriched_results
+
+
+def task_companies_missing_phone(task):
+    """
+    Companies of all chunks of a task that still have no phone number
+    Returns: [(company name, chunk index)] in task order
+    """
+    companies = []
+    for chunk_index, enriched_results in iter_chunk_results(task):
+        companies.extend((company, chunk_index) for company in companies_missing_phone(enriched_results))
+    return companies
+
+
+def apply_retry_to_chunks(task, chunk_indexes, retry_results, retry_round):
+    """
+    Updates the stored chunks of the retried companies with what a retry round found.
+    Retry chunks of the same round run in parallel, so the rows are locked (in chunk order) while they are updated.
+    """
+    with transaction.atomic(using='global'):
+        rows = EnrichmentChunkResult.objects.select_for_update().filter(task=task, chunk_index__in=chunk_indexes).order_by('chunk_index')
+        for row in rows:
+            row.results = apply_retry_results(row.results, retry_results, retry_round)
+            row.save(update_fields=['results'])
+
+
+def fill_missing_timezones(enriched_results):
+    """
+    Ensure all phone numbers have a timezone
+    """
+    for result in enriched_results:
+        if isinstance(result, dict) and result.get('phone') and not result.get('time_zone'):
+            result['time_zone'] = get_timezone_for_number(result.get('phone'))
+    return enriched_results
+
+
+def apply_phone_retry(enriched_results, retry_results):
+    """
+    Updates phone numbers and emails found during the first retry round.
+    """
     # Update the original results with retry data
     retry_map = {result['company_name']: result for result in retry_results}
     for i, result in enumerate(enriched_results):
@@ -717,49 +864,11 @@ def retry_missing_phones(enriched_results, api_key, batch_size, task, show_name=
     return enriched_results
 
 
-def retry_missing_phones_second_round(enriched_results, api_key, batch_size, task, show_name=None, category_name=None):
+def apply_second_round_retry(enriched_results, retry_results):
     """
-    Second retry round: Only retries companies missing phone numbers (not emails).
     Updates both phone numbers and emails if found during the retry process.
     The key trigger is missing phone numbers only, but emails get updated if found.
     """
-    companies_to_retry = []
-    for result in enriched_results:
-        # Only check for missing phone numbers as the trigger (not emails)
-        if not result.get('phone') or str(result.get('phone', '')).strip() == '':
-            companies_to_retry.append(result.get('company_name'))
-
-    if not companies_to_retry:
-        return enriched_results
-
-    print(f"🔄 Second retry round: Retrying {len(companies_to_retry)} companies missing phone numbers (emails will be updated if found)...")
-    time.sleep(AI_RETRY_SLEEP_SECONDS)
-
-    # Use the same batching/AI logic as enrich_with_ai
-    retry_results = []
-    company_mapping = {name.lower().strip(): name for name in companies_to_retry}
-    for i in range(0, len(companies_to_retry), batch_size):
-        batch = companies_to_retry[i:i + batch_size]
-        batch_mapping = {name.lower().strip(): name for name in batch}
-        
-        # Increment request count for the task
-        task.request_count += 1
-        task.save()
-
-        ai_batch = ai_search_batch(
-            batch,
-            api_key,
-            batch_number=(i // batch_size) + 1,
-            retry_round=3,  # Third round
-            company_mapping=batch_mapping,
-            show_name=show_name,
-            category_name=category_name
-        )
-        if ai_batch:
-            retry_results.extend(ai_batch)
-            # Save the results from the retry batch to the global database
-            save_to_global_database(ai_batch)
-
     # Update the original results with retry data
     # Update phones (the key trigger) and also update emails if found
     retry_map = {result['company_name']: result for result in retry_results}
@@ -802,153 +911,144 @@ def retry_missing_phones_second_round(enriched_results, api_key, batch_size, tas
     return enriched_results
 
 
+# Columns of the results sheet and their widths, the missing ones of the contact columns are highlighted
+EXCEL_COLUMNS = [
+    ('Company Name', 30),
+    ('Phone Number', 20),
+    ('Time Zone', 15),
+    ('Direct / Cell Number', 20),
+    ('Email', 30),
+    ('DM Name', 25),
+]
+EXCEL_HIGHLIGHT_MISSING = [col_num for col_num, (name, _) in enumerate(EXCEL_COLUMNS) if name in ('Phone Number', 'Email', 'Direct / Cell Number')]
+
+
+def excel_row(result):
+    """The cells of one result in EXCEL_COLUMNS order"""
+    key_personnel = result.get("key_personnel") or {}
+
+    # Clean both primary and direct phone numbers
+    primary_phone = clean_phone_number(result.get("phone", ""))
+    direct_phone = clean_phone_number(key_personnel.get("phone", ""))
+
+    # If the numbers are the same, clear the direct phone
+    if primary_phone and direct_phone and primary_phone == direct_phone:
+        direct_phone = ""
+
+    email = result.get("email", "")
+    direct_email = key_personnel.get("email", "")
+
+    dm_name_parts = [
+        str(key_personnel.get("name", "") or ""),
+        str(key_personnel.get("title", "") or "")
+    ]
+    dm_name = "/".join(part for part in dm_name_parts if part)
+
+    return [
+        result.get("company_name"),
+        primary_phone,
+        result.get("time_zone", ""),
+        direct_phone,
+        direct_email if direct_email else email,
+        dm_name,
+    ]
+
+
 def save_excel_for_task(task, enriched_results, sheet_name="Enriched Leads"):
-    """Generate an Excel file in memory and return its content."""
-    
-    # Use the Excel generation logic with proper formatting
+    """
+    Generate an Excel file in memory and return its content.
+    The results are streamed: read once, each row written as it comes in constant_memory mode.
+    """
     buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        # Build output data for Excel
-        output_data = []
-        for result in enriched_results:
-            # Defensive check to ensure 'result' is a dictionary
-            if not isinstance(result, dict):
-                print(f"Warning: Skipping malformed result item: {result}")
-                continue
+    workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(clean_sheet_name(task.excel_sheet_name or sheet_name))
+
+    # Define formats
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#366092',
+        'font_color': 'white',
+        'border': 1,
+        'font_size': 12,
+        'font_name': 'Arial'
+    })
+
+    cell_format = workbook.add_format({
+        'text_wrap': True,
+        'valign': 'top',
+        'border': 1,
+        'font_size': 10,
+        'font_name': 'Arial'
+    })
+
+    missing_format = workbook.add_format({
+        'text_wrap': True,
+        'valign': 'top',
+        'border': 1,
+        'font_size': 10,
+        'font_name': 'Arial',
+        'font_color': '#FF0000',
+        'bg_color': '#FFE6E6'
+    })
+
+    # Set column widths and write headers with formatting
+    for col_num, (column_name, width) in enumerate(EXCEL_COLUMNS):
+        worksheet.set_column(col_num, col_num, width)
+    worksheet.write_row(0, 0, [column_name for column_name, _ in EXCEL_COLUMNS], header_format)
+
+    # Write data rows in order (constant_memory only keeps the current row), counting the summary on the way
+    total_companies = companies_with_phone = companies_with_email = 0
+    for result in enriched_results:
+        # Defensive check to ensure 'result' is a dictionary
+        if not isinstance(result, dict):
+            print(f"Warning: Skipping malformed result item: {result}")
+            continue
 
-            key_personnel = result.get("key_personnel") or {}
+        total_companies += 1
+        companies_with_phone += bool(result.get('phone'))
+        companies_with_email += bool(result.get('email'))
 
-            # Clean both primary and direct phone numbers
-            primary_phone = clean_phone_number(result.get("phone", ""))
-            direct_phone = clean_phone_number(key_personnel.get("phone", ""))
-            
-            # If the numbers are the same, clear the direct phone
-            if primary_phone and direct_phone and primary_phone == direct_phone:
-                direct_phone = ""
+        row = excel_row(result)
+        worksheet.write_row(total_companies, 0, row, cell_format)
 
-            email = result.get("email", "")
-            direct_email = key_personnel.get("email", "")
-            
-            dm_name_parts = [
-                str(key_personnel.get("name", "") or ""),
-                str(key_personnel.get("title", "") or "")
-            ]
-            dm_name = "/".join(part for part in dm_name_parts if part)
-
-            output_data.append({
-                "Company Name": result.get("company_name"),
-                "Phone Number": primary_phone,
-                "Time Zone": result.get("time_zone", ""),
-                "Direct / Cell Number": direct_phone,
-                "Email": direct_email if direct_email else email,
-                "DM Name": dm_name,
-                "_MissingPhone": "MISSING" if not primary_phone else "",
-                "_MissingEmail": "MISSING" if not email else ""
-            })
+        # Highlight missing contact info, still in the current row
+        for col_num in EXCEL_HIGHLIGHT_MISSING:
+            if not row[col_num]:
+                worksheet.write_blank(total_companies, col_num, None, missing_format)
 
-        output_df = pd.DataFrame(output_data)
+    # Add autofilter and freeze header
+    worksheet.autofilter(0, 0, total_companies, len(EXCEL_COLUMNS) - 1)
+    worksheet.freeze_panes(1, 0)
 
-        # Remove flag columns for display
-        columns_to_drop = ['_MissingPhone', '_MissingEmail']
-        display_df = output_df.drop(columns=[col for col in columns_to_drop if col in output_df.columns])
-        
-        # Write data to Excel with proper sheet name
-        sheet_name = clean_sheet_name(task.excel_sheet_name or sheet_name)
-        display_df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, header=False)
-        
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
-        
-        # Define formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'fg_color': '#366092',
-            'font_color': 'white',
-            'border': 1,
-            'font_size': 12,
-            'font_name': 'Arial'
-        })
-        
-        cell_format = workbook.add_format({
-            'text_wrap': True,
-            'valign': 'top',
-            'border': 1,
-            'font_size': 10,
-            'font_name': 'Arial'
-        })
-        
-        missing_format = workbook.add_format({
-            'text_wrap': True,
-            'valign': 'top',
-            'border': 1,
-            'font_size': 10,
-            'font_name': 'Arial',
-            'font_color': '#FF0000',
-            'bg_color': '#FFE6E6'
-        })
-        
-        # Set column widths
-        column_widths = {
-            'Company Name': 30,
-            'Phone Number': 20,
-            'Time Zone': 15,
-            'Email': 30,
-            'DM Name': 25,
-            'Direct / Cell Number': 20,
-            'Contact Email': 30
-        }
-        
-        # Write headers with formatting
-        for col_num, column_name in enumerate(display_df.columns):
-            worksheet.write(0, col_num, column_name, header_format)
-            worksheet.set_column(col_num, col_num, column_widths.get(column_name, 15))
-            
-        # Write data rows with conditional formatting
-        for row_num, (index, row) in enumerate(display_df.iterrows(), start=1):
-            for col_num, value in enumerate(row):
-                if (display_df.columns[col_num] in ['Phone Number', 'Email', 'Direct / Cell Number', 'Contact Email'] 
-                    and not value):
-                    worksheet.write(row_num, col_num, value, missing_format)
-                else:
-                    worksheet.write(row_num, col_num, value, cell_format)
-        
-        # Add autofilter and freeze header
-        worksheet.autofilter(0, 0, len(display_df), len(display_df.columns) - 1)
-        worksheet.freeze_panes(1, 0)
-        
-        # Add summary section
-        total_companies = len(enriched_results)
-        companies_with_phone = len([r for r in enriched_results if isinstance(r, dict) and r.get('phone')])
-        companies_with_email = len([r for r in enriched_results if isinstance(r, dict) and r.get('email')])
-        
-        summary_format = workbook.add_format({'bold': True, 'font_size': 11, 'font_name': 'Arial'})
-        normal_format = workbook.add_format({'font_size': 10, 'font_name': 'Arial'})
-        
-        summary_row = len(display_df) + 3
-        worksheet.write(summary_row, 0, "Data Enrichment Summary:", summary_format)
-        worksheet.write(summary_row + 1, 0, f"Total Companies Processed: {total_companies}", normal_format)
-        worksheet.write(summary_row + 2, 0, f"Companies with Phone: {companies_with_phone} ({(companies_with_phone/total_companies*100) if total_companies else 0:.1f}%)", normal_format)
-        worksheet.write(summary_row + 3, 0, f"Companies with Email: {companies_with_email} ({(companies_with_email/total_companies*100) if total_companies else 0:.1f}%)", normal_format)
+    # Add summary section
+    summary_format = workbook.add_format({'bold': True, 'font_size': 11, 'font_name': 'Arial'})
+    normal_format = workbook.add_format({'font_size': 10, 'font_name': 'Arial'})
+
+    summary_row = total_companies + 3
+    worksheet.write(summary_row, 0, "Data Enrichment Summary:", summary_format)
+    worksheet.write(summary_row + 1, 0, f"Total Companies Processed: {total_companies}", normal_format)
+    worksheet.write(summary_row + 2, 0, f"Companies with Phone: {companies_with_phone} ({(companies_with_phone/total_companies*100) if total_companies else 0:.1f}%)", normal_format)
+    worksheet.write(summary_row + 3, 0, f"Companies with Email: {companies_with_email} ({(companies_with_email/total_companies*100) if total_companies else 0:.1f}%)", normal_format)
 
-        # If the task stored metadata about how many were found locally, include it
+    # If the task stored metadata about how many were found locally, include it
+    local_found = None
+    try:
+        if task and getattr(task, 'results', None) and isinstance(task.results, dict):
+            local_found = task.results.get('local_companies_found')
+    except Exception:
         local_found = None
-        try:
-            if task and getattr(task, 'results', None) and isinstance(task.results, dict):
-                local_found = task.results.get('local_companies_found')
-        except Exception:
-            local_found = None
-
-        if local_found is not None:
-            worksheet.write(summary_row + 4, 0, f"Companies found in local DB: {local_found}", normal_format)
-            worksheet.write(summary_row + 5, 0, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_format)
-        else:
-            worksheet.write(summary_row + 4, 0, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_format)
-        
-        worksheet.set_column(0, 0, 35)  # Set summary column width
 
-    buffer.seek(0)
+    if local_found is not None:
+        worksheet.write(summary_row + 4, 0, f"Companies found in local DB: {local_found}", normal_format)
+        worksheet.write(summary_row + 5, 0, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_format)
+    else:
+        worksheet.write(summary_row + 4, 0, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_format)
+
+    worksheet.set_column(0, 0, 35)  # Set summary column width
+
+    workbook.close()
     return buffer.getvalue()
 
 
@@ -965,7 +1065,7 @@ def clean_sheet_name(name):
 
 # Helper functions #
 
-def parse_gemini_response_cumulative_fix(response_text: str, expected_companies: List[str], company_mapping: Dict[str, str], batch_number: int, retry_round: int) -> List[Dict]:
+def parse_gemini_response_cumulative_fix(response_text: str, expected_companies: List[str], company_mapping: Dict[str, str], batch_number: int, retry_round: int) -> Optional[List[Dict]]:
     """Fixed JSON parsing that only takes the final complete response"""
     
     response_text = response_text.strip()
@@ -980,8 +1080,8 @@ def parse_gemini_response_cumulative_fix(response_text: str, expected_companies:
     if json_objects:
         return validate_and_fix_results(json_objects, expected_companies, company_mapping, batch_number, retry_round)
     
-    # Method 3: Emergency fallback
-    return create_emergency_results(expected_companies, company_mapping)
+    # Nothing parseable: handled like a failed batch, so it is not cached as "nothing found"
+    return None
 
 
 def extract_final_json_array(text: str) -> Optional[List[Dict]]:
@@ -1117,7 +1217,8 @@ def validate_and_fix_results(parsed_results: List[Dict], expected_companies: Lis
                     "phone": None,
                     "time_zone": None,
                     "email": None,
-                    "key_personnel": {"name": None, "phone": None, "title": None, "email": None}
+                    "key_personnel": {"name": None, "phone": None, "title": None, "email": None},
+                    NOT_RETURNED: True,  # The AI left it out, not cached as found nothing
                 })
     
     # Ensure we use original company names
@@ -1132,24 +1233,6 @@ def validate_and_fix_results(parsed_results: List[Dict], expected_companies: Lis
     return valid_results
 
 
-def create_emergency_results(companies: List[str], company_mapping: Dict[str, str]) -> List[Dict]:
-    """Create emergency results when parsing completely fails"""
-    
-    results = []
-    for company in companies:
-        original_name = company_mapping.get(company, company)
-        results.append({
-            "company_name": original_name,
-            "domain": None,
-            "phone": None,
-            "time_zone": None,
-            "email": None,
-            "key_personnel": {"name": None, "phone": None, "title": None, "email": None}
-        })
-    
-    return results
-
-
 def clean_phone_number(phone_str):
     """
     Cleans and formats a phone number string.
@@ -1159,15 +1242,10 @@ def clean_phone_number(phone_str):
     if not phone_str or not isinstance(phone_str, str):
         return ""
 
-    # Remove all non-digit characters
-    digits = re.sub(r'\D', '', phone_str)
+    # Digits only, North American country code '1' already stripped (shared with the LeadPhoneNumbers lookup key)
+    digits = normalize_phone_number(phone_str)
 
-    # Handle North American numbers (country code '1')
-    if len(digits) == 11 and digits.startswith('1'):
-        national_digits = digits[1:]
-        return f"{national_digits[0:3]} {national_digits[3:6]} {national_digits[6:10]}"
-    
-    # Handle 10-digit numbers (likely US/Canada without country code)
+    # Handle 10-digit numbers (US/Canada, with or without country code)
     if len(digits) == 10:
         return f"{digits[0:3]} {digits[3:6]} {digits[6:10]}"
 
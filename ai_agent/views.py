@@ -8,6 +8,7 @@ from django.http import HttpResponse
 from .utils import *
 from django.http import JsonResponse
 from .tasks import enrich_data_task
+from .progress import task_progress
 from django.contrib import messages
 from django.utils import timezone
 from django.core.paginator import Paginator
@@ -50,7 +51,11 @@ def data_enrichment_view(request):
         # Check if it's an AJAX request
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             if form.is_valid():
-                company_names = [name.strip() for name in form.cleaned_data['company_names'].splitlines() if name.strip()]
+                submitted_names = [name.strip() for name in form.cleaned_data['company_names'].splitlines() if name.strip()]
+
+                # Repeated companies are looked up and charged once, and get one row in the workbook
+                company_names = unique_company_names(submitted_names)
+                duplicate_count = len(submitted_names) - len(company_names)
                 
                 # Additional validation: check if list is empty
                 if not company_names:
@@ -79,18 +84,11 @@ def data_enrichment_view(request):
                     }, status=400)
                 
                 # Step A: Perform local database search first (local searches are free)
-                found_local = []
-                not_found_local = []
-                for name in company_names:
-                    try:
-                        res = search_local_database(name)
-                    except Exception:
-                        res = None
-
-                    if res:
-                        found_local.append(res)
-                    else:
-                        not_found_local.append(name)
+                try:
+                    found_local = search_local_database(company_names)
+                except Exception:
+                    found_local = {}
+                not_found_local = [name for name in company_names if name not in found_local]
 
                 not_found_count = len(not_found_local)
 
@@ -112,11 +110,15 @@ def data_enrichment_view(request):
 
                 # Call the Celery task to run in the background and pass number of local companies found
                 category_name = category.name if category else None
-                task = enrich_data_task.delay(company_names, excel_sheet_name, user_id=request.user.id, show_name=show_name, category_name=category_name, local_found_count=len(found_local))
+                task = enrich_data_task.delay(company_names, excel_sheet_name, user_id=request.user.id, show_name=show_name, category_name=category_name, local_found_count=len(company_names) - not_found_count)
                 
+                message = f"Enrichment for {len(company_names)} companies has started."
+                if duplicate_count:
+                    message += f" {duplicate_count} repeated company names were merged into one row each."
+
                 return JsonResponse({
                     'status': 'success', 
-                    'message': f"Enrichment for {len(company_names)} companies has started.", 
+                    'message': message, 
                     'job_id': task.id
                 })
             else:
@@ -156,6 +158,16 @@ def get_enrichment_status(request, task_id):
         return JsonResponse({'status': 'error', 'message': 'Task not found.'}, status=404)
 
 
+@user_passes_test(lambda user: is_in_group(user, "ai_agent"))
+def get_enrichment_progress(request, task_id):
+    """Live progress of one task, its row merged with the counters of its progress hash"""
+    try:
+        task = EnrichmentTask.objects.using('global').get(task_id=task_id)
+    except EnrichmentTask.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Task not found.'}, status=404)
+    return JsonResponse(task_progress(task))
+
+
 def enrichment_results_page(request, task_id):
     """
     This view no longer generates files on-demand. It simply checks the task
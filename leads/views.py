@@ -4,11 +4,13 @@ from django.shortcuts import render, get_object_or_404
 from main.custom_decorators import is_in_group
 from .forms import AutoFillForm, UploadSheetsForm
 from main.utils import get_lead_related_data, get_sheet_name, clean_company_name, filter_companies, send_websocket_message, NOTIFICATIONS_STATES
-from main.models import Sheet, Lead, Notification, LatestSheet, LeadsAverage, LeadContactNames, LeadEmails, LeadPhoneNumbers, Log
+from main.models import Sheet, Lead, Notification, LatestSheet, LeadsAverage, LeadContactNames, LeadEmails, LeadPhoneNumbers
+from main.audit_log import write_log
 import os, pandas as pd, logging, openpyxl
 from django.contrib.auth.decorators import user_passes_test
 from io import BytesIO
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from main.pagination import KeysetPaginator
 from openpyxl.styles import PatternFill
 from django.contrib import messages
 from IBH import settings
@@ -134,17 +136,9 @@ def notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    # Implement pagination
-    page = request.GET.get('page', '')
-    # Show 10 notifications per page
-    paginator = Paginator(notifications_for_user, 5)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 5, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, 'leads/notifications.html', {
         'notifications': notifications_page
@@ -342,7 +336,7 @@ def download_auto_fill_result(request, notification_id):
 
     # Log the autofill result
     logger.info(f"[{request.user.username}] Made an AutoFill Request with {num_leads_total} total leads, {num_leads_autofilled} autofilled from the database.")
-    Log.objects.create(message=f"[{request.user.username}] Made an AutoFill Request with {num_leads_total} total leads, {num_leads_autofilled} autofilled from the database.")
+    write_log(f"[{request.user.username}] Made an AutoFill Request with {num_leads_total} total leads, {num_leads_autofilled} autofilled from the database.")
 
     # Clean up the file and delete the sheet record
     sheet.delete()
@@ -0,0 +1,127 @@
+"""
+Server-side inactivity tracking.
+
+Every open browser tab sends a heartbeat once a minute, saying whether the user did anything since the last
+one, and a heartbeat only touches the cache. Two keys are kept per user: a presence key that expires after
+HEARTBEAT_TTL_SECONDS (twice the heartbeat interval), so it only exists while a tab is open, and the times of the
+last heartbeat and the last activity, kept for LAST_SEEN_TTL_SECONDS. The track_inactivity command runs every
+minute in its own process, so it needs a cache shared between processes. A present user without activity for
+INACTIVITY_THRESHOLD_SECONDS gets an open InactivityInterval starting at their last activity. The first activity
+after the gap closes it; when the user's tabs are closed instead, it is closed at their last heartbeat. All tabs
+of a user share the same keys, so they never produce duplicate entries.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .models import InactivityInterval, Log, SalesLog
+
+HEARTBEAT_INTERVAL_SECONDS = 60     # HEARTBEAT_INTERVAL of templates/layout/base.html
+HEARTBEAT_TTL_SECONDS = 2 * HEARTBEAT_INTERVAL_SECONDS
+LAST_SEEN_TTL_SECONDS = 60 * 60 * 24
+
+
+def presence_key(user_id):
+    return f'present_{user_id}'
+
+
+def activity_key(user_id):
+    return f'last_activity_{user_id}'
+
+
+def record_heartbeat(user_id, active=True):
+    """A tab of the user is open, `active` when the user did something since the tab's last heartbeat."""
+    now = timezone.now().timestamp()
+    last = cache.get(activity_key(user_id)) or {}
+    cache.set(presence_key(user_id), now, HEARTBEAT_TTL_SECONDS)
+    cache.set(activity_key(user_id), {'seen': now, 'active': now if active or 'active' not in last else last['active']}, LAST_SEEN_TTL_SECONDS)
+
+
+def record_logout(user_id):
+    """Logging out is not idling, forget the user's heartbeat and end any interval still open."""
+    cache.delete_many([presence_key(user_id), activity_key(user_id)])
+    InactivityInterval.objects.filter(user_id=user_id, end__isnull=True).update(end=timezone.now())
+
+
+def check_shared_cache():
+    """The heartbeats are written by the web processes and read by the command, a per-process cache never has any."""
+    backend = caches['default']
+    if isinstance(backend, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"Inactivity tracking needs a cache shared between processes, the default cache is {type(backend).__name__}."
+        )
+
+
+def track_inactivity(now=None):
+    """
+    Opens intervals for present users whose last activity is older than the threshold, and closes the open
+    intervals of users who were active since or whose tabs are all closed. Returns (opened, closed) counts.
+    """
+    check_shared_cache()
+    now = now or timezone.now()
+    threshold = timedelta(seconds=settings.INACTIVITY_THRESHOLD_SECONDS)
+
+    def as_datetime(timestamp):
+        return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+    user_ids = list(User.objects.filter(is_active=True).values_list('id', flat=True))
+    heartbeats = cache.get_many([key for user_id in user_ids for key in (presence_key(user_id), activity_key(user_id))])
+    present = {user_id for user_id in user_ids if presence_key(user_id) in heartbeats}
+    last_seen = {
+        user_id: (as_datetime(heartbeats[activity_key(user_id)]['seen']), as_datetime(heartbeats[activity_key(user_id)]['active']))
+        for user_id in user_ids if activity_key(user_id) in heartbeats
+    }
+
+    open_intervals = {interval.user_id: interval for interval in InactivityInterval.objects.filter(end__isnull=True)}
+
+    to_close = []
+    for user_id, interval in open_intervals.items():
+        seen, active = last_seen.get(user_id, (None, None))
+        if active is not None and active > interval.start:
+            interval.end = active
+        elif user_id not in present:
+            # Tabs closed: idle up to the last heartbeat, not until the next visit
+            interval.end = max(seen, interval.start) if seen is not None else interval.start
+        else:
+            continue
+        to_close.append(interval)
+
+    to_open = [
+        InactivityInterval(user_id=user_id, start=active)
+        for user_id, (seen, active) in last_seen.items()
+        if user_id in present and now - active >= threshold
+        and (user_id not in open_intervals or open_intervals[user_id].end is not None)
+    ]
+
+    InactivityInterval.objects.bulk_update(to_close, ['end'], batch_size=1000)
+    InactivityInterval.objects.bulk_create(to_open, batch_size=1000)
+
+    if to_open:
+        write_inactivity_logs(to_open, threshold)
+
+    return len(to_open), len(to_close)
+
+
+def write_inactivity_logs(intervals, threshold):
+    """The Log (and, for sales users, SalesLog) entries the browser used to post, dated when the user went idle."""
+    user_ids = [interval.user_id for interval in intervals]
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    sales_user_ids = set(User.objects.filter(
+        id__in=user_ids, groups__name__in=['sales', 'sales_team_leader']
+    ).values_list('id', flat=True))
+    minutes = int(threshold.total_seconds() // 60)
+
+    Log.objects.bulk_create([
+        Log(message=f"{usernames[interval.user_id]} was inactive for {minutes} minutes", date=interval.start + threshold)
+        for interval in intervals
+    ])
+    SalesLog.objects.bulk_create([
+        SalesLog(message=f"User inactive for {minutes} minutes", date=interval.start + threshold, user_id=interval.user_id)
+        for interval in intervals if interval.user_id in sales_user_ids
+    ])
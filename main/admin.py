@@ -13,6 +13,7 @@ admin.site.register(SalesShow)
 admin.site.register(TerminationCode)
 admin.site.register(LeadTerminationCode)
 admin.site.register(Notification)
+admin.site.register(NotificationPreference)
 admin.site.register(UserLeader)
 admin.site.register(Log)
 admin.site.register(SalesTeams)
@@ -21,5 +22,6 @@ admin.site.register(FilterWords)
 admin.site.register(OldShow)
 admin.site.register(LeadTerminationHistory)
 admin.site.register(TaskLog)
+admin.site.register(InactivityInterval)
 admin.site.register(Credits)
 admin.site.register(CreditHistory)
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Buffered writer for the audit tables (Log and SalesLog).
+
+Request paths queue their entries here instead of inserting them one by one. The queue is flushed with
+bulk_create when AUDIT_LOG_BATCH_SIZE entries are pending, AUDIT_LOG_FLUSH_SECONDS after the first queued
+entry, and when the process exits. With AUDIT_LOG_BUFFERED off (tests, management commands run once) every
+entry is written immediately.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Log, SalesLog
+
+logger = logging.getLogger('custom')
+
+
+class AuditLogWriter:
+    """Thread-safe in-process buffer of unsaved Log and SalesLog rows."""
+
+    def __init__(self, buffered, flush_interval, batch_size):
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {Log: [], SalesLog: []}
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, entry):
+        if not self.buffered:
+            entry.save()
+            return
+
+        with self.lock:
+            self.pending[type(entry)].append(entry)
+            full = sum(len(entries) for entries in self.pending.values()) >= self.batch_size
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush_later)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if full:
+            self.flush()
+
+    def flush_later(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread's connection would otherwise stay open until it is garbage collected
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            batches = [(model, entries) for model, entries in self.pending.items() if entries]
+            self.pending = {Log: [], SalesLog: []}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        for model, entries in batches:
+            try:
+                model.objects.bulk_create(entries)
+            except Exception as e:
+                logger.error(f"Error saving {len(entries)} {model.__name__} entries: {e}")
+
+
+audit_log_writer = AuditLogWriter(
+    buffered=getattr(settings, 'AUDIT_LOG_BUFFERED', False),
+    flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', 2),
+    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 100),
+)
+
+# Entries still pending when a worker shuts down are written before it exits
+atexit.register(audit_log_writer.flush)
+
+
+def write_log(message):
+    """Queues a Log entry, stamped now rather than when the batch is written."""
+    audit_log_writer.add(Log(message=message, date=timezone.now()))
+
+
+def write_sales_log(user, message):
+    """Queues a SalesLog entry for the user, stamped now rather than when the batch is written."""
+    audit_log_writer.add(SalesLog(message=message, date=timezone.now(), user=user))
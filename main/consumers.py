@@ -1,37 +1,116 @@
-import json 
-from channels.generic.websocket import AsyncWebsocketConsumer 
-from django.contrib.auth.models import User 
-from .models import Notification 
+import asyncio
+import atexit
+import json
+import logging
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from .models import Notification
+from .utils import notification_event, save_notifications
+
+logger = logging.getLogger('custom')
+
+RECEIVER_CACHE_TIMEOUT = 300  # seconds
+
+
+async def receiver_exists(receiver_id):
+    """
+    Cached check that a notification receiver exists, the DB is only hit on a cache miss. Only existing receivers
+    are cached, so a user created right after a failed check gets notifications straight away.
+    """
+    cache_key = f'notification_receiver_{receiver_id}'
+    if await cache.aget(cache_key):
+        return True
+
+    exists = await database_sync_to_async(User.objects.filter(id=receiver_id).exists)()
+    if exists:
+        await cache.aset(cache_key, True, RECEIVER_CACHE_TIMEOUT)
+    return exists
+
+
+class NotificationWriteQueue:
+    """
+    Collects notifications created over the websocket and bulk-inserts them at most every `flush_interval`
+    seconds, or as soon as `batch_size` are pending, so the event loop never waits on one INSERT per message.
+    """
+
+    def __init__(self, flush_interval, batch_size):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = []
+        self.flush_task = None
+
+    def add(self, notification):
+        self.pending.append(notification)
+
+        if len(self.pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        try:
+            await database_sync_to_async(save_notifications)(batch)
+        except Exception as e:
+            logger.error(f"Error saving {len(batch)} websocket notifications: {e}")
+
+    def flush_now(self):
+        """Saves what is still pending when the process exits, its event loop is gone by then."""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        try:
+            save_notifications(batch)
+        except Exception as e:
+            logger.error(f"Error saving {len(batch)} websocket notifications on shutdown: {e}")
+
+
+notification_write_queue = NotificationWriteQueue(
+    flush_interval=getattr(settings, 'NOTIFICATION_WRITE_FLUSH_MS', 50) / 1000,
+    batch_size=getattr(settings, 'NOTIFICATION_WRITE_BATCH_SIZE', 500),
+)
+atexit.register(notification_write_queue.flush_now)
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.group_name = f'notifications_{self.scope["user"].id}'
-        await self.channel_layer.group_add(self.group_name, self.channel_name) 
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name) 
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
-        
-        receiver = User.objects.get(id=data['receiver_id']) 
-        
-        notification = Notification.objects.create( 
-            sender=self.scope['user'], 
-            receiver=receiver, 
+        receiver_id = data['receiver_id']
+
+        if not await receiver_exists(receiver_id):
+            logger.warning(f"Websocket notification from user {self.scope['user'].id} to unknown receiver {receiver_id}")
+            return
+
+        # Saved in the next batch, delivery does not wait for the INSERT
+        notification_write_queue.add(Notification(
+            sender_id=self.scope['user'].id,
+            receiver_id=receiver_id,
             message=data['message'],
-            notification_type = 0,
-            )
-        
-        await self.channel_layer.group_send( 
-            f'notifications_{receiver.id}', 
-            { 'type': 'send_notification', 
-            'message': data['message'],
-            'id': data['id'],
-            'read': data['read'],
-            'state': data['state']
-            },
+            notification_type=0,
+        ))
+
+        await self.channel_layer.group_send(
+            f'notifications_{receiver_id}',
+            notification_event(data['id'], data['message'], data['read'], data['state']),
         )
 
     async def send_notification(self, event):
@@ -41,3 +120,12 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 'read': event['read'],
                 'state': event['state']
                 }))
+
+    async def send_notification_batch(self, event):
+        await self.send(text_data=json.dumps({
+                'message': event['message'],
+                'items': event['items'],
+                'id': event['id'],
+                'read': event['read'],
+                'state': event['state']
+                }))
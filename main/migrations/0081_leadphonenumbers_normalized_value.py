@@ -0,0 +1,45 @@
+import re
+
+from django.db import migrations, models
+
+
+def normalize(value):
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        return digits[1:]
+    return digits
+
+
+def forwards_func(apps, schema_editor):
+    LeadPhoneNumbers = apps.get_model('main', 'LeadPhoneNumbers')
+    batch = []
+    for phone in LeadPhoneNumbers.objects.only('id', 'value').iterator(chunk_size=2000):
+        phone.normalized_value = normalize(phone.value)
+        phone.normalized_reversed = phone.normalized_value[::-1]
+        batch.append(phone)
+        if len(batch) >= 2000:
+            LeadPhoneNumbers.objects.bulk_update(batch, ['normalized_value', 'normalized_reversed'])
+            batch = []
+    if batch:
+        LeadPhoneNumbers.objects.bulk_update(batch, ['normalized_value', 'normalized_reversed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0080_sheet_file_binary_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadphonenumbers',
+            name='normalized_value',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='leadphonenumbers',
+            name='normalized_reversed',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
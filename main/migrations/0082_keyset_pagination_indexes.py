@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0081_leadphonenumbers_normalized_value'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['date', 'id'], name='log_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'created_at', 'id'], name='notification_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readyshow',
+            index=models.Index(fields=['label', 'is_done', 'is_archived', 'id'], name='readyshow_label_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesshow',
+            index=models.Index(fields=['label', 'is_archived', 'is_reassigned', 'is_done', 'id'], name='salesshow_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sheet',
+            index=models.Index(fields=['is_archived', 'id'], name='sheet_archived_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0082_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leadphonenumbers',
+            index=models.Index(fields=['sheet', 'lead'], name='leadphone_sheet_lead_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadscolors',
+            index=models.Index(fields=['sheet', 'lead', 'color'], name='leadscolors_sheet_lead_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadterminationcode',
+            index=models.Index(fields=['user', 'flag', 'entry_date'], name='ltc_user_flag_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadterminationcode',
+            index=models.Index(fields=['CB_date', 'flag'], name='ltc_cb_date_flag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadterminationhistory',
+            index=models.Index(fields=['lead', 'termination_code'], name='lth_lead_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'read', 'created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesshow',
+            index=models.Index(fields=['Agent', 'is_done', 'is_recycled', 'is_archived'], name='salesshow_agent_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesshow',
+            index=models.Index(fields=['label', 'Agent', 'is_archived', 'is_x', 'is_reassigned'], name='salesshow_unassigned_idx'),
+        ),
+    ]
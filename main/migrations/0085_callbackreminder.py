@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0084_referral_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallbackReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hourly', 'Due within the hour'), ('daily', 'Due today')], max_length=10)),
+                ('slot', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.lead')),
+                ('sales_show', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.salesshow')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'slot'], name='callbackreminder_slot_idx')],
+                'unique_together': {('lead', 'sales_show', 'kind', 'slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0086_notification_payload_notificationpreference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64)),
+                ('month', models.DateField()),
+                ('file', models.FileField(upload_to='archives/')),
+                ('row_count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['table', 'month'], name='recordarchive_month_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at', 'id'], name='notification_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleslog',
+            index=models.Index(fields=['date', 'id'], name='saleslog_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0090_lead_name_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recordarchive',
+            name='recordarchive_month_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='recordarchive',
+            constraint=models.UniqueConstraint(fields=('table', 'month'), name='recordarchive_month_unique'),
+        ),
+    ]
@@ -18,6 +18,11 @@ class UserLeader(models.Model):
 class Lead(models.Model):
     name = models.CharField(max_length=255, unique=True, db_collation='utf8mb4_general_ci')
     # time_zone = models.CharField(max_length=30, blank=True, null=True)  # Moved to LeadPhoneNumbers
+    name_key = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)  # main.utils.company_name_key, for matching name variants
+
+    def save(self, *args, **kwargs):
+        from .utils import save_with_name_key
+        save_with_name_key(self, super().save, *args, **kwargs)
 
     def __str__(self) -> str:
         return f"{self.name}"   
@@ -38,6 +43,11 @@ class Sheet(models.Model):
     generated_mail_content = models.BinaryField(null=True, blank=True)
     input_file = models.BinaryField(null=True, blank=True)
     generated_file = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_archived', 'id'], name='sheet_archived_id_idx'),     # Archived sheets listing
+        ]
     
     def __str__(self):
         return self.name
@@ -48,9 +58,22 @@ class LeadPhoneNumbers(models.Model):
     sheet = models.ForeignKey(Sheet, on_delete=models.CASCADE)
     value = models.CharField(max_length=255)
     time_zone = models.CharField(max_length=30, blank=True, null=True)
+    normalized_value = models.CharField(max_length=255, blank=True, default='', db_index=True)       # Digits only, used for exact lookups
+    normalized_reversed = models.CharField(max_length=255, blank=True, default='', db_index=True)    # Reversed digits, used for suffix lookups
 
     class Meta:
         unique_together = ('lead', 'sheet', 'value')
+        indexes = [
+            models.Index(fields=['sheet', 'lead'], name='leadphone_sheet_lead_idx'),     # Per-sheet phone lookups
+        ]
+
+    def save(self, *args, **kwargs):
+        from .utils import normalize_phone_number
+        self.normalized_value = normalize_phone_number(self.value)
+        self.normalized_reversed = self.normalized_value[::-1]
+        if kwargs.get('update_fields') is not None and 'value' in kwargs['update_fields']:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'normalized_value', 'normalized_reversed'}
+        super().save(*args, **kwargs)
 
 
 class LeadEmails(models.Model):
@@ -111,6 +134,11 @@ class ReadyShow(models.Model):
     done_date = models.DateTimeField(null=True, blank=True)
     label = models.CharField(max_length=10, choices=LABEL_CHOICES, default='EHUB')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['label', 'is_done', 'is_archived', 'id'], name='readyshow_label_id_idx'),     # Ready / done shows listings
+        ]
+
 
 class SalesShow(models.Model):
     LABEL_CHOICES = [
@@ -138,6 +166,12 @@ class SalesShow(models.Model):
     is_reassigned = models.BooleanField(default=False)
     is_done_reassigned = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['label', 'is_archived', 'is_reassigned', 'is_done', 'id'], name='salesshow_assigned_idx'),     # Assigned shows listing
+            models.Index(fields=['Agent', 'is_done', 'is_recycled', 'is_archived'], name='salesshow_agent_state_idx'),     # Agent's own shows by stage
+            models.Index(fields=['label', 'Agent', 'is_archived', 'is_x', 'is_reassigned'], name='salesshow_unassigned_idx'),     # Unassigned shows listing
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -176,6 +210,10 @@ class LeadTerminationCode(models.Model):
 
     class Meta:
         unique_together = ('lead', 'sales_show', 'flag')
+        indexes = [
+            models.Index(fields=['user', 'flag', 'entry_date'], name='ltc_user_flag_entry_idx'),     # Dashboard counters
+            models.Index(fields=['CB_date', 'flag'], name='ltc_cb_date_flag_idx'),     # Callback reminders
+        ]
 
 
     def save(self, *args, **kwargs):
@@ -201,6 +239,11 @@ class LeadTerminationHistory(models.Model):
     old_show = models.ForeignKey(OldShow, null=True, blank=True, on_delete=models.CASCADE)
     target_user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_leads_history')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['lead', 'termination_code'], name='lth_lead_code_idx'),     # Lead history checks when cutting sheets
+        ]
+
     def clean(self):
         # Ensure only one of sales_show or old_show is set
         if self.sales_show and self.old_show:
@@ -231,17 +274,52 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_accepted = models.BooleanField(default=False)
     sheets = models.ManyToManyField(Sheet, blank=True)
+    payload = models.JSONField(null=True, blank=True)   # Digest rows: the list of merged notification messages
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', 'created_at', 'id'], name='notification_receiver_idx'),     # Per-user notification lists
+            models.Index(fields=['receiver', 'read', 'created_at'], name='notification_unread_idx'),     # Unread counts and badges
+            models.Index(fields=['created_at', 'id'], name='notification_created_idx'),     # Retention
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        notification = super().from_db(db, field_names, values)
+        notification._saved_unread = not notification.read if 'read' in field_names else None
+        return notification
+
+    def save(self, *args, **kwargs):
+        from .utils import adjust_unread_counts
+
+        was_unread = False if self._state.adding else getattr(self, '_saved_unread', None)
+        super().save(*args, **kwargs)
+
+        # Keep the receiver's cached unread counter in step with created and read notifications
+        is_unread = not self.read
+        if was_unread is not None and was_unread != is_unread:
+            adjust_unread_counts({self.receiver_id: 1 if is_unread else -1})
+        self._saved_unread = is_unread
+
+
+# Per-user notification settings, users without a row get the defaults
+class NotificationPreference(models.Model):
+    user = models.OneToOneField(User, related_name='notification_preference', on_delete=models.CASCADE)
+    digest_enabled = models.BooleanField(default=True)     # Merge bursts of same-type notifications into one digest
+    digest_window_minutes = models.PositiveIntegerField(default=60)     # How long an unread digest keeps absorbing new ones
+
+    def __str__(self):
+        return f"Notification preferences of {self.user.username}"
 
 
 class Log(models.Model):
     message = models.CharField(max_length=255)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now)     # Not auto_now_add, buffered entries keep the time they were queued
 
-    def save(self, *args, **kwargs):
-        from IBH.settings import TIME_ZONE 
-        cairo_tz = pytz.timezone(TIME_ZONE)
-        self.date = timezone.localtime(timezone.now(), cairo_tz)
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='log_date_id_idx'),     # Logs listing and retention
+        ]
 
 
 class LatestSheet(models.Model):
@@ -299,6 +377,12 @@ class Referral(models.Model):
     sheet = models.ForeignKey(Sheet, on_delete=models.SET_NULL, null=True)
     entry_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['lead', 'sheet', 'entry_date', 'id'], name='referral_latest_idx'),     # Latest referral per (lead, sheet)
+            models.Index(fields=['entry_date', 'id'], name='referral_entry_date_idx'),     # Referrals listing
+        ]
+
 
 class LeadsColors(models.Model):
     COLOR_CHOICES = [
@@ -312,15 +396,41 @@ class LeadsColors(models.Model):
     sheet = models.ForeignKey(Sheet, on_delete=models.SET_NULL, null=True)
     color = models.CharField(max_length=10, choices=COLOR_CHOICES, default='white')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sheet', 'lead', 'color'], name='leadscolors_sheet_lead_idx'),     # Red / blue lead checks per sheet
+        ]
+
     def __str__(self):
         return f"{self.lead.name} - {self.get_color_display()}"
 
 
 class SalesLog(models.Model):
     message = models.CharField(max_length=255)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now)     # Not auto_now_add, buffered entries keep the time they were queued
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='saleslog_date_id_idx'),     # Retention
+        ]
+
+
+# A stretch without any activity in the user's open browser tabs, built by main.activity
+class InactivityInterval(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inactivity_intervals')
+    start = models.DateTimeField()     # Last activity before the gap
+    end = models.DateTimeField(null=True, blank=True)     # First activity after the gap (last heartbeat if the tabs were closed), empty while still idle
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start'], name='inactivity_user_start_idx'),
+            models.Index(fields=['end'], name='inactivity_end_idx'),     # Open intervals
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} idle from {self.start} to {self.end or 'now'}"
+
 
 class IncomingsCount(models.Model):
     date = models.DateTimeField(auto_now_add=True)
@@ -335,6 +445,43 @@ class TaskLog(models.Model):
         return self.task_name
 
 
+# One row per callback reminder sent, so overlapping runs never notify twice for the same (lead, show, hour)
+class CallbackReminder(models.Model):
+    KIND_CHOICES = [
+        ('hourly', 'Due within the hour'),
+        ('daily', 'Due today'),
+    ]
+
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE)
+    sales_show = models.ForeignKey(SalesShow, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    slot = models.DateTimeField()   # CB_date truncated to the hour
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('lead', 'sales_show', 'kind', 'slot')
+        indexes = [
+            models.Index(fields=['kind', 'slot'], name='callbackreminder_slot_idx'),
+        ]
+
+
+# A compressed export of one month of an append-only table, written by main.retention before the rows are deleted
+class RecordArchive(models.Model):
+    table = models.CharField(max_length=64)
+    month = models.DateField()     # First day of the archived month (UTC)
+    file = models.FileField(upload_to='archives/')
+    row_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'month'], name='recordarchive_month_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.table} {self.month:%Y-%m}"
+
+
 
 class Credits(models.Model):
     # Remove current_balance from here since we'll calculate it dynamically
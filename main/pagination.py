@@ -0,0 +1,221 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+# Query parameters owned by the paginator, dropped when building page links
+CURSOR_PARAMS = ('after', 'before', 'last', 'page')
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) paginator for listings over large, ever-growing tables.
+
+    Instead of OFFSET it filters on the ordering keys of the last row shown, so every page costs the
+    same no matter how deep it is. `ordering` must end with a unique, non-null key (normally 'id'),
+    e.g. ('-id',) or ('-date', '-id'), and should be backed by an index in the same order.
+
+    `count` controls the total shown on the page:
+        None          - no count query at all
+        'exact'       - a plain COUNT(*)
+        'approximate' - the table statistics for unfiltered listings on MySQL, otherwise a count
+                        capped at `count_cap` rows
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-id',), count=None, count_cap=1000):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_mode = count
+        self.count_cap = count_cap
+
+        model_meta = queryset.model._meta
+        self.keys = []
+        for key in self.ordering:
+            name = key.lstrip('-')
+            field = model_meta.pk if name == 'pk' else model_meta.get_field(name)
+            self.keys.append((field, key.startswith('-')))
+
+    def get_page(self, params):
+        """
+        Returns the page selected by `params` (normally request.GET): `after` / `before` carry a cursor,
+        `last` jumps to the final page. A missing or tampered cursor falls back to the first page.
+        """
+        after = self.decode_cursor(params.get('after'))
+        before = self.decode_cursor(params.get('before'))
+
+        if before is not None:
+            rows = self.fetch(before, backwards=True)
+            has_previous = len(rows) > self.per_page
+            page = KeysetPage(self, rows[:self.per_page][::-1], params, has_previous=has_previous, has_next=True)
+        elif params.get('last'):
+            rows = self.fetch(None, backwards=True)
+            has_previous = len(rows) > self.per_page
+            page = KeysetPage(self, rows[:self.per_page][::-1], params, has_previous=has_previous, has_next=False)
+        else:
+            rows = self.fetch(after, backwards=False)
+            has_next = len(rows) > self.per_page
+            page = KeysetPage(self, rows[:self.per_page], params, has_previous=after is not None, has_next=has_next)
+
+        # The rows around a cursor can be deleted between requests, start over rather than show an empty page
+        if not page.object_list and (after is not None or before is not None):
+            rows = self.fetch(None, backwards=False)
+            page = KeysetPage(self, rows[:self.per_page], params,
+                              has_previous=False, has_next=len(rows) > self.per_page)
+
+        return page
+
+    def fetch(self, cursor, backwards):
+        """Fetches one row more than a page so the caller knows whether another page follows."""
+        queryset = self.queryset
+        if cursor is not None:
+            queryset = queryset.filter(self.cursor_filter(cursor, backwards))
+
+        ordering = []
+        for field, descending in self.keys:
+            # Walking backwards reads the same index in the opposite direction
+            ordering.append(field.name if descending == backwards else f'-{field.name}')
+
+        return list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+    def cursor_filter(self, cursor, backwards):
+        """
+        Builds the row-value comparison `(k1, k2, ...) < (v1, v2, ...)` as
+        k1 < v1 OR (k1 = v1 AND k2 < v2) OR ..., with the operator flipped per key direction.
+        """
+        condition = Q()
+        equal_so_far = {}
+        for (field, descending), value in zip(self.keys, cursor):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal_so_far, **{f'{field.name}__{lookup}': value})
+            equal_so_far[field.name] = value
+        return condition
+
+    def encode_cursor(self, row):
+        values = []
+        for field, _ in self.keys:
+            value = getattr(row, field.attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        if not token:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                return None
+            return [field.to_python(value) for (field, _), value in zip(self.keys, values)]
+        except (ValueError, TypeError, ValidationError, binascii.Error):
+            return None
+
+    def count(self):
+        """Returns (count, label) where label is how the total is shown, or (None, None) when counting is disabled."""
+        if self.count_mode == 'exact':
+            count = self.queryset.count()
+            return count, f'{count}'
+
+        if self.count_mode == 'approximate':
+            queryset = self.queryset
+            connection = connections[queryset.db]
+
+            # Unfiltered listings can use InnoDB's row estimate instead of scanning the table
+            if connection.vendor == 'mysql' and not queryset.query.where:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                        [queryset.model._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] is not None:
+                    return row[0], f'~{row[0]}'
+
+            capped = queryset.order_by()[:self.count_cap + 1].count()
+            if capped > self.count_cap:
+                return self.count_cap, f'{self.count_cap}+'
+            return capped, f'{capped}'
+
+        return None, None
+
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator. Exposes the same has_previous / has_next / has_other_pages API as
+    Django's Page, plus ready-made query strings for the first, previous, next and last pages that keep
+    every other GET parameter (search terms, filters) intact.
+    """
+
+    def __init__(self, paginator, object_list, params, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+        base_params = params.copy()
+        for param in CURSOR_PARAMS:
+            base_params.pop(param, None)
+        self.base_params = base_params
+
+        self._count = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def _query(self, **cursor):
+        params = self.base_params.copy()
+        for key, value in cursor.items():
+            params[key] = value
+        return f'?{params.urlencode()}'
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def previous_query(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self._query(before=self.paginator.encode_cursor(self.object_list[0]))
+
+    @property
+    def next_query(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self._query(after=self.paginator.encode_cursor(self.object_list[-1]))
+
+    @property
+    def last_query(self):
+        return self._query(last='1')
+
+    def _load_count(self):
+        if self._count is None:
+            self._count = self.paginator.count()
+        return self._count
+
+    @property
+    def count(self):
+        return self._load_count()[0]
+
+    @property
+    def count_label(self):
+        return self._load_count()[1]
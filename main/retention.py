@@ -0,0 +1,267 @@
+"""
+Retention for the append-only tables (Log, SalesLog, Notification).
+
+Rows older than the configured age are exported a calendar month at a time into gzipped CSV files
+(RecordArchive, downloadable by administrators) and then deleted in batches. Months are UTC months and
+only whole months are archived, so every month ends up in one file, also when a run stopped before deleting it.
+Notification's sheets are kept as a column of space separated Sheet ids.
+
+Log can optionally be RANGE partitioned by month on MySQL (LOG_PARTITIONING), archived months are then
+dropped as a partition instead of being deleted row by row. SalesLog and Notification have foreign keys,
+which InnoDB does not allow on partitioned tables, so they are always deleted in batches.
+"""
+import csv
+import gzip
+import io
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Log, SalesLog, Notification, RecordArchive
+from .utils import adjust_unread_counts
+
+
+# Name used in settings.RECORD_RETENTION_DAYS -> (model, date field)
+RETAINED_TABLES = {
+    'log': (Log, 'date'),
+    'sales_log': (SalesLog, 'date'),
+    'notification': (Notification, 'created_at'),
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def retention_cutoff(days, now=None):
+    """Start of the month that contains the retention boundary, everything before it is archived."""
+    return month_start((now or timezone.now()) - timedelta(days=days))
+
+
+def months_to_archive(model, date_field, cutoff):
+    """The months (as their first instant) that still have rows older than the cutoff, oldest first."""
+    oldest = model.objects.filter(**{f'{date_field}__lt': cutoff}).order_by(date_field).values_list(date_field, flat=True).first()
+    if oldest is None:
+        return []
+
+    months = []
+    month = month_start(oldest)
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def archive_columns(model):
+    """The CSV header: the concrete fields (id first), then the many-to-many fields like Notification.sheets"""
+    return [field.attname for field in model._meta.concrete_fields] + [field.name for field in model._meta.many_to_many]
+
+
+def export_rows(model, rows, skip_ids=()):
+    """
+    Yields the rows' values in archive_columns order, EXPORT_CHUNK_SIZE rows per query. Many-to-many fields
+    are written as their space separated ids. Rows whose id (as a string) is in `skip_ids` are left out.
+    """
+    columns = [field.attname for field in model._meta.concrete_fields]
+    many_to_many = model._meta.many_to_many
+
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id).order_by('id').values_list(*columns)[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+
+        linked = []
+        for field in many_to_many:
+            source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+            links = {}
+            for row_id, related_id in field.remote_field.through.objects.filter(**{f'{source}__in': [row[0] for row in chunk]}).order_by(target).values_list(source, target):
+                links.setdefault(row_id, []).append(str(related_id))
+            linked.append(links)
+
+        for row in chunk:
+            if str(row[0]) not in skip_ids:
+                yield [*row, *(' '.join(links.get(row[0], [])) for links in linked)]
+
+
+def read_archive(archive):
+    """Yields the data rows of an archive file, as strings"""
+    with archive.file.open('rb') as stored, gzip.GzipFile(fileobj=stored, mode='rb') as compressed:
+        reader = csv.reader(io.TextIOWrapper(compressed, encoding='utf-8', newline=''))
+        next(reader, None)
+        yield from reader
+
+
+def export_month(name, model, date_field, month):
+    """
+    Writes the month's rows to its gzipped CSV RecordArchive. Returns it, or None when the month is empty.
+    When a run died between exporting and deleting the month, its archive is rewritten with the rows it does not
+    have yet added, so the month stays in one file.
+    """
+    rows = model.objects.filter(**{f'{date_field}__gte': month, f'{date_field}__lt': next_month(month)})
+    archive = RecordArchive.objects.filter(table=name, month=month.date()).first()
+
+    buffer = io.BytesIO()
+    row_count = added = 0
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(archive_columns(model))
+
+        archived_ids = set()
+        if archive:
+            for row in read_archive(archive):
+                writer.writerow(row)
+                archived_ids.add(row[0])
+                row_count += 1
+
+        for row in export_rows(model, rows, archived_ids):
+            writer.writerow(row)
+            added += 1
+        text.flush()
+        text.detach()
+
+    if not added:
+        return archive
+
+    if archive is None:
+        archive = RecordArchive(table=name, month=month.date())
+    old_file = archive.file.name
+    archive.row_count = row_count + added
+    archive.file.save(f'{name}_{month:%Y_%m}.csv.gz', ContentFile(buffer.getvalue()), save=False)
+    archive.save()
+    if old_file:
+        archive.file.storage.delete(old_file)
+    return archive
+
+
+def delete_month(model, date_field, month, batch_size):
+    """Deletes the month's rows in primary key batches so no single statement locks the table for long."""
+    rows = model.objects.filter(**{f'{date_field}__gte': month, f'{date_field}__lt': next_month(month)})
+
+    deleted = 0
+    while True:
+        if model is Notification:
+            batch = list(rows.values_list('id', 'receiver_id', 'read')[:batch_size])
+            ids = [notification_id for notification_id, _, _ in batch]
+        else:
+            ids = list(rows.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+
+        with transaction.atomic(using=router.db_for_write(model)):
+            model.objects.filter(id__in=ids).delete()
+            if model is Notification:
+                # Old unread notifications disappear from the badge as well
+                unread = Counter(receiver_id for _, receiver_id, read in batch if not read)
+                adjust_unread_counts({receiver_id: -count for receiver_id, count in unread.items()})
+        deleted += len(ids)
+
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def table_partitions(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+            [table]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def month_partitions(months):
+    return ', '.join(
+        f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{next_month(month):%Y-%m-%d}'))"
+        for month in months
+    )
+
+
+def ensure_log_partitions(months_ahead=3):
+    """
+    Makes sure Log is RANGE partitioned by month up to `months_ahead` months from now (MySQL only).
+    The first run converts the table, which needs (id, date) as the primary key because MySQL requires
+    the partitioning column in every unique key. Returns the names of the partitions that were added.
+    """
+    connection = connections[router.db_for_write(Log)]
+    if connection.vendor != 'mysql':
+        raise ImproperlyConfigured(f'LOG_PARTITIONING is only supported on MySQL, not {connection.vendor}')
+
+    table = connection.ops.quote_name(Log._meta.db_table)
+    existing = table_partitions(connection, Log._meta.db_table)
+
+    current = month_start(timezone.now())
+    wanted = [current]
+    for _ in range(months_ahead):
+        wanted.append(next_month(wanted[-1]))
+
+    with connection.cursor() as cursor:
+        if not existing:
+            oldest = Log.objects.order_by('date').values_list('date', flat=True).first()
+            months = [month_start(oldest)] if oldest and month_start(oldest) < current else []
+            while months and next_month(months[-1]) < current:
+                months.append(next_month(months[-1]))
+            months += wanted
+
+            cursor.execute(
+                f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, date) "
+                f"PARTITION BY RANGE (TO_DAYS(date)) ({month_partitions(months)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+            return [partition_name(month) for month in months]
+
+        missing = [month for month in wanted if partition_name(month) not in existing]
+        if missing:
+            cursor.execute(
+                f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                f"({month_partitions(missing)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+        return [partition_name(month) for month in missing]
+
+
+def drop_log_partition(month):
+    """Drops the month's Log partition if the table is partitioned. Returns whether it did."""
+    connection = connections[router.db_for_write(Log)]
+    if connection.vendor != 'mysql' or partition_name(month) not in table_partitions(connection, Log._meta.db_table):
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {connection.ops.quote_name(Log._meta.db_table)} DROP PARTITION {partition_name(month)}")
+    return True
+
+
+def archive_old_records(retention_days, batch_size=5000, dry_run=False, now=None):
+    """
+    Archives and deletes every table's rows older than its retention age ({name: days}, see RETAINED_TABLES).
+    Yields (name, month, archived row count, deleted row count) per processed month.
+    """
+    for name, days in retention_days.items():
+        model, date_field = RETAINED_TABLES[name]
+
+        for month in months_to_archive(model, date_field, retention_cutoff(days, now)):
+            if dry_run:
+                count = model.objects.filter(**{f'{date_field}__gte': month, f'{date_field}__lt': next_month(month)}).count()
+                yield name, month, count, 0
+                continue
+
+            archive = export_month(name, model, date_field, month)
+            archived = archive.row_count if archive else 0
+
+            if model is Log and drop_log_partition(month):
+                deleted = archived
+            else:
+                deleted = delete_month(model, date_field, month, batch_size)
+            yield name, month, archived, deleted
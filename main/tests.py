@@ -1,3 +1,292 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .activity import record_heartbeat, track_inactivity, check_shared_cache, presence_key
+from .consumers import NotificationWriteQueue, receiver_exists
+from .pagination import KeysetPaginator
+from .retention import archive_old_records, ensure_log_partitions, export_month, read_archive
+from .models import InactivityInterval, Lead, LeadPhoneNumbers, Log, Notification, RecordArchive, Sheet
+from .utils import (phone_number_lookup, is_phone_search, normalize_phone_number, get_unread_count, unread_count_key,
+                    UNREAD_COUNT_TTL, mark_notifications_read, reconcile_unread_counts, save_notifications, company_name_key)
+
+
+class PhoneNumberLookupTests(TestCase):
+    def setUp(self):
+        sheet = Sheet.objects.create(name='Sheet')
+        for name, value in [('Acme', '(216) 555-1234'), ('Beta', '+1 310 555 9876'), ('Gamma', '+44 20 7946 0958')]:
+            LeadPhoneNumbers.objects.create(lead=Lead.objects.create(name=name), sheet=sheet, value=value)
+
+    def matching_leads(self, query):
+        return set(LeadPhoneNumbers.objects.filter(phone_number_lookup(query)).values_list('lead__name', flat=True))
+
+    def test_normalize_drops_north_american_country_code(self):
+        self.assertEqual(normalize_phone_number('+1 (216) 555-1234'), '2165551234')
+        self.assertEqual(normalize_phone_number('216.555.1234'), '2165551234')
+        self.assertEqual(normalize_phone_number('+44 20 7946 0958'), '442079460958')
+
+    def test_matches_full_number_in_any_format(self):
+        self.assertEqual(self.matching_leads('1-216-555-1234'), {'Acme'})
+        self.assertEqual(self.matching_leads('310 555 9876'), {'Beta'})
+
+    def test_matches_number_ending(self):
+        self.assertEqual(self.matching_leads('555-1234'), {'Acme'})
+        self.assertEqual(self.matching_leads('7946 0958'), {'Gamma'})
+
+    def test_no_digits_is_no_lookup(self):
+        self.assertIsNone(phone_number_lookup('Acme'))
+
+    def test_only_phone_like_queries_are_phone_searches(self):
+        self.assertTrue(is_phone_search('555-1234'))
+        self.assertTrue(is_phone_search('+1 (216) 555-1234'))
+        self.assertFalse(is_phone_search('3M'))
+        self.assertFalse(is_phone_search('Acme 2'))
+        self.assertFalse(is_phone_search('1234'))
+
+
+class CompanyNameKeyTests(TestCase):
+    def test_variants_share_a_key(self):
+        self.assertEqual(company_name_key('Acme Inc.'), 'acme')
+        self.assertEqual(company_name_key('ACME, Inc'), 'acme')
+        self.assertEqual(company_name_key('  Smith & Sons LLC '), 'smith and sons')
+
+    def test_suffix_must_be_a_word_of_its_own(self):
+        self.assertNotEqual(company_name_key('Zinc'), company_name_key('Z'))
+        self.assertNotEqual(company_name_key('Costco'), company_name_key('Cost'))
+        self.assertEqual(company_name_key('Telco'), 'telco')
+        self.assertEqual(company_name_key('Inc'), '')
+
+    def test_rekey_replaces_stale_keys(self):
+        zinc = Lead.objects.create(name='Zinc')
+        Lead.objects.filter(id=zinc.id).update(name_key='z')
+        call_command('backfill_company_name_keys', '--rekey', '--only', 'lead', stdout=StringIO())
+        self.assertEqual(Lead.objects.get(id=zinc.id).name_key, 'zinc')
+        self.assertEqual(Lead.objects.create(name='Z').name_key, 'z')
+
+    def test_new_lead_gets_its_key(self):
+        self.assertEqual(Lead.objects.create(name='Acme Inc.').name_key, 'acme')
+
+    def test_variant_of_a_keyed_name_is_saved_without_a_key(self):
+        Lead.objects.create(name='Acme Inc.')
+        variant = Lead.objects.create(name='ACME, Inc')
+        self.assertIsNone(Lead.objects.get(id=variant.id).name_key)
+
+    def test_updates_keep_the_key(self):
+        lead = Lead.objects.create(name='Acme Inc.')
+        lead.name = 'Acme Corporation'
+        lead.save()
+        self.assertEqual(Lead.objects.get(id=lead.id).name_key, 'acme')
+
+
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+
+    def notify(self, count=1):
+        return [Notification.objects.create(sender=self.sender, receiver=self.receiver, message='Hi', notification_type=0) for _ in range(count)]
+
+    def test_counts_from_the_database_and_caches_with_a_ttl(self):
+        self.notify(2)
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            self.assertEqual(get_unread_count(self.receiver.id), 2)
+        add.assert_called_once_with(unread_count_key(self.receiver.id), 2, UNREAD_COUNT_TTL)
+        self.assertEqual(cache.get(unread_count_key(self.receiver.id)), 2)
+
+    def test_counter_follows_created_and_read_notifications(self):
+        self.assertEqual(get_unread_count(self.receiver.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications = self.notify(3)
+            save_notifications([Notification(sender=self.sender, receiver=self.receiver, message='Bulk', notification_type=0)])
+        self.assertEqual(get_unread_count(self.receiver.id), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[0].read = True
+            notifications[0].save()
+            mark_notifications_read(self.receiver.id, [notifications[1].id])
+        self.assertEqual(get_unread_count(self.receiver.id), 2)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.notify(2)
+        cache.set(unread_count_key(self.receiver.id), 7)
+        self.assertGreaterEqual(reconcile_unread_counts(), 1)
+        self.assertEqual(get_unread_count(self.receiver.id), 2)
+
+
+@override_settings(INACTIVITY_THRESHOLD_SECONDS=300)
+@mock.patch('main.activity.check_shared_cache')
+class InactivityTrackingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='agent')
+        self.start = timezone.now()
+
+    def heartbeat(self, minutes, active=True):
+        with mock.patch('django.utils.timezone.now', return_value=self.start + timedelta(minutes=minutes)):
+            record_heartbeat(self.user.id, active=active)
+
+    def track(self, minutes):
+        return track_inactivity(now=self.start + timedelta(minutes=minutes))
+
+    def test_idle_open_tab_opens_an_interval_at_the_last_activity(self, check):
+        self.heartbeat(0)
+        for minute in range(1, 7):
+            self.heartbeat(minute, active=False)
+        self.assertEqual(self.track(6), (1, 0))
+        interval = InactivityInterval.objects.get(user=self.user)
+        self.assertEqual((interval.start, interval.end), (self.start, None))
+        self.assertEqual(self.track(7), (0, 0))
+
+    def test_activity_closes_the_interval(self, check):
+        self.heartbeat(0)
+        self.heartbeat(6, active=False)
+        self.track(6)
+        self.heartbeat(8)
+        self.assertEqual(self.track(8), (0, 1))
+        self.assertEqual(InactivityInterval.objects.get(user=self.user).end, self.start + timedelta(minutes=8))
+
+    def test_closed_tabs_end_the_interval_at_the_last_heartbeat(self, check):
+        self.heartbeat(0)
+        self.heartbeat(6, active=False)
+        self.track(6)
+        self.heartbeat(7, active=False)
+        cache.delete(presence_key(self.user.id))     # Expired, no tab sends heartbeats anymore
+        self.assertEqual(self.track(10), (0, 1))
+        self.assertEqual(InactivityInterval.objects.get(user=self.user).end, self.start + timedelta(minutes=7))
+
+    def test_users_without_open_tabs_are_not_idle(self, check):
+        self.heartbeat(0)
+        cache.delete(presence_key(self.user.id))
+        self.assertEqual(self.track(30), (0, 0))
+
+    def test_needs_a_shared_cache(self, check):
+        # The tests run on the per-process locmem cache
+        self.assertRaises(ImproperlyConfigured, check_shared_cache)
+
+
+class NotificationWriteQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create(username='sender')
+
+    def test_shutdown_flush_saves_pending_notifications(self):
+        queue = NotificationWriteQueue(flush_interval=60, batch_size=100)
+        queue.pending = [Notification(sender=self.sender, receiver=self.sender, message='Hi', notification_type=0)]
+        queue.flush_now()
+        self.assertEqual((queue.pending, Notification.objects.count()), ([], 1))
+
+
+class ReceiverExistsTests(TransactionTestCase):
+    # database_sync_to_async closes old connections, which a TestCase's open transaction does not survive
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_receivers_are_not_cached(self):
+        self.assertFalse(async_to_sync(receiver_exists)(1))
+        User.objects.create(id=1, username='late')
+        self.assertTrue(async_to_sync(receiver_exists)(1))
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='receiver')
+        notifications = [Notification.objects.create(sender=user, receiver=user, message=f'{i}', notification_type=0) for i in range(7)]
+        # Pairs share a timestamp, so the pages have to break ties on id
+        start = timezone.now()
+        for i, notification in enumerate(notifications):
+            Notification.objects.filter(id=notification.id).update(created_at=start + timedelta(minutes=i // 2))
+        self.paginator = KeysetPaginator(Notification.objects.all(), 3, ordering=('-created_at', '-id'))
+
+    def page(self, query=''):
+        page = self.paginator.get_page(QueryDict(query))
+        return page, [notification.message for notification in page]
+
+    def test_next_pages(self):
+        page, messages = self.page('search=hi')
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['6', '5', '4'], False, True))
+
+        page, messages = self.page(page.next_query[1:])
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['3', '2', '1'], True, True))
+        self.assertIn('search=hi', page.next_query)
+
+        page, messages = self.page(page.next_query[1:])
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['0'], True, False))
+        self.assertIsNone(page.next_query)
+
+    def test_previous_pages(self):
+        page, messages = self.page('last=1')
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['2', '1', '0'], True, False))
+
+        page, messages = self.page(page.previous_query[1:])
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['5', '4', '3'], True, True))
+
+        page, messages = self.page(page.previous_query[1:])
+        self.assertEqual((messages, page.has_previous(), page.has_next()), (['6'], False, True))
+        self.assertIsNone(page.previous_query)
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        self.assertEqual(self.page('after=not-a-cursor')[1], ['6', '5', '4'])
+
+    def test_exact_count(self):
+        paginator = KeysetPaginator(Notification.objects.all(), 3, count='exact')
+        self.assertEqual(paginator.get_page(QueryDict()).count_label, '7')
+
+
+class RetentionTests(TestCase):
+    month = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(username='receiver')
+        for day in range(1, 4):
+            Log.objects.create(message=f'{day}', date=self.month + timedelta(days=day))
+
+    def archive(self):
+        return list(archive_old_records({'log': 30}, now=self.month + timedelta(days=75)))
+
+    def test_month_is_archived_and_deleted(self):
+        self.assertEqual(self.archive(), [('log', self.month, 3, 3)])
+        archive = RecordArchive.objects.get()
+        self.assertEqual([row[1] for row in read_archive(archive)], ['1', '2', '3'])
+        self.assertFalse(Log.objects.exists())
+
+    def test_rerun_after_a_failed_delete_keeps_one_archive(self):
+        export_month('log', Log, 'date', self.month)
+        # The run died while deleting, one row went and a late one came in
+        Log.objects.filter(message='1').delete()
+        Log.objects.create(message='4', date=self.month + timedelta(days=4))
+
+        self.assertEqual(self.archive(), [('log', self.month, 4, 3)])
+        archive = RecordArchive.objects.get()
+        self.assertEqual((archive.row_count, [row[1] for row in read_archive(archive)]), (4, ['1', '2', '3', '4']))
+        self.assertEqual(os.listdir(os.path.dirname(archive.file.path)), [os.path.basename(archive.file.path)])
+
+    def test_notification_sheets_are_exported(self):
+        sheets = [Sheet.objects.create(name=f'Sheet {i}') for i in range(2)]
+        notification = Notification.objects.create(sender=self.user, receiver=self.user, message='Hi', notification_type=0)
+        notification.sheets.set(sheets)
+        Notification.objects.create(sender=self.user, receiver=self.user, message='No sheets', notification_type=0)
+        Notification.objects.update(created_at=self.month)
+
+        archive = export_month('notification', Notification, 'created_at', self.month)
+        self.assertEqual([row[-1] for row in read_archive(archive)], [f'{sheets[0].id} {sheets[1].id}', ''])
+
+    def test_partitioning_needs_mysql(self):
+        self.assertRaises(ImproperlyConfigured, ensure_log_partitions)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import index, login_view, logout_view, sheet_list, log_inactivity
+from .views import index, login_view, logout_view, sheet_list, heartbeat
 
 app_name="main"
 
@@ -9,5 +9,5 @@ urlpatterns = [
     path("login/", login_view, name="login"),
     path("logout/", logout_view, name="logout"),
     path('api/sheets/', sheet_list, name='sheet-list'),
-    path('log-inactivity/', log_inactivity, name='log_inactivity'),
+    path('heartbeat/', heartbeat, name='heartbeat'),
 ]
\ No newline at end of file
@@ -1,7 +1,17 @@
 import re, math
-from main.models import LeadContactNames, LeadEmails, LeadPhoneNumbers, FilterType, FilterWords
+import asyncio
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from main.models import (LeadContactNames, LeadEmails, LeadPhoneNumbers, FilterType, FilterWords, LeadTerminationCode,
+                         TerminationCode, Notification, NotificationPreference, UserLeader, TaskLog, CallbackReminder)
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
 
 
 NOTIFICATIONS_STATES = {
@@ -11,18 +21,294 @@ NOTIFICATIONS_STATES = {
     'ERROR': 'ERROR'
 }
 
+def notification_event(notification_id, message, read, notification_state):
+    """The websocket event handled by NotificationConsumer.send_notification."""
+    return {
+        'type': 'send_notification',
+        'message': message,
+        'id': notification_id,
+        'read': read,
+        'state': notification_state
+    }
+
+
+def notification_batch_event(notification_id, message, items, read, notification_state):
+    """The websocket event handled by NotificationConsumer.send_notification_batch, it carries a digest's items."""
+    return {
+        'type': 'send_notification_batch',
+        'message': message,
+        'items': items,
+        'id': notification_id,
+        'read': read,
+        'state': notification_state
+    }
+
+
+def notification_push(notification, notification_state=NOTIFICATIONS_STATES['INFO']):
+    """The websocket event for a saved notification, digests are pushed with their items."""
+    if notification.payload:
+        return notification_batch_event(notification.id, notification.message, notification.payload,
+                                        notification.read, notification_state)
+    return notification_event(notification.id, notification.message, notification.read, notification_state)
+
+
+def digest_message(notification_type, count):
+    return f"{count} new {dict(Notification.NOTIFICATION_TYPES)[notification_type]} notifications"
+
+
+def coalesce_notifications(notifications):
+    """
+    Merges unsaved notifications of the same type to the same receiver into digest rows, for receivers with
+    digests enabled. They join the receiver's open digest of that type (unread and younger than the receiver's
+    digest window) when there is one, otherwise two or more of them become a new digest.
+
+    Returns (to_create, to_update): notifications to bulk_create, and open digests whose message and payload
+    were extended in place and need a bulk_update of those two fields.
+    """
+    now = timezone.now()
+    preferences = {
+        preference.user_id: preference
+        for preference in NotificationPreference.objects.filter(user_id__in={n.receiver_id for n in notifications})
+    }
+
+    def preference_of(user_id):
+        return preferences.get(user_id) or NotificationPreference(user_id=user_id)
+
+    to_create = []
+    groups = {}
+    for notification in notifications:
+        if preference_of(notification.receiver_id).digest_enabled:
+            groups.setdefault((notification.receiver_id, notification.notification_type), []).append(notification)
+        else:
+            to_create.append(notification)
+
+    if not groups:
+        return to_create, []
+
+    longest_window = max(preference_of(receiver_id).digest_window_minutes for receiver_id, _ in groups)
+    open_digests = {}
+    for digest in Notification.objects.filter(
+        receiver_id__in={receiver_id for receiver_id, _ in groups},
+        notification_type__in={notification_type for _, notification_type in groups},
+        read=False,
+        payload__isnull=False,
+        created_at__gte=now - timedelta(minutes=longest_window)
+    ).order_by('created_at'):
+        if digest.created_at >= now - timedelta(minutes=preference_of(digest.receiver_id).digest_window_minutes):
+            # Ordered by date, so the newest open digest wins
+            open_digests[(digest.receiver_id, digest.notification_type)] = digest
+
+    to_update = []
+    for (receiver_id, notification_type), group in groups.items():
+        digest = open_digests.get((receiver_id, notification_type))
+        if digest is not None:
+            digest.payload = digest.payload + [notification.message for notification in group]
+            digest.message = digest_message(notification_type, len(digest.payload))
+            to_update.append(digest)
+        elif len(group) > 1:
+            to_create.append(Notification(
+                sender_id=group[0].sender_id,
+                receiver_id=receiver_id,
+                notification_type=notification_type,
+                message=digest_message(notification_type, len(group)),
+                payload=[notification.message for notification in group]
+            ))
+        else:
+            to_create.append(group[0])
+
+    return to_create, to_update
+
+
+# Cached unread counters expire after this many seconds, bounding how long a missed update can show
+UNREAD_COUNT_TTL = 300
+
+
+def unread_count_key(user_id):
+    return f'unread_notifications_{user_id}'
+
+
+def get_unread_count(user_id):
+    """
+    Unread notification count of a user. It is kept up to date by adjust_unread_counts, so the database is only
+    counted when the cache has no value (first render, expiry after UNREAD_COUNT_TTL, eviction or a cache restart).
+    """
+    count = cache.get(unread_count_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(receiver_id=user_id, read=False).count()
+        # add() so a counter created meanwhile by another process is not overwritten
+        cache.add(unread_count_key(user_id), count, UNREAD_COUNT_TTL)
+    return max(count, 0)
+
+
+def adjust_unread_counts(deltas):
+    """
+    Atomically moves the cached unread counters by {user_id: delta} once the current transaction commits.
+    Users without a cached counter are skipped, their next get_unread_count counts from the database.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    def apply():
+        for user_id, delta in deltas.items():
+            try:
+                cache.incr(unread_count_key(user_id), delta)
+            except ValueError:
+                pass
+
+    transaction.on_commit(apply)
+
+
+def count_new_notifications(notifications):
+    """Counts bulk-created notifications into the unread counters, bulk_create skips Notification.save."""
+    adjust_unread_counts(Counter(notification.receiver_id for notification in notifications if not notification.read))
+
+
+def save_notifications(notifications, batch_size=1000):
+    """bulk_create for notifications that keeps the unread counters in step."""
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    count_new_notifications(notifications)
+
+
+def mark_notifications_read(user_id, notification_ids=None):
+    """Marks the given (or all) unread notifications of a user as read in one UPDATE. Returns how many changed."""
+    notifications = Notification.objects.filter(receiver_id=user_id, read=False)
+    if notification_ids is not None:
+        notifications = notifications.filter(id__in=notification_ids)
+
+    updated = notifications.update(read=True)
+    adjust_unread_counts({user_id: -updated})
+    return updated
+
+
+def reconcile_unread_counts():
+    """
+    Resets every active user's cached unread counter from the database, fixing drift from missed updates.
+    Returns the number of counters that were wrong or missing.
+    """
+    user_ids = list(User.objects.filter(is_active=True).values_list('id', flat=True))
+    actual = Counter(dict(
+        Notification.objects.filter(read=False, receiver_id__in=user_ids)
+        .values('receiver_id').annotate(count=Count('id')).values_list('receiver_id', 'count')
+    ))
+    counts = {unread_count_key(user_id): actual[user_id] for user_id in user_ids}
+
+    cached = cache.get_many(counts.keys())
+    drifted = sum(1 for key, count in counts.items() if cached.get(key) != count)
+
+    cache.set_many(counts, UNREAD_COUNT_TTL)
+    return drifted
+
+
 def send_websocket_message(user_id, notification_id, message, read, notification_state):
+    send_websocket_messages([(user_id, notification_event(notification_id, message, read, notification_state))])
+
+
+def send_websocket_messages(messages):
+    """
+    Sends a list of (user_id, event) pairs to the users' notification groups. Sends are awaited together in
+    batches of WEBSOCKET_SEND_BATCH_SIZE inside a single event loop, instead of one async_to_sync round trip
+    (and one Redis round trip) per message.
+    """
+    messages = list(messages)
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'notifications_{user_id}',
-        {
-            'type': 'send_notification',
-            'message': message,
-            'id': notification_id,
-            'read': read,
-            'state': notification_state
-        }
-    )
+    if channel_layer is None or not messages:
+        return
+
+    batch_size = getattr(settings, 'WEBSOCKET_SEND_BATCH_SIZE', 100)
+
+    async def send_all():
+        for start in range(0, len(messages), batch_size):
+            await asyncio.gather(*(
+                channel_layer.group_send(f'notifications_{user_id}', event)
+                for user_id, event in messages[start:start + batch_size]
+            ))
+
+    async_to_sync(send_all)()
+
+
+def send_callback_reminders(kind, cb_start, cb_end, user_message, leader_message):
+    """
+    Notifies agents, and their team leaders, about CB / PR callbacks with CB_date between cb_start and cb_end.
+
+    Everything is set-based: one query for the callbacks, one for the leaders, bulk inserts for the notifications
+    (coalesced into digests per receiver), then one batched websocket push. Each (lead, show, callback hour) is only notified once per kind, so
+    overlapping runs don't double-notify. The messages are format strings with {user}, {lead} and {show}.
+    Returns the number of callbacks notified.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Serialises concurrent runs, which makes the already-sent check below race free
+        TaskLog.objects.get_or_create(task_name='callback_reminders', defaults={'last_run': now})
+        lock = TaskLog.objects.select_for_update().get(task_name='callback_reminders')
+
+        callbacks = list(LeadTerminationCode.objects.filter(
+            CB_date__range=(cb_start, cb_end),
+            flag__in=TerminationCode.objects.filter(name__in=['CB', 'PR'])
+        ).select_related('user', 'lead', 'sales_show'))
+
+        if not callbacks:
+            return 0
+
+        def slot_of(callback):
+            return callback.CB_date.replace(minute=0, second=0, microsecond=0)
+
+        slots = [slot_of(callback) for callback in callbacks]
+        already_sent = set(CallbackReminder.objects.filter(
+            kind=kind, slot__range=(min(slots), max(slots))
+        ).values_list('lead_id', 'sales_show_id', 'slot'))
+
+        leaders = dict(UserLeader.objects.filter(
+            user_id__in={callback.user_id for callback in callbacks}
+        ).values_list('user_id', 'leader_id'))
+
+        reminders = []
+        notifications = []
+        for callback, slot in zip(callbacks, slots):
+            key = (callback.lead_id, callback.sales_show_id, slot)
+            if key in already_sent:
+                continue
+            already_sent.add(key)
+
+            reminders.append(CallbackReminder(lead_id=callback.lead_id, sales_show_id=callback.sales_show_id, kind=kind, slot=slot))
+
+            context = {'user': callback.user.username, 'lead': callback.lead.name, 'show': callback.sales_show.name}
+            notifications.append(Notification(
+                sender_id=callback.user_id,
+                receiver_id=callback.user_id,
+                message=user_message.format(**context),
+                notification_type=5
+            ))
+
+            leader_id = leaders.get(callback.user_id)
+            if leader_id:
+                notifications.append(Notification(
+                    sender_id=callback.user_id,
+                    receiver_id=leader_id,
+                    message=leader_message.format(**context),
+                    notification_type=5
+                ))
+
+        # Bursts for the same receiver become one digest row
+        to_create, to_update = coalesce_notifications(notifications)
+
+        # MySQL does not return primary keys from bulk inserts, remember where the new rows start instead.
+        # Only callback reminders create type 5 notifications and they hold the lock, so the range is ours.
+        last_id = Notification.objects.filter(notification_type=5).order_by('-id').values_list('id', flat=True).first() or 0
+
+        CallbackReminder.objects.bulk_create(reminders, batch_size=1000)
+        save_notifications(to_create)
+        Notification.objects.bulk_update(to_update, ['message', 'payload'], batch_size=1000)
+
+        created = list(Notification.objects.filter(notification_type=5, id__gt=last_id))
+
+        lock.last_run = now
+        lock.save(update_fields=['last_run'])
+
+    send_websocket_messages([(notification.receiver_id, notification_push(notification)) for notification in created + to_update])
+
+    return len(reminders)
 
 
 # Clean company names before importing them to the database.
@@ -59,6 +345,42 @@ def clean_company_name(name):
     return cleaned_name
 
 
+# Legal suffix of a name key, only as a word of its own so "Zinc" or "Costco" are not keyed like "Z" or "Cost"
+NAME_KEY_SUFFIX = re.compile(r'(?:^|[\s,])(?:inc|co|ltd|llc|llp|lp|plc)\.?\s*(?:\(.+?\))?\s*$', re.IGNORECASE)
+
+
+def company_name_key(name):
+    """
+    Matching key of a company name, the same for variants like "Acme Inc.", "ACME, Inc" and "Acme":
+    the legal suffix stripped, then lowercase with punctuation and whitespace folded.
+    """
+    if name is None or (isinstance(name, float) and math.isnan(name)):
+        return ''
+    cleaned_name = NAME_KEY_SUFFIX.sub('', str(name)).lower().replace('&', ' and ')
+    return ' '.join(re.sub(r'[^\w\s]', ' ', cleaned_name).split())[:255]
+
+
+def save_with_name_key(instance, save, *args, **kwargs):
+    """
+    save() of Lead and GlobalOrganization. A new row gets the name_key of its name without a lookup; when another row
+    already has that key (a variant of the name) it is saved without one. Existing rows are keyed by backfill_company_name_keys.
+    """
+    if not instance._state.adding or instance.name_key is not None:
+        return save(*args, **kwargs)
+
+    instance.name_key = company_name_key(instance.name) or None
+    if instance.name_key is None:
+        return save(*args, **kwargs)
+
+    try:
+        # A savepoint, so the caller's transaction survives the unique key violation
+        with transaction.atomic(using=router.db_for_write(type(instance), instance=instance)):
+            return save(*args, **kwargs)
+    except IntegrityError:
+        instance.name_key = None
+        return save(*args, **kwargs)
+
+
 # Delete filtered organizations from the excel file.
 def filter_companies(name):
     # Get the filter type for phone numbers
@@ -77,6 +399,46 @@ def filter_companies(name):
     return not any(word in name_words for word in filter_words)
 
 
+def normalize_phone_number(phone_number):
+    """
+    Returns the digits-only form of a phone number, used as the lookup key for reverse phone searches.
+    North American numbers lose their leading country code '1' (same rule as ai_agent.utils.clean_phone_number),
+    so "(216) 555-1234" and "+1 216 555 1234" normalise to the same key.
+    """
+    if not phone_number:
+        return ''
+
+    digits = re.sub(r'\D', '', str(phone_number))
+
+    if len(digits) == 11 and digits.startswith('1'):
+        return digits[1:]
+
+    return digits
+
+
+# Digits a free-text search needs before it is also matched against phone numbers
+PHONE_SEARCH_MIN_DIGITS = 7
+
+
+def phone_number_lookup(query, field_prefix=''):
+    """
+    Builds a Q object matching phone numbers whose normalised digits equal or end with the query digits.
+    The suffix match is done as a prefix match on the reversed digits, a single index range that also covers exact matches.
+    `field_prefix` allows the lookup to be used across relations (e.g. 'lead__leadphonenumbers__').
+    Returns None when the query has no digits.
+    """
+    digits = normalize_phone_number(query)
+    if not digits:
+        return None
+
+    return Q(**{f'{field_prefix}normalized_reversed__startswith': digits[::-1]})
+
+
+def is_phone_search(query):
+    """Whether a free-text search query looks like a phone number, so "3M" or "Acme 2" do not match every number ending in a digit."""
+    return bool(is_valid_phone_number(query)) and len(normalize_phone_number(query)) >= PHONE_SEARCH_MIN_DIGITS
+
+
 def is_valid_phone_number(phone_number):
     # Define a regex pattern for valid phone numbers
     phone_pattern = re.compile(r'^[+\d\s\(\)-]+$')
@@ -6,8 +6,10 @@ from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import render, redirect
 from django.core.exceptions import ValidationError
 from leads.forms import UploadSheetsForm
-from .utils import has_valid_contact, is_valid_phone_number, clean_company_name, filter_companies, get_string_value, get_lead_related_data
-from .models import (Lead, Sheet, LeadContactNames, LeadEmails, LeadPhoneNumbers, Log, LeadsAverage, UserLeader, FilterWords,
+from .utils import has_valid_contact, is_valid_phone_number, clean_company_name, filter_companies, get_string_value, get_lead_related_data, send_callback_reminders, mark_notifications_read
+from .audit_log import write_log
+from .activity import record_heartbeat, record_logout
+from .models import (Lead, Sheet, LeadContactNames, LeadEmails, LeadPhoneNumbers, LeadsAverage, UserLeader, FilterWords,
                     FilterType, LeadsColors, SalesLog, LeadTerminationCode, Notification, TaskLog, TerminationCode)
 from .forms import LeadForm, AutoFillForm, FilterWordsForm #UploadFilesForm # ImportSheetsForm  # For mass importing 
 import os, logging, pandas as pd
@@ -23,6 +25,7 @@ from django.core.exceptions import PermissionDenied
 from django.db.models import Sum, Q
 from django.contrib.auth.models import User, Group
 from django.core.paginator import Paginator
+from main.pagination import KeysetPaginator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json, pytz
@@ -76,7 +79,7 @@ def login_view(request):
             group = user.groups.first()
             if group:
                 login(request, user)
-                Log.objects.create(message=f"User [{user.username}] Logged in successfully")
+                write_log(f"User [{user.username}] Logged in successfully")
                 return redirect(f"/{group.name}")
             else:
                 context['error'] = 'Oops, User has no group. Please ask the admin to add you to one.'
@@ -89,8 +92,10 @@ def login_view(request):
 
 def logout_view(request):
     username = request.user.username  # Get username before logging out
+    if request.user.is_authenticated:
+        record_logout(request.user.id)
     logout(request)
-    Log.objects.create(message=f"User [{username}] has logged out of the system")
+    write_log(f"User [{username}] has logged out of the system")
     return redirect("/login/")
 
 
@@ -537,7 +542,7 @@ def auto_fill(request):
                 response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
                 logger.info(f"[{request.user.username}] Made an AutoFill with [{num_leads_total}] total leads, [{num_leads_autofilled}] autofilled from the database.")
-                Log.objects.create(message=f"[{request.user.username}] Made an AutoFill with [{num_leads_total}] total leads, [{num_leads_autofilled}] autofilled from the database.")
+                write_log(f"[{request.user.username}] Made an AutoFill with [{num_leads_total}] total leads, [{num_leads_autofilled}] autofilled from the database.")
 
                 return response
 
@@ -715,61 +720,12 @@ def delete_filter_word(request, word_id):
     return redirect(redirect_name)  # Redirect to the same page
 
 
-@csrf_exempt
 @login_required
 @require_http_methods(["POST"])
-def log_inactivity(request):
-    try:
-        # Check if user is authenticated
-        if not request.user.is_authenticated:
-            return JsonResponse({"status": "failure", "message": "User not authenticated"}, status=401)
-        
-        user = request.user
-        
-        # Parse JSON data
-        try:
-            data = json.loads(request.body)
-            message = data.get('message', 'User inactive')
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}")
-            return JsonResponse({"status": "failure", "message": "Invalid JSON data"}, status=400)
-        except Exception as e:
-            logger.error(f"Error parsing request body: {e}")
-            return JsonResponse({"status": "failure", "message": "Error parsing request data"}, status=400)
-        
-        # Log the inactivity
-        try:
-            # Check if user is in sales or sales_team_leader for SalesLog
-            if user.groups.filter(name__in=['sales', 'sales_team_leader']).exists():
-                # Create SalesLog entry
-                SalesLog.objects.create(
-                    message=message,
-                    date=timezone.now(),
-                    user=user
-                )
-            
-            # Create general Log entry for all users
-            Log.objects.create(
-                message=f"{user.username} was inactive for 5 minutes"
-            )
-            
-            logger.info(f"Inactivity logged for user: {user.username}")
-            
-            return JsonResponse({
-                "status": "success", 
-                "message": "Inactivity logged successfully",
-                "user": user.username,
-                "timestamp": timezone.now().isoformat()
-            })
-            
-        except Exception as e:
-            logger.error(f"Database error while logging inactivity: {e}")
-            return JsonResponse({"status": "failure", "message": "Database error"}, status=500)
-            
-    except Exception as e:
-        logger.error(f"Unexpected error in log_inactivity: {e}")
-        return JsonResponse({"status": "failure", "message": "Server error"}, status=500)
-
+def heartbeat(request):
+    """Presence ping from the browser tabs, `active` when the user did something since the last one. It only touches the cache (see main.activity)."""
+    record_heartbeat(request.user.id, active=request.POST.get('active') != '0')
+    return HttpResponse(status=204)
 
 
 @user_passes_test(lambda user: is_in_group(user, "sales_team_leader") or is_in_group(user, "sales_manager"))
@@ -805,10 +761,9 @@ def sales_log_view(request):
     if start_date and end_date:
         logs = logs.filter(date__range=[start_date, end_date])
 
-    # Pagination
-    paginator = Paginator(logs, 30)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination, SalesLog never shrinks so walk it by id instead of OFFSET
+    paginator = KeysetPaginator(logs, 30, count='approximate')
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'logs': page_obj,
@@ -838,44 +793,14 @@ def send_cb_date_notifications():
     today_start = now.astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = now.astimezone().replace(hour=23, minute=59, second=59, microsecond=999999)
 
-    flags = TerminationCode.objects.filter(name__in=['CB', 'PR']).all()
-    leads_with_cb_today = LeadTerminationCode.objects.filter(CB_date__range=(today_start, today_end), flag__in=flags)
+    notified = send_callback_reminders(
+        'daily', today_start, today_end,
+        user_message="You have a call back due today for lead '{lead}' in show '{show}', Please Check your Prospect sheet",
+        leader_message="{user} has a call back due today for lead '{lead}' in show '{show}'",
+    )
 
-    if not leads_with_cb_today:
-        logger.info("No leads found with CB_date today.")
-        return  # Exit the function if no leads are found
-
-    for lead_termination in leads_with_cb_today:
-        user = lead_termination.user
-        
-        if user is None:
-            logger.warning("Lead termination has no associated user. Skipping.")
-            continue
-        
-        # Attempt to send notification to the user
-        try:
-            Notification.objects.create(
-                sender=user,
-                receiver=user,
-                message=f"You have a call back due today for lead '{lead_termination.lead.name}' in show '{lead_termination.sales_show.name}', Please Check your Prospect sheet",
-                notification_type=5
-            )
-        except Exception as e:
-            logger.error(f"Failed to create notification for user {user.username}: {e}")
-        
-        # Notify the user's leader
-        try:
-            user_leader = UserLeader.objects.get(user=user).leader
-            Notification.objects.create(
-                sender=user,
-                receiver=user_leader,
-                message=f"{user.username} has a call back due today for lead '{lead_termination.lead.name}' in show '{lead_termination.sales_show.name}'",
-                notification_type=5
-            )
-        except UserLeader.DoesNotExist:
-            logger.info(f"No leader found for user: {user.username}. Skipping notification to leader.")
-        except Exception as e:
-            logger.error(f"Failed to create notification for leader {user_leader.username}: {e}")
+    if not notified:
+        logger.info("No new call backs due today to notify about.")
 
     # Update last_run after processing all notifications
     task_log.last_run = now
@@ -885,18 +810,23 @@ def send_cb_date_notifications():
 
 @login_required
 def mark_as_read(request, notification_id):
-    from django.core.cache import cache
-
     role = request.user.groups.first().name
 
+    # Notification.save keeps the cached unread count in step
     notification = get_object_or_404(Notification, id=notification_id, receiver=request.user)
     notification.read = True
     notification.save()
     
-    # Invalidate cache for unread notifications count
-    cache_key = f'unread_notifications_{request.user.id}'
-    cache.delete(cache_key)
-    
+    return redirect(request.META.get('HTTP_REFERER', reverse(f'{role}:notifications')))
+
+
+@login_required
+def mark_all_as_read(request):
+    role = request.user.groups.first().name
+
+    if request.method == 'POST':
+        mark_notifications_read(request.user.id)
+
     return redirect(request.META.get('HTTP_REFERER', reverse(f'{role}:notifications')))
 
 
@@ -7,9 +7,10 @@ from .forms import AssignLeadsToLeaderForm
 from django.contrib.auth.decorators import user_passes_test
 from main.custom_decorators import is_in_group
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from main.pagination import KeysetPaginator
 from main.custom_decorators import is_in_group
 import logging
-from django.db.models import OuterRef, Subquery, Q, Count, Max
+from django.db.models import OuterRef, Subquery, Q, Count
 from django.utils import timezone
 from .forms import PriceRequestForm
 from django.http import HttpResponseRedirect
@@ -390,9 +391,8 @@ def ready_shows_view(request, label=None):
     ).order_by("-id")
 
     # Pagination
-    paginator = Paginator(ready_shows, 60)  # Show 30 items per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(ready_shows, 60, count='exact')
+    page_obj = paginator.get_page(request.GET)
 
     # Pass the active label, paginated queryset, and search query to the template
     context = {
@@ -424,9 +424,8 @@ def done_ready_shows(request, label=None):
     done_shows = done_shows.order_by("-id")
 
     # Pagination
-    paginator = Paginator(done_shows, 60)  # Show 30 items per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(done_shows, 60, count='approximate')
+    page_obj = paginator.get_page(request.GET)
 
     # Pass the active label, paginated queryset, and search query to the template
     context = {
@@ -457,13 +456,9 @@ def unassigned_sales_shows(request, label='EHUB'):
     unassigned_shows = unassigned_shows.order_by("-id")
     labels = ['EHUB', 'EHUB2', 'EP', 'UK', 'Asia', 'Europe']
 
-    # Pagination
-    paginator = Paginator(unassigned_shows, 60)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Prefetch related leads and sheet data for just the current page
-    page_shows = list(page_obj.object_list.prefetch_related('leads', 'sheet'))
+    # Pagination, prefetching related leads and sheet data for just the current page
+    paginator = KeysetPaginator(unassigned_shows.prefetch_related('leads', 'sheet'), 60, count='exact')
+    page_obj = paginator.get_page(request.GET)
 
     # Only calculate timezone counts for labels where it applies
     timezone_counts = {}
@@ -542,9 +537,8 @@ def unassigned_x_sales_shows(request, label='EHUB'):
     unassigned_shows = unassigned_shows.order_by("-id")
 
     # Pagination
-    paginator = Paginator(unassigned_shows, 60)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(unassigned_shows, 60, count='exact')
+    page_obj = paginator.get_page(request.GET)
     
     # Get show IDs for the current page
     show_ids = [show.id for show in page_obj]
@@ -628,10 +622,9 @@ def assigned_sales_shows(request, label='EHUB'):
         Q(name__icontains=search_query) | Q(Agent__username__icontains=search_query)
     ).order_by("is_done", "-id")
 
-    # Pagination
-    page_number = request.GET.get('page', 1)  # Get the page number from the request, default to 1
-    paginator = Paginator(assigned_shows, 60)
-    page_obj = paginator.get_page(page_number)
+    # Pagination, pending shows first and newest first within each group
+    paginator = KeysetPaginator(assigned_shows, 60, ordering=('is_done', '-id'), count='approximate')
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'assigned_shows': page_obj,  # Pass the paginated shows to the template
@@ -699,9 +692,8 @@ def price_requests_view(request):
     price_requests_list = PriceRequest.objects.all().order_by("-id")
     
     # Set up pagination
-    paginator = Paginator(price_requests_list, 20)  # Show 10 requests per page
-    page_number = request.GET.get('page')
-    price_requests = paginator.get_page(page_number)
+    paginator = KeysetPaginator(price_requests_list, 20, count='exact')
+    price_requests = paginator.get_page(request.GET)
 
     context = {
         'price_requests': price_requests,
@@ -733,48 +725,27 @@ def manage_referrals(request):
     # Get search query
     search_query = request.GET.get('search', '').strip()
     
-    # Get the latest referral for each (lead, sheet) combination using subquery
-    # This is much more efficient than loading everything into memory
-    latest_referrals = Referral.objects.filter(
-        lead__isnull=False,
-        sheet__isnull=False
-    ).values('lead', 'sheet').annotate(
-        latest_date=Max('entry_date')
-    )
-    
-    # Get the actual referral objects that match these latest dates
+    # Latest referral for each (lead, sheet) pair, picked per row by an indexed subquery so that
+    # filtering, ordering and pagination all stay in the database
+    latest_in_group = Referral.objects.filter(
+        lead=OuterRef('lead'), sheet=OuterRef('sheet')
+    ).order_by('-entry_date', '-id').values('id')[:1]
+
     referrals_list = Referral.objects.filter(
         lead__isnull=False,
-        sheet__isnull=False
-    ).filter(
-        Q(lead__in=[r['lead'] for r in latest_referrals]) &
-        Q(sheet__in=[r['sheet'] for r in latest_referrals])
-    ).select_related('lead', 'sheet')  # Optimize foreign key queries
-    
-    # Further filter to ensure we only get the latest per combination
-    unique_refs = {}
-    for ref in referrals_list:
-        key = (ref.lead.id, ref.sheet.id)
-        if key not in unique_refs or ref.entry_date > unique_refs[key].entry_date:
-            unique_refs[key] = ref
-    
-    referrals_list = list(unique_refs.values())
-    
+        sheet__isnull=False,
+        id=Subquery(latest_in_group)
+    ).select_related('lead', 'sheet')
+
     # Apply search filter
     if search_query:
-        referrals_list = [
-            r for r in referrals_list 
-            if search_query.lower() in r.lead.name.lower() or 
-               search_query.lower() in r.sheet.name.lower()
-        ]
-    
-    # Sort by entry date descending
-    referrals_list.sort(key=lambda x: x.entry_date, reverse=True)
-    
-    # Paginate
-    paginator = Paginator(referrals_list, 30)
-    page_number = request.GET.get('page')
-    referrals = paginator.get_page(page_number)
+        referrals_list = referrals_list.filter(
+            Q(lead__name__icontains=search_query) | Q(sheet__name__icontains=search_query)
+        )
+
+    # Paginate, newest first
+    paginator = KeysetPaginator(referrals_list, 30, ordering=('-entry_date', '-id'), count='approximate')
+    referrals = paginator.get_page(request.GET)
 
     return render(request, 'operations_manager/manage_referrals.html', {
         'referrals': referrals,
@@ -789,17 +760,9 @@ def notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    # Implement pagination
-    page = request.GET.get('page', '')
-    # Show 10 notifications per page
-    paginator = Paginator(notifications_for_user, 20)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 20, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, 'operations_manager/notifications.html', {
         'notifications': notifications_page
@@ -917,7 +880,6 @@ def reassign_sales_show(request):
 
 def reassigned_sales_shows(request):
     search_term = request.GET.get("search", "")
-    page_number = request.GET.get("page", 1)
 
     # Filter only reassigned and unassigned shows
     shows_qs = SalesShow.objects.filter(
@@ -930,8 +892,8 @@ def reassigned_sales_shows(request):
 
     shows_qs = shows_qs.order_by("-id")  # Recent first
 
-    paginator = Paginator(shows_qs, 20)  # Show 10 per page
-    unassigned_shows = paginator.get_page(page_number)
+    paginator = KeysetPaginator(shows_qs, 20, count='exact')
+    unassigned_shows = paginator.get_page(request.GET)
 
     context = {
         "unassigned_shows": unassigned_shows,
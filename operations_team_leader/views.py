@@ -1,8 +1,9 @@
-from main.models import Lead, LeadContactNames, LeadEmails, LeadPhoneNumbers, Notification, Sheet, Acceptance, LeadsAverage, ReadyShow, Log, FilterWords, FilterType, LeadsColors
+from main.models import Lead, LeadContactNames, LeadEmails, LeadPhoneNumbers, Notification, Sheet, Acceptance, LeadsAverage, ReadyShow, FilterWords, FilterType, LeadsColors
 from django.shortcuts import render, redirect, get_object_or_404, reverse
 from django.contrib.auth.decorators import user_passes_test
 from main.custom_decorators import is_in_group
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from main.pagination import KeysetPaginator
 import pandas as pd
 import logging, os
 from django.core.exceptions import ObjectDoesNotExist
@@ -12,6 +13,7 @@ from django.http import HttpResponseRedirect
 from urllib.parse import unquote
 from django.db.models import OuterRef, Subquery
 from main.utils import clean_company_name, filter_companies, get_string_value, has_valid_contact, is_valid_phone_number, send_websocket_message, NOTIFICATIONS_STATES
+from main.audit_log import write_log
 from collections import defaultdict
 from django.db import transaction
 from django.contrib import messages
@@ -67,17 +69,9 @@ def notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    # Implement pagination
-    page = request.GET.get('page', '')
-    # Show 10 notifications per page
-    paginator = Paginator(notifications_for_user, 50)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 50, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, TL + '/notifications.html', {
         'notifications': notifications_page
@@ -194,7 +188,7 @@ def accept_upload_notification(request, notification_id):
 
         # Add a log entry
         logger.info(f"{request.user.username} accepted uploads with {new_leads_count} new leads.")
-        Log.objects.create(message=f"{request.user.username} accepted uploads with {new_leads_count} new leads.")
+        write_log(f"{request.user.username} accepted uploads with {new_leads_count} new leads.")
 
         return render(request, template_name, {"notification": notification})
 
@@ -1,7 +1,7 @@
 from django.urls import path, re_path
 from .views import (agent_assigned_shows, index, show_detail, view_done_recycled_shows, sales_notifications,
                     view_done_shows, view_recycled_shows, view_saved_leads) # search is not needed at the moment
-from main.views import mark_as_read
+from main.views import mark_as_read, mark_all_as_read
 
 app_name = "sales"
 
@@ -23,4 +23,5 @@ urlpatterns = [
 #     path("search/", search, name="search")
      path('notifications/', sales_notifications, name='notifications'),
      path('notifications/<int:notification_id>/mark-as-read/', mark_as_read, name='mark_as_read'),
+     path('notifications/mark-all-as-read/', mark_all_as_read, name='mark_all_as_read'),
 ]
@@ -3,14 +3,17 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import User
 from main.models import (LeadContactNames, LeadEmails, LeadPhoneNumbers, LeadTerminationCode,
-    LeadTerminationHistory, SalesShow, TerminationCode, Lead, LeadsColors, SalesLog, IncomingsCount, Notification, FlagsCount)
+    LeadTerminationHistory, SalesShow, TerminationCode, Lead, LeadsColors, IncomingsCount, Notification, FlagsCount)
 from django.utils import timezone
 from .forms import *
 from django.db.models import Count, Sum
 from datetime import datetime
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from main.pagination import KeysetPaginator
 import logging
 from main.custom_decorators import is_in_group
+from main.utils import phone_number_lookup, is_phone_search
+from main.audit_log import write_sales_log
 
 
 logger = logging.getLogger('custom')
@@ -282,20 +285,12 @@ def show_detail(request, show_id, recycle=""):
                     show.is_done_rec = True
                     show.done_rec_date = timezone.now()
                     show.save()
-                    SalesLog.objects.create(
-                        message=f"Show {show.name} is marked done from recycle",
-                        date=timezone.now(),
-                        user=request.user
-                    )
+                    write_sales_log(request.user, f"Show {show.name} is marked done from recycle")
                 else:
                     show.is_done = True
                     show.done_date = timezone.now()
                     show.save()
-                    SalesLog.objects.create(
-                        message=f"Show {show.name} is marked done",
-                        date=timezone.now(),
-                        user=request.user
-                    )
+                    write_sales_log(request.user, f"Show {show.name} is marked done")
                 return redirect(f'{role}:assigned-shows')
             else:
                 error_message = "You Haven't Finished Dialing The Sheet !!"
@@ -347,12 +342,14 @@ def view_saved_leads(request, code_id=None):
     search_query = request.GET.get('search_query', '')
     if search_query:
         from django.db.models import Q
-        leads = leads.filter(
-            Q(lead__name__icontains=search_query) | 
-            Q(lead__leadphonenumbers__value__icontains=search_query) |
+        search_filter = (
+            Q(lead__name__icontains=search_query) |
             Q(sales_show__name__icontains=search_query) |
             Q(lead__leadcontactnames__value__icontains=search_query)
-        ).distinct()
+        )
+        if is_phone_search(search_query):
+            search_filter |= phone_number_lookup(search_query, field_prefix='lead__leadphonenumbers__')
+        leads = leads.filter(search_filter).distinct()
 
 
     # Fetch potential target users (Team Leaders and Sales Managers)
@@ -578,15 +575,9 @@ def sales_notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    page = request.GET.get('page', '')
-    paginator = Paginator(notifications_for_user, 10)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 10, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, 'sales/notifications.html', {
         'notifications': notifications_page
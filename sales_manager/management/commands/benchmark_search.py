@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import transaction
+from main.models import Lead, Sheet, SalesShow, LeadPhoneNumbers
+from sales_manager.utils import search_leads_with_shows, SalesShowLead
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = 'Times sales_manager search (count + first and deep page) and fails if any case exceeds the threshold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold-ms', type=float, default=200.0, help='Maximum allowed time per search in milliseconds')
+        parser.add_argument('--runs', type=int, default=5, help='Number of timed runs per case')
+        parser.add_argument('--lead-name', default='a', help='Query used for the lead_name case')
+        parser.add_argument('--phone', default='1234', help='Query used for the phone_number case')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Generate this many synthetic leads before timing (rolled back afterwards)')
+        parser.add_argument('--leads-per-show', type=int, default=40, help='Leads per synthetic show when seeding')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'], options['leads_per_show'])
+
+            failures = self.run_cases(options)
+
+            # Never keep synthetic data around
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} search case(s) exceeded {options['threshold_ms']} ms: {', '.join(failures)}")
+
+        self.stdout.write(self.style.SUCCESS(f"All search cases ran under {options['threshold_ms']} ms."))
+
+    def run_cases(self, options):
+        cases = [
+            ('lead_name', options['lead_name']),
+            ('phone_number', options['phone']),
+        ]
+        failures = []
+
+        for search_by, query in cases:
+            for label, page_number in [('first page', 1), ('last page', 'last')]:
+                timings = []
+                for _ in range(options['runs']):
+                    start = time.perf_counter()
+                    paginator = Paginator(search_leads_with_shows(query, search_by), 20)
+                    page = paginator.get_page(page_number)
+                    rows = [(pair.lead, pair.salesshow) for pair in page.object_list]
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                worst = max(timings)
+                summary = (f"{search_by}={query!r} {label}: {paginator.count} matches, {len(rows)} rows, "
+                           f"median {statistics.median(timings):.1f} ms, worst {worst:.1f} ms")
+
+                if worst > options['threshold_ms']:
+                    failures.append(f"{search_by} {label}")
+                    self.stdout.write(self.style.ERROR(summary))
+                else:
+                    self.stdout.write(self.style.SUCCESS(summary))
+
+        return failures
+
+    def seed(self, lead_count, leads_per_show):
+        self.stdout.write(self.style.NOTICE(f'Seeding {lead_count} synthetic leads...'))
+
+        agent = User.objects.create(username='benchmark_search_agent')
+        sheet = Sheet.objects.create(name='benchmark_search_sheet', user=agent, is_approved=True)
+
+        Lead.objects.bulk_create(
+            [Lead(name=f'Benchmark Search Lead {i}') for i in range(lead_count)],
+            batch_size=5000
+        )
+        # MySQL does not return primary keys from bulk inserts, so read the leads back
+        leads = list(Lead.objects.filter(name__startswith='Benchmark Search Lead ').order_by('id'))
+
+        # bulk_create skips LeadPhoneNumbers.save(), so fill the lookup columns here
+        phones = []
+        for i, lead in enumerate(leads):
+            value = f'({200 + i % 700}) 555-{i % 10000:04d}'
+            digits = f'{200 + i % 700}555{i % 10000:04d}'
+            phones.append(LeadPhoneNumbers(lead=lead, sheet=sheet, value=value,
+                                           normalized_value=digits, normalized_reversed=digits[::-1]))
+        LeadPhoneNumbers.objects.bulk_create(phones, batch_size=5000)
+
+        pairs = []
+        for offset in range(0, len(leads), leads_per_show):
+            show = SalesShow.objects.create(Agent=agent, name=f'Benchmark Search Show {offset // leads_per_show}', sheet=sheet)
+            pairs.extend(SalesShowLead(salesshow=show, lead=lead) for lead in leads[offset:offset + leads_per_show])
+        SalesShowLead.objects.bulk_create(pairs, batch_size=5000)
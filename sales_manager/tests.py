@@ -1,3 +1,39 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from main.models import Lead, LeadPhoneNumbers, SalesShow, Sheet
+from .utils import search_leads_with_shows, lead_and_show
+
+
+class SearchLeadsWithShowsTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create(username='agent')
+        self.sheet, other_sheet = Sheet.objects.create(name='Sheet'), Sheet.objects.create(name='Other')
+        self.lead = Lead.objects.create(name='Acme')
+        LeadPhoneNumbers.objects.create(lead=self.lead, sheet=self.sheet, value='(216) 555-1234')
+        LeadPhoneNumbers.objects.create(lead=self.lead, sheet=self.sheet, value='216 555 1234 ext')
+        self.show = SalesShow.objects.create(name='Show', sheet=self.sheet, Agent=agent)
+        other_show = SalesShow.objects.create(name='Other show', sheet=other_sheet, Agent=agent)
+        self.show.leads.add(self.lead)
+        other_show.leads.add(self.lead)
+
+    def test_phone_search_only_returns_shows_of_the_numbers_sheet(self):
+        pairs = search_leads_with_shows('555-1234', 'phone_number')
+        self.assertEqual([lead_and_show(pair) for pair in pairs], [(self.lead, self.show)])
+
+    def test_phone_search_keeps_leads_without_a_matching_show(self):
+        lead = Lead.objects.create(name='Beta')
+        LeadPhoneNumbers.objects.create(lead=lead, sheet=self.sheet, value='310 555 9876')
+        for name in ('First', 'Second'):
+            show = SalesShow.objects.create(name=name, sheet=Sheet.objects.create(name=name), Agent=self.show.Agent)
+            show.leads.add(lead)
+
+        pairs = search_leads_with_shows('310-555-9876', 'phone_number')
+        self.assertEqual([lead_and_show(pair) for pair in pairs], [(lead, None)])
+
+    def test_lead_name_search_returns_every_show(self):
+        pairs = search_leads_with_shows('acm', 'lead_name')
+        self.assertEqual([lead_and_show(pair)[1] is not None for pair in pairs], [True, True])
+
+    def test_query_without_digits_finds_nothing(self):
+        self.assertFalse(search_leads_with_shows('Acme', 'phone_number').exists())
@@ -5,7 +5,7 @@ from .views import (assign_sales_to_leader, index, manage_sales_teams, view_team
     view_teams_shows, view_teams_shows_recycled, lead_history_view, leads_inventory, search)
 from sales.views import (agent_assigned_shows, show_detail, view_done_recycled_shows,
     view_done_shows, view_recycled_shows, view_saved_leads)
-from main.views import lead_details, sales_log_view, mark_as_read
+from main.views import lead_details, sales_log_view, mark_as_read, mark_all_as_read
 from operations_manager.views import manage_referrals
 
 
@@ -46,4 +46,5 @@ urlpatterns = [
     path('manage-referrals/', manage_referrals, name='manage-referrals'),
     path('notifications/', sales_manager_notifications, name='notifications'),
     path('notifications/<int:notification_id>/mark-as-read/', mark_as_read, name='mark_as_read'),
+    path('notifications/mark-all-as-read/', mark_all_as_read, name='mark_all_as_read'),
 ]
\ No newline at end of file
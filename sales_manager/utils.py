@@ -0,0 +1,42 @@
+from django.db.models import Exists, Min, OuterRef, Q
+from main.models import LeadPhoneNumbers, SalesShow
+from main.utils import phone_number_lookup
+
+
+# Each row of the SalesShow.leads through table is one (lead, show) pair
+SalesShowLead = SalesShow.leads.through
+
+
+def search_leads_with_shows(query, search_by):
+    """
+    Returns a queryset of (lead, show) pairs for assigned shows, as rows of the SalesShow.leads through table.
+    Everything (filtering, ordering, counting and slicing) runs in the database, so it can be handed
+    straight to a Paginator. See lead_and_show for the pair of a row.
+    """
+    pairs = SalesShowLead.objects.filter(salesshow__Agent__isnull=False)
+
+    if search_by == 'lead_name':
+        pairs = pairs.filter(lead__name__icontains=query)
+
+    elif search_by == 'phone_number':
+        phone_filter = phone_number_lookup(query)
+        if phone_filter is None:
+            return SalesShowLead.objects.none()
+
+        # Only the shows of the sheet the matching number came from
+        numbers = LeadPhoneNumbers.objects.filter(phone_filter)
+        pairs = pairs.filter(lead_id__in=numbers.values('lead_id')).annotate(
+            show_matches=Exists(numbers.filter(lead_id=OuterRef('lead_id'), sheet_id=OuterRef('salesshow__sheet_id')))
+        )
+
+        # A lead none of whose shows matches is still listed once, with no show
+        matched_leads = pairs.filter(show_matches=True).values('lead_id')
+        first_pairs = pairs.exclude(lead_id__in=matched_leads).values('lead_id').annotate(first_id=Min('id')).values('first_id')
+        pairs = pairs.filter(Q(show_matches=True) | Q(id__in=first_pairs))
+
+    return pairs.select_related('lead', 'salesshow', 'salesshow__Agent').order_by('lead_id', 'salesshow_id')
+
+
+def lead_and_show(pair):
+    """The (lead, show) of a search_leads_with_shows row, show is None for a lead without a matching show"""
+    return pair.lead, pair.salesshow if getattr(pair, 'show_matches', True) else None
@@ -2,10 +2,12 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.models import Group, User
 from django.contrib import messages
 from main.custom_decorators import is_in_group
+from sales_manager.utils import search_leads_with_shows, lead_and_show
 from main.models import (LeadEmails, LeadContactNames, LeadPhoneNumbers, SalesTeams, TerminationCode, UserLeader,
                         LeadTerminationCode, SalesShow, LeadTerminationHistory, Lead, Notification, IncomingsCount, FlagsCount)
-from django.db.models import Count, Sum, OuterRef, Subquery, Prefetch
+from django.db.models import Count, Sum, OuterRef, Subquery
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from main.pagination import KeysetPaginator
 from django.contrib.auth.decorators import user_passes_test, login_required
 from sales_manager.forms import AssignSalesToLeaderForm
 from datetime import datetime
@@ -292,9 +294,6 @@ def search(request):
             'search_by': search_by,
         })
 
-    leads_with_shows = []
-    shows_queryset = None
-
     # --- Case 1: Search by show name (only shows, no leads) ---
     if search_by == 'show_name' and query:
         shows_queryset = SalesShow.objects.filter(
@@ -315,66 +314,11 @@ def search(request):
         return render(request, template_path, context)
 
     # --- Case 2: Lead-based search (lead_name or phone_number) ---
-    leads_queryset = Lead.objects.filter(sales_shows__Agent__isnull=False)
-
-    if query and search_by:
-        if search_by == 'lead_name':
-            leads_queryset = leads_queryset.filter(name__icontains=query)
-
-            leads_queryset = leads_queryset.prefetch_related(
-                Prefetch(
-                    'sales_shows',
-                    queryset=SalesShow.objects.filter(Agent__isnull=False).select_related('Agent'),
-                    to_attr='filtered_sales_shows'
-                )
-            ).distinct()
-
-            for lead in leads_queryset:
-                for show in lead.filtered_sales_shows:
-                    leads_with_shows.append((lead, show))
-
-        elif search_by == 'phone_number':
-            phone_entries = LeadPhoneNumbers.objects.filter(value__icontains=query).values('lead_id', 'sheet_id')
-            lead_ids = [entry['lead_id'] for entry in phone_entries]
-            sheet_ids = [entry['sheet_id'] for entry in phone_entries]
-
-            leads_queryset = leads_queryset.filter(id__in=lead_ids)
-
-            leads_queryset = leads_queryset.prefetch_related(
-                Prefetch(
-                    'sales_shows',
-                    queryset=SalesShow.objects.filter(Agent__isnull=False).select_related('Agent'),
-                    to_attr='all_sales_shows'
-                )
-            ).distinct()
-
-            for lead in leads_queryset:
-                matching_shows = [
-                    show for show in lead.all_sales_shows
-                    if show.sheet_id in sheet_ids and lead.id in show.leads.values_list('id', flat=True)
-                ]
-                if matching_shows:
-                    for show in matching_shows:
-                        leads_with_shows.append((lead, show))
-                else:
-                    leads_with_shows.append((lead, None))
-        else:
-            leads_queryset = leads_queryset.prefetch_related(
-                Prefetch(
-                    'sales_shows',
-                    queryset=SalesShow.objects.filter(Agent__isnull=False).select_related('Agent'),
-                    to_attr='filtered_sales_shows'
-                )
-            ).distinct()
-
-            for lead in leads_queryset:
-                for show in lead.filtered_sales_shows:
-                    leads_with_shows.append((lead, show))
-
-    # --- Pagination ---
-    paginator = Paginator(leads_with_shows, 20)
+    # A single query over the show/lead pairs, paginated and counted in the database
+    paginator = Paginator(search_leads_with_shows(query, search_by), 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = [lead_and_show(pair) for pair in page_obj.object_list]
 
     context = {
         'shows_only': False,
@@ -392,16 +336,9 @@ def sales_manager_notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    # Implement pagination (e.g., 50 notifications per page)
-    page = request.GET.get('page', '')
-    paginator = Paginator(notifications_for_user, 10)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 10, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, 'sales_manager/notifications.html', {
         'notifications': notifications_page
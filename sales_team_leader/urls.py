@@ -3,7 +3,7 @@ from .views import (view_team_member_recycled, index, view_team_member, view_tea
                     view_team_shows, sales_team_leader_notifications)
 from sales.views import (agent_assigned_shows, show_detail, view_done_recycled_shows,
     view_done_shows, view_recycled_shows, view_saved_leads)
-from main.views import sales_log_view, mark_as_read
+from main.views import sales_log_view, mark_as_read, mark_all_as_read
 from sales_manager.views import search
 
 app_name="sales_team_leader"
@@ -34,4 +34,5 @@ urlpatterns = [
     path('sales-log/', sales_log_view, name='sales-logs'),
     path('notifications/', sales_team_leader_notifications, name='notifications'),
     path('notifications/<int:notification_id>/mark-as-read/', mark_as_read, name='mark_as_read'),
+    path('notifications/mark-all-as-read/', mark_all_as_read, name='mark_all_as_read'),
 ]
\ No newline at end of file
@@ -2,6 +2,7 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.contrib.auth.models import User
 from main.custom_decorators import is_in_group
+from main.utils import phone_number_lookup, is_phone_search
 from main.models import (LeadContactNames, LeadEmails, LeadPhoneNumbers, LeadTerminationCode, IncomingsCount,
                         LeadTerminationHistory, SalesShow, SalesTeams, TerminationCode, UserLeader, Lead, Notification,
                         FlagsCount)
@@ -11,6 +12,7 @@ from django.http import HttpResponseBadRequest
 from django.utils import timezone
 from datetime import datetime
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from main.pagination import KeysetPaginator
 
 
 @user_passes_test(lambda user: is_in_group(user, "sales_team_leader"))
@@ -185,12 +187,14 @@ def view_team_prospect(request, code_id=None, leader_id=None):
     search_query = request.GET.get('search_query', '')
     if search_query:
         from django.db.models import Q
-        leads = leads.filter(
-            Q(lead__name__icontains=search_query) | 
-            Q(lead__leadphonenumbers__value__icontains=search_query) |
+        search_filter = (
+            Q(lead__name__icontains=search_query) |
             Q(sales_show__name__icontains=search_query) |
             Q(lead__leadcontactnames__value__icontains=search_query)
-        ).distinct()
+        )
+        if is_phone_search(search_query):
+            search_filter |= phone_number_lookup(search_query, field_prefix='lead__leadphonenumbers__')
+        leads = leads.filter(search_filter).distinct()
     
     # Fetch potential target users (Team Leaders and Sales Managers)
     target_users = User.objects.filter(groups__name__in=['sales_team_leader', 'sales_manager']).distinct()
@@ -434,15 +438,9 @@ def sales_team_leader_notifications(request):
     notifications_for_user = Notification.objects.filter(
         receiver=user).order_by('-created_at')
 
-    page = request.GET.get('page', '')
-    paginator = Paginator(notifications_for_user, 10)
-
-    try:
-        notifications_page = paginator.page(page)
-    except PageNotAnInteger:
-        notifications_page = paginator.page(1)
-    except EmptyPage:
-        notifications_page = paginator.page(paginator.num_pages)
+    # Keyset pagination, deep pages cost the same as the first one
+    paginator = KeysetPaginator(notifications_for_user, 10, ordering=('-created_at', '-id'))
+    notifications_page = paginator.get_page(request.GET)
 
     return render(request, 'sales_team_leader/notifications.html', {
         'notifications': notifications_page